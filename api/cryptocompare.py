@@ -79,7 +79,15 @@ class CryptoCompare:
             .format (id=id, currency=CryptoCompare.currency, markets=self.id_as_list (CryptoCompare.markets))
         return self.query (command)['RAW']
 
-    def get_historical_prices (self, id, to, interval):
+    #
+    # Return historical prices
+    #
+    # @param id       Coin id
+    # @param to       Timestamp of the latest requested entry
+    # @param interval Interval of the entries
+    # @param limit    Number of requested entries ('None' for the configured limit)
+    #
+    def get_historical_prices (self, id, to, interval, limit=None):
 
         assert isinstance (to, Timestamp)
         assert isinstance (id, str)
@@ -88,7 +96,7 @@ class CryptoCompare:
         command = 'https://min-api.cryptocompare.com/data/histo{interval}'.format (interval=interval.name)
         command += '?fsym={id}'.format (id=id)
         command += '&tsym=USD&markets={markets}'.format (markets=self.id_as_list (CryptoCompare.markets))
-        command += '&limit={limit}'.format (limit=CryptoCompare.limit)
+        command += '&limit={limit}'.format (limit=limit if limit is not None else CryptoCompare.limit)
         command += '&toTs={timestamp}'.format (timestamp=to.epoch ())
         command = command.format (interval=interval.name, id=id, markets=self.id_as_list (CryptoCompare.markets))
 
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+#
+# bench_database.py - Database write/read throughput benchmark
+#
+# Frank Blankenburg, Jun. 2017
+#
+# Usage: python3 -m benchmark.bench_database [-s 10000,100000,1000000]
+#
+
+import argparse
+import os
+import tempfile
+import time
+
+from datetime import timedelta
+
+from core.common import Interval
+from core.config import Configuration
+from core.time import Timestamp
+from scraper.scraper import Scraper
+from scraper.scraper import ScraperRegistry
+
+from database.database import Channel
+from database.database import Database
+from database.database import Entry
+
+
+#--------------------------------------------------------------------------
+# Scraper providing the benchmark channel
+#
+class BenchmarkScraper (Scraper):
+
+    ID = 'Benchmark'
+
+    def __init__ (self):
+        super ().__init__ (BenchmarkScraper.ID)
+
+    def get_channels (self):
+        return [Channel (id='{scraper}::FLT'.format (scraper=BenchmarkScraper.ID),
+                         description='Benchmark channel', type_id=float)]
+
+    def run (self, database, start, end, interval, log):
+        pass
+
+
+#
+# Create the given number of entries in sampling interval distance
+#
+def create_entries (size):
+
+    start = Timestamp ('2012-01-01').epoch ()
+    step = int (Configuration.DATABASE_SAMPLING_STEP.total_seconds ())
+
+    return [Entry (timestamp=Timestamp (start + n * step), value=float (n)) for n in range (size)]
+
+#
+# Former write path: one DELETE and one INSERT statement per entry into a table
+# without timestamp key
+#
+def legacy_add (database, id, entries):
+
+    for entry in entries:
+
+        command = 'DELETE FROM "{channel}"'.format (channel=id)
+        command += ' WHERE timestamp="{timestamp}"'.format (timestamp=entry.timestamp.epoch ())
+        database.cursor.execute (command)
+
+        command = 'INSERT INTO "{channel}" '.format (channel=id)
+        command += '(timestamp, value) '
+        command += 'values (?, ?)'
+
+        database.cursor.execute (command, [entry.timestamp.epoch (), entry.value])
+
+    database.connection.commit ()
+
+#
+# Measure a single write run and return the rows/s rate
+#
+def measure (size, legacy, engine, partition=None):
+
+    with tempfile.TemporaryDirectory () as directory:
+
+        database = Database (os.path.join (directory, 'benchmark.db'), engine=engine, partition=partition)
+        id = BenchmarkScraper.ID + '::FLT'
+
+        if legacy:
+            id = BenchmarkScraper.ID + '::LEGACY'
+            database.cursor.execute ('CREATE TABLE "{id}" (timestamp LONG NOT NULL, value REAL)'.format (id=id))
+
+        entries = create_entries (size)
+
+        start = time.perf_counter ()
+
+        if legacy:
+            legacy_add (database, id, entries)
+        else:
+            database.add (id, entries)
+
+        duration = time.perf_counter () - start
+        database.connection.close ()
+
+    return size / duration
+
+
+#--------------------------------------------------------------------------
+# MAIN
+#
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser ()
+
+    parser.add_argument ('-s', '--sizes', type=str, default='10000,100000,1000000', help='Comma separated number of rows')
+    parser.add_argument ('-l', '--legacy-limit', type=int, default=10000, help='Largest size the legacy path is measured for')
+    parser.add_argument ('-e', '--engine', type=str, default=Database.ENGINE_SQLITE, help='Storage engine for float channels')
+    parser.add_argument ('-p', '--partition', type=str, default=None, choices=['month', 'year'], help='Partition interval of the channel tables')
+
+    args = parser.parse_args ()
+
+    Configuration.DATABASE_SAMPLING_INTERVAL = Interval.minute
+    Configuration.DATABASE_SAMPLING_STEP = timedelta (minutes=1)
+
+    ScraperRegistry.scrapers = {}
+    ScraperRegistry.register (BenchmarkScraper ())
+
+    print ('{0:>10} {1:>16} {2:>16}'.format ('rows', 'before [rows/s]', 'after [rows/s]'))
+
+    for size in [int (size) for size in args.sizes.split (',')]:
+        before = '{0:.0f}'.format (measure (size, True, Database.ENGINE_SQLITE)) if size <= args.legacy_limit else '-'
+        after = '{0:.0f}'.format (measure (size, False, args.engine, Interval[args.partition] if args.partition is not None else None))
+
+        print ('{0:>10} {1:>16} {2:>16}'.format (size, before, after))
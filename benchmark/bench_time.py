@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+#
+# bench_time.py - Timestamp micro benchmarks
+#
+# Frank Blankenburg, Jul. 2017
+#
+# Usage: python3 -m benchmark.bench_time [-n 100000]
+#
+
+import argparse
+import dateutil.parser
+import time
+
+from datetime import timedelta
+
+from core.common import Interval
+from core.config import Configuration
+from core.time import Timestamp
+from core.time import parse_many
+
+
+#
+# Measure the rate of a function applied to each element of a list
+#
+# @return Operations per second
+#
+def measure (function, values):
+
+    start = time.perf_counter ()
+
+    for value in values:
+        function (value)
+
+    return len (values) / (time.perf_counter () - start)
+
+
+#--------------------------------------------------------------------------
+# MAIN
+#
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser ()
+
+    parser.add_argument ('-n', '--number', type=int, default=100000, help='Number of operations per measurement')
+
+    args = parser.parse_args ()
+
+    Configuration.DATABASE_SAMPLING_INTERVAL = Interval.minute
+    Configuration.DATABASE_SAMPLING_STEP = timedelta (minutes=1)
+
+    start = Timestamp ('2012-01-01').epoch ()
+    step = int (Configuration.DATABASE_SAMPLING_STEP.total_seconds ())
+
+    epochs = [start + n * step for n in range (args.number)]
+    timestamps = [Timestamp (epoch) for epoch in epochs]
+    datetimes = [timestamp.timestamp for timestamp in timestamps]
+    lookup = set (timestamps[::2])
+
+    results = []
+
+    results.append (('construction (int)', measure (Timestamp, epochs)))
+    results.append (('construction (datetime)', measure (Timestamp, datetimes)))
+    results.append (('copy', measure (lambda timestamp: timestamp.copy (), timestamps)))
+    results.append (('hash', measure (hash, timestamps)))
+    results.append (('set membership', measure (lambda timestamp: timestamp in lookup, timestamps)))
+    results.append (('advance', measure (lambda timestamp: timestamp.advance (step=Configuration.DATABASE_SAMPLING_STEP), timestamps)))
+    results.append (('epoch', measure (lambda timestamp: timestamp.epoch (), timestamps)))
+
+    #
+    # Parsing of distinct strings, so the memo cache is not hit
+    #
+    iso = [timestamp.to_string ('%Y-%m-%d %H:%M:%S') for timestamp in timestamps]
+    twitter = [timestamp.to_string ('%a %b %d %H:%M:%S +0000 %Y') for timestamp in timestamps]
+    rfc822 = [timestamp.to_string ('%a, %d %b %Y %H:%M:%S GMT') for timestamp in timestamps]
+
+    results.append (('parse (ISO)', measure (Timestamp, iso)))
+    results.append (('parse (Twitter)', measure (Timestamp, twitter)))
+    results.append (('parse (RFC822)', measure (Timestamp, rfc822)))
+    results.append (('parse (dateutil)', measure (lambda text: dateutil.parser.parse (text), iso)))
+    results.append (('parse (cached)', measure (Timestamp, iso[:1000] * (len (iso) // 1000))))
+    results.append (('parse_many (ISO)', measure (parse_many, [iso]) * len (iso)))
+
+    print ('{0:<24} {1:>16}'.format ('operation', 'rate [ops/s]'))
+
+    for name, rate in results:
+        print ('{0:<24} {1:>16.0f}'.format (name, rate))
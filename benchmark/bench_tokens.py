@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+#
+# bench_tokens.py - Storage size and scan throughput of token encoded text channels
+#
+# Frank Blankenburg, Jul. 2017
+#
+# Usage: python3 -m benchmark.bench_tokens [-s 100000] [-v 20000]
+#
+
+import argparse
+import json
+import numpy as np
+import os
+import tempfile
+import time
+
+from core.config import Configuration
+from core.time import Timestamp
+from scraper.scraper import Scraper
+from scraper.scraper import ScraperRegistry
+
+from database.database import Channel
+from database.database import Database
+from database.database import Entry
+
+
+#--------------------------------------------------------------------------
+# Scraper providing a plain and a token encoded text channel
+#
+class BenchmarkScraper (Scraper):
+
+    ID = 'Benchmark'
+
+    def __init__ (self):
+        super ().__init__ (BenchmarkScraper.ID)
+
+    def get_channels (self):
+        return [Channel (id='{scraper}::TEXT'.format (scraper=BenchmarkScraper.ID),
+                         description='Plain text channel', type_id=str),
+                Channel (id='{scraper}::TOKENS'.format (scraper=BenchmarkScraper.ID),
+                         description='Token encoded channel', type_id=str, encoding=Channel.ENCODING_TOKENS)]
+
+    def run (self, database, start, end, interval, log):
+        pass
+
+
+#
+# Create synthetic tweets with zipf distributed tokens
+#
+def create_entries (size, vocabulary):
+
+    random = np.random.default_rng (0)
+
+    words = ['token{0}'.format (n) for n in range (vocabulary)]
+    lengths = random.integers (5, 25, size=size)
+    ids = np.minimum (random.zipf (1.3, size=int (lengths.sum ())), vocabulary) - 1
+
+    start = Timestamp ('2017-01-01').epoch ()
+    step = int (Configuration.DATABASE_SAMPLING_STEP.total_seconds ())
+
+    entries = []
+    position = 0
+
+    for n, length in enumerate (lengths.tolist ()):
+        entries.append (Entry (timestamp=Timestamp (start + n * step),
+                               value=json.dumps ([words[id] for id in ids[position:position + length].tolist ()])))
+        position += length
+
+    return entries
+
+#
+# Return the size of the table of a channel in bytes
+#
+def get_size (database, id):
+    return database.cursor.execute ('SELECT SUM (pgsize) FROM dbstat WHERE name=?', (id,)).fetchone ()[0]
+
+#
+# Measure the duration of a full scan of a channel
+#
+def measure (function):
+
+    start = time.perf_counter ()
+    function ()
+
+    return time.perf_counter () - start
+
+
+#--------------------------------------------------------------------------
+# MAIN
+#
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser ()
+
+    parser.add_argument ('-s', '--size', type=int, default=100000, help='Number of entries')
+    parser.add_argument ('-v', '--vocabulary', type=int, default=20000, help='Number of distinct tokens')
+
+    args = parser.parse_args ()
+
+    ScraperRegistry.scrapers = {}
+    ScraperRegistry.register (BenchmarkScraper ())
+
+    entries = create_entries (args.size, args.vocabulary)
+
+    with tempfile.TemporaryDirectory () as directory:
+
+        results = []
+
+        for id in ['Benchmark::TEXT', 'Benchmark::TOKENS']:
+
+            database = Database (os.path.join (directory, id.replace (':', '_') + '.db'))
+            database.add (id, entries)
+
+            size = get_size (database, id)
+
+            #
+            # Entry scans are returning JSON strings which still have to be parsed, token
+            # scans are returning the token lists directly
+            #
+            results.append ((id, 'entries', size, measure (lambda: [chunk for chunk in database.iter (id)])))
+            results.append ((id, 'entries + json', size, measure (lambda: [[json.loads (entry.value) for entry in chunk]
+                                                                           for chunk in database.iter (id)])))
+            results.append ((id, 'tokens', size, measure (lambda: [chunk for chunk in database.iter (id, tokens=True)])))
+
+            database.close ()
+
+        print ('{0:<20} {1:<16} {2:>12} {3:>10}'.format ('channel', 'read path', 'size [MB]', 'scan [s]'))
+
+        for id, name, size, duration in results:
+            print ('{0:<20} {1:<16} {2:>12.1f} {3:>10.2f}'.format (id, name, size / 1e6, duration))
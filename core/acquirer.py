@@ -6,13 +6,55 @@
 #
 
 import argparse
+import collections
+import concurrent.futures
+import queue
+import random
 import scraper
+import signal
+import threading
+import time
 
 from core.time import Timestamp
 from core.config import Configuration
 from database.database import Database
 from scraper.scraper import ScraperRegistry
 
+#
+# Database access for scrapers running in worker threads
+#
+# The database connection must only be used by the thread which created it. So each
+# method call is passed to that thread, which executes it and returns the result. This
+# way, all writes are done by a single writer. Generators like the one returned by
+# 'iter' cannot be used via the proxy.
+#
+class DatabaseProxy:
+
+    #
+    # Constructor
+    #
+    # @param database Database to be accessed
+    # @param calls    Queue the method calls are passed to the database thread with
+    #
+    def __init__ (self, database, calls):
+        self.database = database
+        self.calls = calls
+
+    def __getattr__ (self, name):
+
+        attribute = getattr (self.database, name)
+
+        if not callable (attribute):
+            return attribute
+
+        def call (*args, **kwargs):
+            future = concurrent.futures.Future ()
+            self.calls.put ((future, attribute, args, kwargs))
+            return future.result ()
+
+        return call
+
+
 #
 # This class is controlling the whole data acquisition. Its task is to trigger the registered
 # scrapers to fill the database for a specified time frame with as much data as they can
@@ -20,14 +62,25 @@ from scraper.scraper import ScraperRegistry
 #
 class Acquirer:
 
-    def __init__ (self):
-        pass
+    #
+    # Constructor
+    #
+    # @param merge_distance Data holes which are less than this timedelta apart are fetched
+    #                       in a single scraper run ('None' for the configured distance)
+    # @param max_workers    Maximum number of scraper parts running concurrently ('None'
+    #                       for the sum of the scraper limits)
+    #
+    def __init__ (self, merge_distance=None, max_workers=None):
+        self.merge_distance = merge_distance if merge_distance is not None else Configuration.ACQUIRER_MERGE_DISTANCE
+        self.max_workers = max_workers
 
     #
     # Run scraping process
     #
     # This function will try to fill the database as complete as possible
     #
+    # @return List of changes written to the database during the run
+    #
     def run (self, database, start=Timestamp (Configuration.DATABASE_START_DATE), end=Timestamp (), log=None):
 
         assert isinstance (start, Timestamp)
@@ -40,46 +93,213 @@ class Acquirer:
 
         add_to_log ('Starting database acquistion')
 
+        sequence = database.get_sequence ()
+        intervals = []
+
         for source in ScraperRegistry.get_all ():
             #
-            # Query database for all points in time this scraper (or any other filling the
-            # same database slots) already got data for. Afterwards, the set of timestamps
-            # will contain entries for all points in time where the scraper provided
-            # complete data. If any id has missing content, we assume to be a data hole there
-            # because the scraper might only be able to retrieve the data in a block for all
-            # ids.
+            # Query the coverage bitmaps for all points in time this scraper (or any other
+            # filling the same database slots) did not get complete data for yet. If any id
+            # has missing content, we assume to be a data hole there because the scraper
+            # might only be able to retrieve the data in a block for all ids.
             #
-            timestamps = None
-
             add_to_log ('  Processing scraper \'{id}\''.format (id=source.id))
 
-            for channel in source.get_channels ():
-                entries = database.get (channel.id)
+            gaps = database.get_gaps ([channel.id for channel in source.get_channels ()], start, end, self.merge_distance)
+
+            #
+            # The scraper is run for each interval which is still in need of data, so
+            # complete data is not fetched again.
+            #
+            intervals.append ((source, gaps))
+
+        return self.execute (database, sequence, intervals, add_to_log)
+
+    #
+    # Run incremental scraping process
+    #
+    # In contrast to 'run', only the tail of each scraper's data is fetched: The scraper is
+    # run from the latest stored entry of its channels on until 'end'. The latest slot is
+    # fetched again because it might have been incomplete when it was stored. Scrapers
+    # without any data yet start at the configured start date.
+    #
+    # @param database Database to be filled
+    # @param end      End of the acquired time interval ('None' for the current time)
+    # @param log      Logging function
+    # @return List of changes written to the database during the run
+    #
+    def run_tail (self, database, end=None, log=None):
+
+        end = end if end is not None else Timestamp ()
+        assert isinstance (end, Timestamp)
+
+        def add_to_log (text):
+            if log is not None:
+                log (text)
+
+        add_to_log ('Starting incremental database acquistion until \'{end}\''.format (end=end))
+
+        sequence = database.get_sequence ()
+        intervals = []
+
+        for source in ScraperRegistry.get_all ():
 
-                if timestamps is None:
-                    timestamps = set ([entry.timestamp for entry in entries])
-                else:
-                    timestamps &= set ([entry.timestamp for entry in entries])
+            ends = [database.get_statistics (channel.id).end for channel in source.get_channels ()]
 
+            if ends and None not in ends:
+                start = min (ends)
+            else:
+                start = Timestamp (Configuration.DATABASE_START_DATE)
+
+            if start <= end:
+                add_to_log ('  Processing scraper \'{id}\''.format (id=source.id))
+                intervals.append ((source, [(start, end)]))
+
+        return self.execute (database, sequence, intervals, add_to_log)
+
+    #
+    # Run continuous scraping process
+    #
+    # The scrapers are run via 'run_tail' directly and then each time a sampling step
+    # boundary is passed. The wake up is delayed by a random jitter, so that multiple
+    # acquirers do not hit the data sources at the same time. Ticks missed because a run
+    # took longer than a step are not replayed: the next run starts at the latest stored
+    # entries anyway and covers them. Errors of a single run are logged only.
+    #
+    # @param database Database to be filled
+    # @param stop     'threading.Event' ending the acquisition after the running cycle
+    # @param jitter   Maximum wake up delay as timedelta ('None' for the configured delay)
+    # @param log      Logging function
+    #
+    def run_daemon (self, database, stop, jitter=None, log=None):
+
+        def add_to_log (text):
+            if log is not None:
+                log (text)
+
+        step = int (Configuration.DATABASE_SAMPLING_STEP.total_seconds ())
+        jitter = (jitter if jitter is not None else Configuration.ACQUIRER_JITTER).total_seconds ()
+        tick = None
+
+        while not stop.is_set ():
+
+            try:
+                self.run_tail (database, log=log)
+            except Exception as e:
+                add_to_log ('ERROR: {error}'.format (error=e))
+
+            now = time.time ()
+            boundary = (int (now) // step + 1) * step
+
+            if tick is not None and boundary - tick > step:
+                add_to_log ('  Missed {count} ticks, catching up'.format (count=(boundary - tick) // step - 1))
+
+            tick = boundary
+            stop.wait (boundary - now + random.uniform (0, jitter))
+
+        add_to_log ('Stopped database acquisition')
+
+    #
+    # Execute scrapers for the given time intervals
+    #
+    # The scrapers and their parts are run concurrently in a thread pool, limited by the
+    # 'MAX_WORKERS' attribute of each scraper. Scrapers without 'RANGE_QUERIES' are run
+    # once over the enclosing interval of their gaps. The database is accessed by the
+    # calling thread only.
+    #
+    # @param database   Database to be filled
+    # @param sequence   Database sequence number before the run
+    # @param intervals  List of (scraper, [(start, end), ...]) tuples
+    # @param add_to_log Logging function
+    # @return List of changes written to the database since 'sequence'
+    #
+    def execute (self, database, sequence, intervals, add_to_log):
+
+        calls = queue.Queue ()
+        lanes = []
+        errors = []
+
+        for source, gaps in intervals:
             #
-            # Compute interval (first missing and last missing entry) which is still
-            # in need of data
+            # The tasks of a scraper are processed by up to 'MAX_WORKERS' lanes
             #
-            source_start = start
-            source_end = end
+            tasks = collections.deque ()
+
+            if gaps and not source.RANGE_QUERIES:
+                gaps = [(gaps[0][0], gaps[-1][1])]
+
+            for source_start, source_end in gaps:
 
-            while source_start < source_end and source_start in timestamps:
-                source_start.advance (step=+Configuration.DATABASE_SAMPLING_STEP)
+                add_to_log ('    Scraping in time interval \'{start}\' to \'{end}\''
+                            .format (start=source_start, end=source_end))
 
-            while source_end > source_start and source_end in timestamps:
-                source_end.advance (step=-Configuration.DATABASE_SAMPLING_STEP)
+                for part in source.get_parts ():
+                    tasks.append ((source, part, source_start, source_end))
 
-            add_to_log ('    Scraping in time interval \'{start}\' to \'{end}\''
-                        .format (start=source_start, end=source_end))
+            lanes += [tasks] * min (source.MAX_WORKERS, len (tasks))
 
-            if source_start != source_end or source_start not in timestamps:
-                source.run (database, source_start, source_end, Configuration.DATABASE_SAMPLING_INTERVAL,
-                            lambda text: add_to_log ('    {0}: {1}'.format (source.id, text)))
+        proxy = DatabaseProxy (database, calls)
+
+        def log_from_worker (source, text):
+            calls.put ((None, add_to_log, ('    {0}: {1}'.format (source.id, text),), {}))
+
+        def run_lane (tasks):
+            while True:
+                try:
+                    source, part, source_start, source_end = tasks.popleft ()
+                except IndexError:
+                    return
+
+                part (proxy, source_start, source_end, Configuration.DATABASE_SAMPLING_INTERVAL,
+                      lambda text: log_from_worker (source, text))
+
+        if lanes:
+            with concurrent.futures.ThreadPoolExecutor (max_workers=min (len (lanes), self.max_workers or len (lanes))) as executor:
+
+                futures = [executor.submit (run_lane, lane) for lane in lanes]
+
+                for future in futures:
+                    future.add_done_callback (lambda future: calls.put (None))
+
+                #
+                # Execute the database calls of the workers until all lanes are finished. The
+                # calls of a lane are queued before its finishing marker.
+                #
+                running = len (futures)
+
+                while running > 0:
+                    call = calls.get ()
+
+                    if call is None:
+                        running -= 1
+                        continue
+
+                    result, function, args, kwargs = call
+
+                    try:
+                        value = function (*args, **kwargs)
+                        if result is not None:
+                            result.set_result (value)
+
+                    except Exception as e:
+                        if result is not None:
+                            result.set_exception (e)
+                        else:
+                            errors.append (e)
+
+            for future in futures:
+                future.result ()
+
+        if errors:
+            raise errors[0]
+
+        changes = database.changes_since (sequence)
+
+        for change in changes:
+            add_to_log ('  Updated \'{id}\' with {count} entries in \'{start}\' to \'{end}\''
+                        .format (id=change.id, count=change.count, start=change.start, end=change.end))
+
+        return changes
 
 
 #----------------------------------------------------------------------------
@@ -92,13 +312,28 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser ()
 
     parser.add_argument ('-p', '--password', type=str, default=None, help='Passwort for database encryption')
+    parser.add_argument ('-w', '--wal', action='store_true', default=False, help='Use WAL mode to allow concurrent readers')
+    parser.add_argument ('-m', '--merge', type=int, default=None, help='Number of sampling steps data holes are merged within')
+    parser.add_argument ('-d', '--daemon', action='store_true', default=False, help='Keep on acquiring the latest data each sampling step')
     parser.add_argument ('database', type=str, default=':memory:', help='Database file')
 
     args = parser.parse_args ()
 
-    database = Database (args.database, args.password)
-    if args.database == ':memory:':
-        database.create ()
+    database = Database (args.database, args.password, wal=args.wal)
+
+    acquirer = Acquirer (Configuration.DATABASE_SAMPLING_STEP * args.merge if args.merge is not None else None)
+
+    if args.daemon:
+        #
+        # The running cycle is finished and the database is closed properly on termination
+        #
+        stop = threading.Event ()
+
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            signal.signal (signum, lambda signum, frame: stop.set ())
+
+        acquirer.run_daemon (database, stop, log=lambda text: print (text))
+        database.close ()
 
-    acquirer = Acquirer ()
-    acquirer.run (database, log=lambda text: print (text))
+    else:
+        acquirer.run (database, log=lambda text: print (text))
@@ -16,6 +16,16 @@ class Interval (Enum):
     day    = 1
     hour   = 2
     minute = 3
+    week   = 4
+    month  = 5
+    year   = 6
+
+#
+# Enumeration for the sort order of query results
+#
+class Order (Enum):
+    ascending  = 1
+    descending = 2
 
 #
 # Print pandas frame with title line
@@ -16,6 +16,17 @@ class Configuration:
     #
     DATABASE_START_DATE = '2012-1-1'
 
+    #
+    # Data holes which are less than this distance apart are fetched in a single scraper
+    # run together with the complete data in between instead of separately
+    #
+    ACQUIRER_MERGE_DISTANCE = timedelta (days=1)
+
+    #
+    # Maximum random delay of the continuous acquisition after each sampling step boundary
+    #
+    ACQUIRER_JITTER = timedelta (seconds=10)
+
     #
     # Database sampling interval
     #
@@ -18,29 +18,49 @@ from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 #----------------------------------------------------------------------------
 # Encryption/decryption
 #
+# Deriving the key from a password is expensive by design, so the resulting Fernet
+# instances are kept per password until 'clear' is called.
+#
 class Encryption:
 
     SALT_SEED = 'jfhjs784Hjlonbc23'
 
+    def __init__ (self):
+        self.fernets = {}
+
     #
     # Encrypt text
     #
     def encrypt (self, text, password):
-        f = cryptography.fernet.Fernet (self.get_key (password))
-        return f.encrypt (text.encode ()).decode ()
+        return self.get_fernet (password).encrypt (text.encode ()).decode ()
 
     #
     # Decrypt text
     #
     def decrypt (self, text, password):
         try:
-            f = cryptography.fernet.Fernet (self.get_key (password))
-            result = f.decrypt (text.encode ()).decode ()
+            result = self.get_fernet (password).decrypt (text.encode ()).decode ()
         except cryptography.fernet.InvalidToken:
             result = None
 
         return result
 
+    #
+    # Return Fernet instance for a password, deriving the key on first use only
+    #
+    def get_fernet (self, password):
+
+        if password not in self.fernets:
+            self.fernets[password] = cryptography.fernet.Fernet (self.get_key (password))
+
+        return self.fernets[password]
+
+    #
+    # Drop all derived keys
+    #
+    def clear (self):
+        self.fernets = {}
+
     #
     # Generate encryption/decryption key from password and salt
     #
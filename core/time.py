@@ -5,9 +5,12 @@
 # Frank Blankenburg, Jun. 2017
 #
 
-import copy
 import dateutil.parser
+import functools
+import numpy as np
 import pandas as pd
+import re
+import time
 
 from core.config import Configuration
 from core.common import Interval
@@ -17,11 +20,25 @@ from datetime import timedelta
 #--------------------------------------------------------------------------
 # CLASS core.time.Timestamp
 #
-# Timestamp representing object. The resolution is one hour and the internal
-# timezone offset is always UTC.
+# Timestamp representing object. The resolution is the database sampling interval and
+# the internal timezone offset is always UTC.
+#
+# The timestamp is kept as integer UNIX epoch seconds which are floored to the sampling
+# interval on construction, so comparing, hashing and advancing are plain integer
+# operations. Naive datetime values are interpreted as UTC.
 #
 class Timestamp:
 
+    __slots__ = ['seconds']
+
+    #
+    # Length of the supported sampling intervals in seconds
+    #
+    INTERVALS = {Interval.day: 24 * 60 * 60, Interval.hour: 60 * 60, Interval.minute: 60}
+
+    EPOCH = datetime (1970, 1, 1)
+    SECOND = timedelta (seconds=1)
+
     #
     # Create timestamp from generic input value
     #
@@ -31,30 +48,52 @@ class Timestamp:
     #
     def __init__ (self, value=None):
 
-        if value is None:
-            self.timestamp = datetime.utcnow ()
-        elif isinstance (value, int):
-            self.timestamp = datetime.fromtimestamp (value)
+        if isinstance (value, int):
+            seconds = value
+        elif value is None:
+            seconds = int (time.time ())
         elif isinstance (value, float):
-            self.timestamp = datetime.fromtimestamp (int (round (value)))
+            seconds = int (round (value))
         elif isinstance (value, str):
-            self.timestamp = dateutil.parser.parse (value)
+            seconds = parse (value)
         elif isinstance (value, datetime):
-            self.timestamp = value
+            seconds = Timestamp.to_seconds (value)
         elif isinstance (value, Timestamp):
-            self.timestamp = value.timestamp
+            seconds = value.seconds
         else:
             raise RuntimeError ('Unhandled time format type \'{typename}\''. format (typename=type (value).__name__))
 
-        if Configuration.DATABASE_SAMPLING_INTERVAL is Interval.day:
-            self.timestamp = self.timestamp.replace (hour=0, minute=0, second=0, microsecond=0)
-        elif Configuration.DATABASE_SAMPLING_INTERVAL is Interval.hour:
-            self.timestamp = self.timestamp.replace (minute=0, second=0, microsecond=0)
-        elif Configuration.DATABASE_SAMPLING_INTERVAL is Interval.minute:
-            self.timestamp = self.timestamp.replace (second=0, microsecond=0)
-        else:
+        self.seconds = seconds - seconds % Timestamp.get_interval ()
+
+    #
+    # Return the length of the database sampling interval in seconds
+    #
+    @staticmethod
+    def get_interval ():
+
+        try:
+            return Timestamp.INTERVALS[Configuration.DATABASE_SAMPLING_INTERVAL]
+        except KeyError:
             raise RuntimeError ('Unhandled sampling interval')
 
+    #
+    # Convert datetime into UNIX epoch seconds
+    #
+    @staticmethod
+    def to_seconds (value):
+
+        if value.tzinfo is not None:
+            return int (value.timestamp () // 1)
+
+        return (value - Timestamp.EPOCH) // Timestamp.SECOND
+
+    #
+    # Timestamp as (naive, UTC) datetime object
+    #
+    @property
+    def timestamp (self):
+        return Timestamp.EPOCH + timedelta (seconds=self.seconds)
+
     #
     # Advance time by some days / hours
     #
@@ -62,33 +101,29 @@ class Timestamp:
 
         if step is not None:
             assert isinstance (step, timedelta)
-            self.timestamp += step
+            self.seconds += step.days * 24 * 60 * 60 + step.seconds
 
         if days is not None:
-            delta = timedelta (days=abs (days))
-            if days >= 0:
-                self.timestamp += delta
-            else:
-                self.timestamp -= delta
+            self.seconds += days * 24 * 60 * 60
 
         if hours is not None:
-            delta = timedelta (hours=abs (hours))
-            if hours >= 0:
-                self.timestamp += delta
-            else:
-                self.timestamp -= delta
+            self.seconds += hours * 60 * 60
 
     #
-    # Create deep copy of this object
+    # Create copy of this object
     #
     def copy (self):
-        return copy.deepcopy (self)
+
+        copy = Timestamp.__new__ (Timestamp)
+        copy.seconds = self.seconds
+
+        return copy
 
     #
     # Return timestamp in UNIX epoch seconds
     #
     def epoch (self):
-        return int (round (self.timestamp.timestamp ()))
+        return self.seconds
 
     #
     # Return current time (in UTC)
@@ -110,32 +145,32 @@ class Timestamp:
 
     def __add__ (self, other):
         assert isinstance (other, timedelta)
-        return Timestamp (self.timestamp + other)
+        return Timestamp (self.seconds + other.days * 24 * 60 * 60 + other.seconds)
 
     def __sub__ (self, other):
         assert isinstance (other, Timestamp)
-        return self.timestamp - other.timestamp
+        return timedelta (seconds=self.seconds - other.seconds)
 
     def __lt__ (self, other):
-        return self.timestamp < other.timestamp
+        return self.seconds < other.seconds
 
     def __le__ (self, other):
-        return self.timestamp <= other.timestamp
+        return self.seconds <= other.seconds
 
     def __eq__ (self, other):
-        return self.timestamp == other.timestamp
+        return isinstance (other, Timestamp) and self.seconds == other.seconds
 
     def __ne__ (self, other):
-        return self.timestamp != other.timestamp
+        return not self.__eq__ (other)
 
     def __ge__ (self, other):
-        return self.timestamp >= other.timestamp
+        return self.seconds >= other.seconds
 
     def __gt__ (self, other):
-        return self.timestamp > other.timestamp
+        return self.seconds > other.seconds
 
     def __hash__ (self):
-        return int (round (self.timestamp.timestamp ()))
+        return self.seconds
 
     def __repr__ (self):
         if Configuration.DATABASE_SAMPLING_INTERVAL is Interval.day:
@@ -146,3 +181,276 @@ class Timestamp:
             return self.timestamp.strftime ('%Y-%m-%d %H:%M')
 
         raise RuntimeError ('Unhandled sampling interval')
+
+
+#--------------------------------------------------------------------------
+# CLASS core.time.TimestampArray
+#
+# Sorted set of timestamps kept as an int64 array of UNIX epoch seconds, so that grid
+# generation and set operations are running as numpy operations instead of loops over
+# single 'Timestamp' objects.
+#
+class TimestampArray:
+
+    #
+    # Create array from generic input values
+    #
+    # @param values Iterable of 'Timestamp' objects, epoch seconds or a numpy array of
+    #               integer epoch seconds or 'datetime64' values. The values are sorted
+    #               and duplicates are removed.
+    #
+    def __init__ (self, values=()):
+
+        if isinstance (values, TimestampArray):
+            self.epochs = values.epochs
+            return
+
+        if not isinstance (values, np.ndarray):
+            values = [value.epoch () if isinstance (value, Timestamp) else value for value in values]
+
+        values = np.asarray (values)
+
+        if values.dtype.kind == 'M':
+            values = values.astype ('datetime64[s]').astype (np.int64)
+
+        self.epochs = np.unique (values.astype (np.int64))
+
+    #
+    # Create array from already sorted and unique epoch seconds without copying
+    #
+    @staticmethod
+    def from_sorted (epochs):
+
+        array = TimestampArray.__new__ (TimestampArray)
+        array.epochs = epochs
+
+        return array
+
+    #
+    # Create grid of timestamps
+    #
+    # @param start First timestamp of the grid
+    # @param end   Last timestamp of the grid (inclusive)
+    # @param step  Grid step as timedelta ('None' for the database sampling step)
+    #
+    @staticmethod
+    def range (start, end, step=None):
+
+        step = TimestampArray.get_seconds (step)
+        return TimestampArray.from_sorted (np.arange (start.epoch (), end.epoch () + 1, step, dtype=np.int64))
+
+    #
+    # Return step in seconds
+    #
+    # @param step Step as timedelta ('None' for the database sampling step)
+    #
+    @staticmethod
+    def get_seconds (step):
+
+        seconds = int ((step if step is not None else Configuration.DATABASE_SAMPLING_STEP).total_seconds ())
+        assert seconds > 0
+
+        return seconds
+
+    #
+    # Return array with the timestamps floored to a sampling interval
+    #
+    # @param interval Interval to floor to ('None' for the database sampling interval)
+    #
+    def floor (self, interval=None):
+
+        try:
+            seconds = Timestamp.INTERVALS[interval if interval is not None else Configuration.DATABASE_SAMPLING_INTERVAL]
+        except KeyError:
+            raise RuntimeError ('Unhandled sampling interval')
+
+        return TimestampArray.from_sorted (np.unique (self.epochs - self.epochs % seconds))
+
+    #
+    # Check which timestamps are part of the array
+    #
+    # @param values Single 'Timestamp' or 'TimestampArray'
+    # @return Boolean for a single timestamp, boolean mask for an array
+    #
+    def contains (self, values):
+
+        if isinstance (values, Timestamp):
+            return values in self
+
+        return np.isin (values.epochs, self.epochs, assume_unique=True)
+
+    def intersection (self, other):
+        return TimestampArray.from_sorted (np.intersect1d (self.epochs, other.epochs, assume_unique=True))
+
+    def difference (self, other):
+        return TimestampArray.from_sorted (np.setdiff1d (self.epochs, other.epochs, assume_unique=True))
+
+    def union (self, other):
+        return TimestampArray.from_sorted (np.union1d (self.epochs, other.epochs))
+
+    #
+    # Return the runs of contiguous timestamps
+    #
+    # @param step Distance of two successive timestamps within a run ('None' for the
+    #             database sampling step)
+    # @return List of (first, last) timestamp tuples of the runs
+    #
+    def runs (self, step=None):
+
+        if len (self.epochs) == 0:
+            return []
+
+        breaks = np.flatnonzero (np.diff (self.epochs) != TimestampArray.get_seconds (step))
+
+        starts = self.epochs[np.concatenate (([0], breaks + 1))]
+        ends = self.epochs[np.concatenate ((breaks, [len (self.epochs) - 1]))]
+
+        return [(Timestamp (start), Timestamp (end)) for start, end in zip (starts.tolist (), ends.tolist ())]
+
+    #
+    # Return timestamps as numpy 'datetime64' array
+    #
+    def to_datetime64 (self):
+        return self.epochs.astype ('datetime64[s]')
+
+    def __len__ (self):
+        return len (self.epochs)
+
+    def __iter__ (self):
+        return (Timestamp (epoch) for epoch in self.epochs.tolist ())
+
+    def __getitem__ (self, index):
+
+        if isinstance (index, slice):
+            return TimestampArray.from_sorted (self.epochs[index])
+
+        return Timestamp (int (self.epochs[index]))
+
+    def __contains__ (self, timestamp):
+
+        index = int (np.searchsorted (self.epochs, timestamp.epoch ()))
+        return index < len (self.epochs) and int (self.epochs[index]) == timestamp.epoch ()
+
+    def __eq__ (self, other):
+        return isinstance (other, TimestampArray) and np.array_equal (self.epochs, other.epochs)
+
+    def __repr__ (self):
+        return 'TimestampArray ({timestamps})'.format (timestamps=list (self))
+
+
+#--------------------------------------------------------------------------
+# Time string parsing
+#
+# The time formats delivered by the data sources (ISO dates, Twitter 'created_at' and
+# RFC822 dates of RSS feeds) are matched by precompiled expressions first. All other
+# strings are passed to 'dateutil', which is flexible but slow.
+#
+
+#
+# Maximum number of parsed strings kept in the memo cache
+#
+PARSE_CACHE_SIZE = 16384
+
+MONTHS = {month: number + 1 for number, month in enumerate (['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                                             'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])}
+
+ISO_FORMAT = re.compile (r'(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2})(?:\.\d*)?)?)? ?(Z|[+-]\d{2}:?\d{2})?$')
+TWITTER_FORMAT = re.compile (r'[A-Z][a-z]{2} ([A-Z][a-z]{2}) (\d{1,2}) (\d{2}):(\d{2}):(\d{2}) ([+-]\d{4}) (\d{4})$')
+RFC822_FORMAT = re.compile (r'(?:[A-Z][a-z]{2}, )?(\d{1,2}) ([A-Z][a-z]{2}) (\d{4}) (\d{2}):(\d{2})(?::(\d{2}))? (GMT|UTC?|Z|[+-]\d{4})$')
+
+#
+# Complete ISO dates without time zone which numpy converts exactly like 'parse'
+#
+NUMPY_FORMAT = re.compile (r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?$')
+
+#
+# Return the offset of a time zone designator in seconds
+#
+def to_offset (text):
+
+    if text is None or text in ['Z', 'GMT', 'UT', 'UTC']:
+        return 0
+
+    text = text.replace (':', '')
+    offset = int (text[1:3]) * 60 * 60 + int (text[3:5]) * 60
+
+    return -offset if text[0] == '-' else offset
+
+#
+# Return the UNIX epoch seconds of a UTC date
+#
+def to_epoch (year, month, day, hour, minute, second):
+    return (datetime (int (year), int (month), int (day), int (hour or 0), int (minute or 0), int (second or 0)) - Timestamp.EPOCH) \
+        // Timestamp.SECOND
+
+def parse_iso (match):
+    year, month, day, hour, minute, second, zone = match.groups ()
+    return to_epoch (year, month, day, hour, minute, second) - to_offset (zone)
+
+def parse_twitter (match):
+    month, day, hour, minute, second, zone, year = match.groups ()
+    return to_epoch (year, MONTHS[month], day, hour, minute, second) - to_offset (zone)
+
+def parse_rfc822 (match):
+    day, month, year, hour, minute, second, zone = match.groups ()
+    return to_epoch (year, MONTHS[month], day, hour, minute, second) - to_offset (zone)
+
+#
+# Fast path parsers as (expression, conversion function) tuples
+#
+PARSERS = [(ISO_FORMAT, parse_iso), (TWITTER_FORMAT, parse_twitter), (RFC822_FORMAT, parse_rfc822)]
+
+#
+# Convert time string into UNIX epoch seconds
+#
+# Strings without time zone are interpreted as UTC. The results of recently parsed
+# strings are memoized.
+#
+# @param text Time string
+# @return Epoch seconds (not floored to the sampling interval)
+#
+@functools.lru_cache (maxsize=PARSE_CACHE_SIZE)
+def parse (text):
+
+    for expression, function in PARSERS:
+        match = expression.match (text)
+
+        if match is not None:
+            try:
+                return function (match)
+
+            #
+            # Matching strings with invalid field values are left to 'dateutil'
+            #
+            except (ValueError, KeyError):
+                break
+
+    return Timestamp.to_seconds (dateutil.parser.parse (text))
+
+#
+# Convert sequence of time strings into UNIX epoch seconds
+#
+# Sequences of complete ISO dates without time zone are converted by numpy as a whole.
+# All other sequences, for example with partial dates like '2017-06' which numpy would
+# complete differently, are parsed string by string.
+#
+# @param texts Sequence of time strings like a column of a CSV file
+# @return Epoch seconds as int64 array
+#
+def parse_many (texts):
+
+    texts = [str (text) for text in texts]
+
+    if not texts:
+        return np.zeros (0, dtype=np.int64)
+
+    #
+    # Invalid field values like '2017-02-30' are left to 'parse' for its error handling
+    #
+    if all ([NUMPY_FORMAT.match (text) for text in texts]):
+        try:
+            return np.array (texts, dtype='datetime64[s]').astype (np.int64)
+        except ValueError:
+            pass
+
+    return np.array ([parse (text) for text in texts], dtype=np.int64)
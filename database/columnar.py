@@ -0,0 +1,413 @@
+#!/usr/bin/python3
+#
+# columnar.py - Memory mapped columnar storage engine
+#
+# Frank Blankenburg, Jul. 2017
+#
+
+import numpy as np
+import os
+import urllib.parse
+
+from core.common import Order
+from database.engine import Engine
+
+
+#--------------------------------------------------------------------------
+# Storage engine keeping each float channel in a pair of memory mapped column files
+#
+# For each channel, the epochs and the values are stored in two flat binary files of
+# 64 bit integers / floats. The epoch file is always kept sorted and serves as the
+# index of the channel: time range lookups are binary searches in the mapped epochs.
+#
+# The committed state of each channel - the generation of its column files and the
+# number of valid samples - is kept in a SQLite table which is written within the
+# transaction of the database write. Everything behind the committed sample count,
+# like the remains of an interrupted or rolled back write, is ignored and overwritten
+# by the next append.
+#
+# Writes following the latest sample are appended behind the committed samples. Late or
+# overwriting writes are merged into the existing content and the merged columns are
+# written into the files of a new generation. The files of the former generation are
+# removed after the commit. So committed file content is never modified, truncated or
+# replaced while it might be mapped, and arrays returned by former reads are staying
+# valid.
+#
+class ColumnarEngine (Engine):
+
+    EPOCH_TYPE = np.dtype ('<i8')
+    VALUE_TYPE = np.dtype ('<f8')
+
+    COLUMN_TYPES = {'epoch': EPOCH_TYPE, 'value': VALUE_TYPE}
+
+    #
+    # Constructor
+    #
+    # @param database  Database the engine is storing the channel content for
+    # @param directory Directory containing the column files
+    # @param table     Id of the table containing the committed channel states
+    #
+    def __init__ (self, database, directory, table):
+
+        super ().__init__ (database)
+
+        self.directory = directory
+        self.table = table
+        self.maps = {}
+
+        #
+        # Column files created and replaced within the running transaction and files of
+        # former generations which could not be removed yet
+        #
+        self.created = []
+        self.replaced = []
+        self.obsolete = []
+
+        os.makedirs (directory, exist_ok=True)
+
+    #
+    # Return file name of a channel column
+    #
+    # @param channel    Channel the column belongs to
+    # @param column     Column name ('epoch' or 'value')
+    # @param generation Generation of the column files
+    #
+    def get_file (self, channel, column, generation):
+
+        name = urllib.parse.quote (channel.id, safe='')
+
+        #
+        # The quoted channel id cannot contain a '@', so the generation suffix is unique
+        #
+        if generation > 0:
+            name += '@{generation}'.format (generation=generation)
+
+        return os.path.join (self.directory, '{name}.{column}'.format (name=name, column=column))
+
+    #
+    # Return the committed state of a channel
+    #
+    # @return Tuple of (generation of the column files, number of valid samples)
+    #
+    def get_state (self, channel):
+
+        command = 'SELECT generation, size FROM "{table}" WHERE id=?'.format (table=self.table)
+        row = self.database.cursor.execute (command, (channel.id,)).fetchone ()
+
+        if row is not None:
+            return row
+
+        #
+        # Channels written by former versions have no recorded state. The number of
+        # samples is determined by the shorter column then, so an interrupted append
+        # does not lead to misaligned columns.
+        #
+        sizes = []
+
+        for column, column_type in ColumnarEngine.COLUMN_TYPES.items ():
+            file_name = self.get_file (channel, column, 0)
+            sizes.append (os.path.getsize (file_name) // column_type.itemsize if os.path.exists (file_name) else 0)
+
+        return 0, min (sizes)
+
+    #
+    # Record the state of a channel within the running transaction
+    #
+    def set_state (self, channel, generation, size):
+
+        command = 'INSERT OR REPLACE INTO "{table}" (id, generation, size) values (?, ?, ?)'.format (table=self.table)
+        self.database.cursor.execute (command, (channel.id, generation, size))
+
+    #
+    # Return the memory mapped columns of a channel
+    #
+    # Only the committed samples are mapped. The maps are validated against the channel
+    # state read via the current database cursor, so writes by other connections become
+    # visible and reads within a snapshot are bound to the state of that snapshot.
+    #
+    # @return Tuple of (epochs, values) arrays
+    #
+    def map (self, channel):
+
+        state = self.get_state (channel)
+
+        if channel.id not in self.maps or self.maps[channel.id][0] != state:
+
+            generation, size = state
+
+            try:
+                if size > 0:
+                    epochs = np.memmap (self.get_file (channel, 'epoch', generation), dtype=ColumnarEngine.EPOCH_TYPE, mode='r', shape=(size,))
+                    values = np.memmap (self.get_file (channel, 'value', generation), dtype=ColumnarEngine.VALUE_TYPE, mode='r', shape=(size,))
+                else:
+                    epochs = np.zeros (0, dtype=ColumnarEngine.EPOCH_TYPE)
+                    values = np.zeros (0, dtype=ColumnarEngine.VALUE_TYPE)
+
+            #
+            # The files have been replaced by another connection in the meantime, so
+            # the state read before is outdated already
+            #
+            except FileNotFoundError:
+                if self.database.in_snapshot:
+                    raise
+
+                return self.map (channel)
+
+            self.maps[channel.id] = (state, epochs, values)
+
+        return self.maps[channel.id][1:]
+
+    #
+    # Return index range of the samples within the given epoch range
+    #
+    def find (self, epochs, start, end):
+
+        first = int (np.searchsorted (epochs, start, side='left')) if start is not None else 0
+        last = int (np.searchsorted (epochs, end, side='right')) if end is not None else len (epochs)
+
+        return first, max (first, last)
+
+    #
+    # Drop the channel maps
+    #
+    # Within a snapshot, all channels are mapped right away instead. The mapped files are
+    # thus kept even if another connection replaces them during the snapshot.
+    #
+    def refresh (self):
+
+        self.maps = {}
+
+        if self.database.in_snapshot:
+            for channel in self.database.get_all_channels (active_channels_only=False):
+                if channel.type is float:
+                    self.map (channel)
+
+    def create (self, channel):
+
+        assert channel.type is float
+
+        exists = self.exists (channel, None)
+        generation, size = self.get_state (channel)
+
+        for column in ColumnarEngine.COLUMN_TYPES.keys ():
+            with open (self.get_file (channel, column, generation), 'ab'):
+                pass
+
+        return exists
+
+    def exists (self, channel, tables):
+
+        generation, size = self.get_state (channel)
+        return all ([os.path.exists (self.get_file (channel, column, generation)) for column in ColumnarEngine.COLUMN_TYPES.keys ()])
+
+    def write (self, channel, params):
+
+        if not params:
+            return
+
+        epochs = np.array ([param[0] for param in params], dtype=ColumnarEngine.EPOCH_TYPE)
+        values = np.array ([param[1] for param in params], dtype=ColumnarEngine.VALUE_TYPE)
+
+        order = np.argsort (epochs, kind='stable')
+        epochs = epochs[order]
+        values = values[order]
+
+        generation, size = self.get_state (channel)
+        self.maps.pop (channel.id, None)
+
+        epoch_file = self.get_file (channel, 'epoch', generation)
+        value_file = self.get_file (channel, 'value', generation)
+
+        latest = np.fromfile (epoch_file, dtype=ColumnarEngine.EPOCH_TYPE, count=1,
+                              offset=(size - 1) * ColumnarEngine.EPOCH_TYPE.itemsize)[0] if size > 0 else None
+
+        #
+        # Fast path: Samples are following the existing content and are written behind the
+        # committed samples, replacing whatever is left there
+        #
+        if size == 0 or epochs[0] > latest:
+
+            for file_name, data in [(epoch_file, epochs), (value_file, values)]:
+                with open (file_name, 'r+b') as file:
+                    file.seek (size * data.itemsize)
+                    file.write (data.tobytes ())
+
+            self.set_state (channel, generation, size + len (epochs))
+            return
+
+        #
+        # Merge path: Only the tail starting with the earliest written sample is affected,
+        # the part before is copied unchanged into the files of the next generation
+        #
+        existing_epochs = np.fromfile (epoch_file, dtype=ColumnarEngine.EPOCH_TYPE, count=size)
+        existing_values = np.fromfile (value_file, dtype=ColumnarEngine.VALUE_TYPE, count=size)
+
+        position = int (np.searchsorted (existing_epochs, epochs[0], side='left'))
+
+        tail_epochs = existing_epochs[position:]
+        tail_values = existing_values[position:]
+
+        keep = ~np.isin (tail_epochs, epochs)
+
+        merged_epochs = np.concatenate ((tail_epochs[keep], epochs))
+        merged_values = np.concatenate ((tail_values[keep], values))
+
+        order = np.argsort (merged_epochs, kind='stable')
+
+        for column, prefix, merged in [('epoch', existing_epochs[:position], merged_epochs[order]),
+                                       ('value', existing_values[:position], merged_values[order])]:
+
+            file_name = self.get_file (channel, column, generation + 1)
+
+            with open (file_name, 'wb') as file:
+                file.write (prefix.tobytes ())
+                file.write (merged.tobytes ())
+
+            self.created.append (file_name)
+            self.replaced.append (self.get_file (channel, column, generation))
+
+        self.set_state (channel, generation + 1, position + len (merged_epochs))
+
+    #
+    # Clear a channel by switching it to empty files of the next generation
+    #
+    def clear (self, channel):
+
+        generation, size = self.get_state (channel)
+        self.maps.pop (channel.id, None)
+
+        for column in ColumnarEngine.COLUMN_TYPES.keys ():
+
+            file_name = self.get_file (channel, column, generation + 1)
+
+            with open (file_name, 'wb'):
+                pass
+
+            self.created.append (file_name)
+            self.replaced.append (self.get_file (channel, column, generation))
+
+        self.set_state (channel, generation + 1, 0)
+
+    #
+    # Remove the files of the generations replaced by the committed transaction
+    #
+    # Files which are still mapped by another process cannot be removed on some
+    # platforms. These are retried on the next commit.
+    #
+    def commit (self):
+
+        self.obsolete += self.replaced
+        self.created = []
+        self.replaced = []
+
+        self.obsolete = [file_name for file_name in self.obsolete if not self.remove (file_name)]
+
+    #
+    # Remove the files created by the rolled back transaction
+    #
+    def rollback (self):
+
+        self.maps = {}
+
+        for file_name in self.created:
+            self.remove (file_name)
+
+        self.created = []
+        self.replaced = []
+
+    #
+    # Remove a file
+    #
+    # @return 'True' if the file is gone
+    #
+    def remove (self, file_name):
+
+        try:
+            os.remove (file_name)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+
+        return True
+
+    def read (self, channel, start, end, limit, order):
+
+        epochs, values = self.read_array (channel, start, end)
+
+        if order is Order.descending:
+            epochs = epochs[::-1]
+            values = values[::-1]
+
+        if limit is not None:
+            epochs = epochs[:limit]
+            values = values[:limit]
+
+        return zip (epochs.tolist (), values.tolist ())
+
+    #
+    # Read samples of a channel
+    #
+    # The returned arrays are read only views into the mapped column files.
+    #
+    def read_array (self, channel, start, end):
+
+        epochs, values = self.map (channel)
+        first, last = self.find (epochs, start, end)
+
+        return epochs[first:last], values[first:last]
+
+    def iterate (self, channel, start, end, chunk_size):
+
+        for epochs, values in self.iterate_array (channel, start, end, chunk_size):
+            yield list (zip (epochs.tolist (), values.tolist ()))
+
+    #
+    # Read samples in chunks of array views
+    #
+    # The column maps are resolved once, so writes during the iteration are not
+    # affecting the returned chunks.
+    #
+    def iterate_array (self, channel, start, end, chunk_size):
+
+        epochs, values = self.read_array (channel, start, end)
+
+        for position in range (0, len (epochs), chunk_size):
+            yield epochs[position:position + chunk_size], values[position:position + chunk_size]
+
+    #
+    # Copy the column files of a channel into another directory
+    #
+    # @param channel    Channel to be copied
+    # @param directory  Target directory
+    # @param generation Generation of the column files to be copied
+    # @param size       Number of samples to be copied
+    #
+    def copy (self, channel, directory, generation, size):
+
+        for column, column_type in ColumnarEngine.COLUMN_TYPES.items ():
+
+            file_name = self.get_file (channel, column, generation)
+
+            try:
+                with open (file_name, 'rb') as input, open (os.path.join (directory, os.path.basename (file_name)), 'wb') as output:
+                    output.write (input.read (size * column_type.itemsize))
+
+            except FileNotFoundError:
+                raise RuntimeError ('Channel \'{id}\' has been rewritten during the backup'.format (id=channel.id))
+
+    def count (self, channel, start, end):
+
+        epochs, values = self.map (channel)
+        first, last = self.find (epochs, start, end)
+
+        return last - first
+
+    def aggregate (self, channel):
+
+        epochs, values = self.map (channel)
+
+        if len (epochs) == 0:
+            return 0, None, None, None, None, None
+
+        return len (epochs), int (epochs[0]), int (epochs[-1]), float (values.min ()), float (values.max ()), float (values.sum ())
@@ -6,13 +6,29 @@
 #
 
 import argparse
+import calendar
+import collections
+import contextlib
+import gzip
+import numpy as np
+import os
 import pandas as pd
+import shutil
 import sqlite3
+import time
 
 import core.common
 
+from core.common import AttrDict
+from core.common import Interval
+from core.common import Order
+from core.config import Configuration
 from core.encryption import Encryption
 from core.time import Timestamp
+from database.columnar import ColumnarEngine
+from database.engine import PartitionedEngine
+from database.engine import SQLiteEngine
+from database.vocabulary import Vocabulary
 from scraper.scraper import ScraperRegistry
 
 
@@ -36,235 +52,1824 @@ class Entry:
 # the text in a news channel etc. It is identified by an id like 'CryptoCompare::ETH'
 # which consists of a scraper id ('CryptoCompare') and a token id ('ETH').
 #
+# Text channels containing JSON encoded token lists can use the token encoding, which
+# stores the entries as compact token id blobs. This is transparent to the user.
+#
 class Channel:
 
-    def __init__ (self, id, description, type_id):
+    ENCODING_TOKENS = 'tokens'
+
+    def __init__ (self, id, description, type_id, encoding=None):
+
+        assert encoding is None or (type_id is str and encoding == Channel.ENCODING_TOKENS)
+
+        self.id = id
+        self.description = description
+        self.type = type_id
+        self.encoding = encoding
+
+    def __repr__ (self):
+        return 'Channel (id={id}, description={description}, type={type}, encoding={encoding})' \
+        .format (id=self.id, description=self.description, type=self.type, encoding=self.encoding)
+
+
+#
+# Channel statistics
+#
+# Summary of the content of a single channel. The value related fields (last value,
+# minimum, maximum, mean) are only maintained for float channels and 'None' otherwise.
+#
+class Statistics:
+
+    def __init__ (self, id, count, start, end, last, minimum, maximum, mean):
+
+        self.id = id
+        self.count = count
+        self.start = start
+        self.end = end
+        self.last = last
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+
+    def __repr__ (self):
+        return 'Statistics (id={id}, count={count}, start={start}, end={end}, last={last}, ' \
+               'minimum={minimum}, maximum={maximum}, mean={mean})' \
+        .format (id=self.id, count=self.count, start=self.start, end=self.end, last=self.last,
+                 minimum=self.minimum, maximum=self.maximum, mean=self.mean)
+
+
+#
+# Change feed record
+#
+# Each write batch to a channel is recorded with a monotonically increasing sequence
+# number, the channel id and the time range the batch touched.
+#
+class Change:
+
+    def __init__ (self, sequence, id, start, end, count):
+
+        self.sequence = sequence
+        self.id = id
+        self.start = start
+        self.end = end
+        self.count = count
+
+    def __repr__ (self):
+        return 'Change (sequence={sequence}, id={id}, start={start}, end={end}, count={count})' \
+        .format (sequence=self.sequence, id=self.id, start=self.start, end=self.end, count=self.count)
+
+
+#--------------------------------------------------------------------------
+# Database
+#
+class Database:
+
+    #
+    # Internal table ids
+    #
+    SCHEMA_ID      = 'internal::schema'
+    CHANNELS_ID    = 'internal::channels'
+    CREDENTIALS_ID = 'internal::credentials'
+    STATISTICS_ID  = 'internal::statistics'
+    ROLLUPS_ID     = 'internal::rollups'
+    CHANGES_ID     = 'internal::changes'
+    VOCABULARY_ID  = 'internal::vocabulary'
+    COVERAGE_ID    = 'internal::coverage'
+    COLUMNS_ID     = 'internal::columns'
+
+    #
+    # Version of the database layout. Databases of a lower version are migrated when
+    # opened.
+    #
+    SCHEMA_VERSION = 5
+
+    #
+    # Storage engines for the content of float channels
+    #
+    ENGINE_SQLITE   = 'sqlite'
+    ENGINE_COLUMNAR = 'columnar'
+
+    #
+    # Time in seconds a connection waits for a lock held by another process
+    #
+    BUSY_TIMEOUT = 30.0
+
+    #
+    # Default number of entries per chunk in iterated reads
+    #
+    CHUNK_SIZE = 10000
+
+    #
+    # Default number of pages copied per backup step and delay in seconds between two steps
+    #
+    BACKUP_PAGES = 1024
+    BACKUP_DELAY = 0.01
+
+    #
+    # Number of sampling slots per coverage bitmap block
+    #
+    COVERAGE_BLOCK = 8 * 4096
+
+    #
+    # Intervals float channels are rolled up into with the bucket size in seconds
+    #
+    ROLLUP_INTERVALS = {Interval.day: 24 * 60 * 60, Interval.week: 7 * 24 * 60 * 60}
+
+    #
+    # Row layout of rollup query results
+    #
+    ROLLUP_TYPE = np.dtype ([('timestamp', np.int64), ('open', np.float64), ('high', np.float64), ('low', np.float64),
+                             ('close', np.float64), ('mean', np.float64), ('count', np.int64)])
+
+    #
+    # Constructor
+    #
+    # The content of float channels can be stored either in the SQLite database itself
+    # (default) or in memory mapped column files in the directory '<file>.columns'. The
+    # engine is recorded in the database, so it has to be specified on creation only.
+    #
+    # Channels kept in the SQLite database can optionally be partitioned into per month or
+    # per year tables, so that old partitions can be dropped cheaply. Like the engine, the
+    # partitioning is chosen when the database is created.
+    #
+    # Opening an up to date database costs a few queries only: The schema version and the
+    # present tables are read once and only missing tables are created. Databases of older
+    # versions are migrated.
+    #
+    # In WAL mode, readers in other processes are not blocked by a writer and vice versa.
+    # The mode is persistent in the database file. See 'snapshot ()' for consistent reads
+    # while another process is writing.
+    #
+    # @param file      Location of the database in the file system
+    # @param password  Password to access encrypted database entries
+    # @param engine    Storage engine for float channels (ENGINE_SQLITE, ENGINE_COLUMNAR or 'None')
+    # @param wal       If 'True', the database is switched into write ahead logging mode
+    # @param partition  Partition interval of the SQLite channel tables (Interval.month,
+    #                   Interval.year or 'None')
+    # @param cache_size Maximum number of 'get' results kept in the read cache ('0' to disable)
+    #
+    def __init__ (self, file, password=None, engine=None, wal=False, partition=None, cache_size=0):
+
+        self.encryption = Encryption ()
+        self.types = {str.__name__: str, float.__name__: float}
+        self.active_channels = []
+        self.channels = None
+
+        self.file = file
+        self.password = password
+        self.connection = sqlite3.connect (file, timeout=Database.BUSY_TIMEOUT)
+        self.cursor = self.connection.cursor ()
+        self.in_snapshot = False
+        self.vocabulary = Vocabulary (self, Database.VOCABULARY_ID)
+
+        self.cache = collections.OrderedDict ()
+        self.cache_size = cache_size
+        self.cache_sequence = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.coverage_step = int (Configuration.DATABASE_SAMPLING_STEP.total_seconds ())
+
+        if wal:
+            if file == ':memory:':
+                raise RuntimeError ('WAL mode requires a database file')
+
+            self.cursor.execute ('PRAGMA journal_mode=WAL')
+            self.cursor.execute ('PRAGMA synchronous=NORMAL')
+
+        #
+        # Determine the present tables and the schema state with a single query each. An
+        # up to date database with all channel tables present is opened without any
+        # further schema operation.
+        #
+        command = 'SELECT name FROM sqlite_master WHERE type=\'table\''
+        tables = set ([row[0] for row in self.cursor.execute (command)])
+
+        schema = {}
+
+        if Database.SCHEMA_ID in tables:
+            command = 'SELECT key, value FROM "{table}"'.format (table=Database.SCHEMA_ID)
+            schema = dict (self.cursor.execute (command).fetchall ())
+
+        if int (schema.get ('version', 0)) > Database.SCHEMA_VERSION:
+            raise RuntimeError ('Database has been written by a newer version (schema version {version})'.format (version=schema['version']))
+
+        current = schema.get ('version') == str (Database.SCHEMA_VERSION)
+        legacy = not current and len (tables) > 0
+
+        #
+        # Setup storage engines. Text channels are always kept in the SQLite database.
+        #
+        directory = '{file}.columns'.format (file=file)
+
+        if engine is None:
+            engine = schema.get ('engine', Database.ENGINE_COLUMNAR if os.path.isdir (directory) else Database.ENGINE_SQLITE)
+
+        elif 'engine' in schema and schema['engine'] != engine:
+            raise RuntimeError ('Database is using the \'{engine}\' storage engine'.format (engine=schema['engine']))
+
+        if partition is None:
+            partition = Interval[schema['partition']] if 'partition' in schema else None
+
+        elif (schema or legacy) and schema.get ('partition') != partition.name:
+            raise RuntimeError ('Database partitioning cannot be changed after creation')
+
+        self.sqlite_engine = PartitionedEngine (self, partition) if partition is not None else SQLiteEngine (self)
+        self.float_engine = self.sqlite_engine
+
+        if engine == Database.ENGINE_COLUMNAR:
+            if file == ':memory:':
+                raise RuntimeError ('The columnar storage engine requires a database file')
+
+            self.float_engine = ColumnarEngine (self, directory, Database.COLUMNS_ID)
+
+        elif engine != Database.ENGINE_SQLITE:
+            raise RuntimeError ('Unknown storage engine \'{engine}\''.format (engine=engine))
+
+        if not current:
+            self.create_internal_tables (tables)
+
+            #
+            # Channel tables of older versions are lacking the encoding column
+            #
+            if Database.CHANNELS_ID in tables:
+                columns = self.cursor.execute ('PRAGMA table_info ("{id}")'.format (id=Database.CHANNELS_ID)).fetchall ()
+
+                if 'encoding' not in [column[1] for column in columns]:
+                    self.cursor.execute ('ALTER TABLE "{id}" ADD COLUMN encoding VARCHAR (16)'.format (id=Database.CHANNELS_ID))
+
+        #
+        # Create storage for the registered scraper channels. For databases of older
+        # versions, this also migrates the existing channel tables.
+        #
+        for scr in ScraperRegistry.get_all ():
+            for channel in scr.get_channels ():
+
+                assert len (channel.id) <= 64
+                assert channel.type in self.types.values ()
+                assert len (channel.type.__name__) <= 64
+
+                registered = self.get_channel (channel.id)
+
+                #
+                # The storage of channels registered in an up to date database is present
+                # already, so only new channels have to be probed
+                #
+                if not current or (registered is None and not self.get_engine (channel).exists (channel, tables)):
+                    self.get_engine (channel).create (channel)
+
+                self.active_channels.append (channel.id)
+
+                #
+                # Entries written while the channel was stored as plain text are missing in
+                # its inverted index, so the index is rebuilt when token encoding is enabled
+                #
+                if channel.encoding == Channel.ENCODING_TOKENS:
+                    if Database.get_postings_table (channel) not in tables:
+                        self.create_postings (channel)
+                    elif registered is not None and registered.encoding != channel.encoding:
+                        self.rebuild_postings (channel)
+
+                #
+                # Register type in channel database
+                #
+                if not registered:
+                    command = 'INSERT INTO "{id}" '.format (id=Database.CHANNELS_ID)
+                    command += '(id, description, type, encoding) '
+                    command += 'values (?, ?, ?, ?)'
+
+                    params = []
+                    params.append (channel.id)
+                    params.append (channel.description)
+                    params.append (channel.type.__name__)
+                    params.append (channel.encoding)
+
+                    self.cursor.execute (command, params)
+                    self.get_channel_registry ()[channel.id] = Channel (id=channel.id,
+                                                                         description=channel.description,
+                                                                         type_id=channel.type,
+                                                                         encoding=channel.encoding)
+
+                #
+                # Existing channels can be switched from and to token encoding, because
+                # entries stored in either form are still readable
+                #
+                elif registered.encoding != channel.encoding:
+                    command = 'UPDATE "{id}" SET encoding=? WHERE id=?'.format (id=Database.CHANNELS_ID)
+                    self.cursor.execute (command, (channel.encoding, channel.id))
+
+                    registered.encoding = channel.encoding
+
+        if legacy:
+            self.migrate (int (schema.get ('version', 0)))
+
+        #
+        # The coverage bitmaps are depending on the sampling step and are recomputed if
+        # the step has been changed
+        #
+        if schema.get ('coverage') != str (self.coverage_step):
+            self.create_coverage ()
+
+        settings = {'version': str (Database.SCHEMA_VERSION), 'engine': engine, 'coverage': str (self.coverage_step)}
+
+        if partition is not None:
+            settings['partition'] = partition.name
+
+        if [key for key, value in settings.items () if schema.get (key) != value]:
+            command = 'INSERT OR REPLACE INTO "{table}" (key, value) values (?, ?)'.format (table=Database.SCHEMA_ID)
+            self.cursor.executemany (command, list (settings.items ()))
+
+        self.connection.commit ()
+        self.float_engine.commit ()
+
+
+    #
+    # Create the internal tables which are not present yet
+    #
+    # @param tables Set of table names present in the database
+    #
+    def create_internal_tables (self, tables):
+
+        commands = {}
+
+        #
+        # Schema table
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.SCHEMA_ID)
+        command += 'key VARCHAR (64) PRIMARY KEY, '
+        command += 'value VARCHAR (64)'
+        command += ')'
+
+        commands[Database.SCHEMA_ID] = command
+
+        #
+        # Channel table
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.CHANNELS_ID)
+        command += 'id VARCHAR (64), '
+        command += 'description MEMO, '
+        command += 'type VARCHAR (64), '
+        command += 'encoding VARCHAR (16)'
+        command += ')'
+
+        commands[Database.CHANNELS_ID] = command
+
+        #
+        # Credential table
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.CREDENTIALS_ID)
+        command += 'id VARCHAR (64), '
+        command += 'value MEMO'
+        command += ')'
+
+        commands[Database.CREDENTIALS_ID] = command
+
+        #
+        # Statistics table
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.STATISTICS_ID)
+        command += 'id VARCHAR (64) PRIMARY KEY, '
+        command += 'count INTEGER, '
+        command += 'start INTEGER, '
+        command += 'end INTEGER, '
+        command += 'last REAL, '
+        command += 'minimum REAL, '
+        command += 'maximum REAL, '
+        command += 'total REAL'
+        command += ')'
+
+        commands[Database.STATISTICS_ID] = command
+
+        #
+        # Vocabulary table for token encoded text channels
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.VOCABULARY_ID)
+        command += 'id INTEGER PRIMARY KEY, '
+        command += 'token MEMO NOT NULL UNIQUE'
+        command += ')'
+
+        commands[Database.VOCABULARY_ID] = command
+
+        #
+        # Rollup table
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.ROLLUPS_ID)
+        command += 'id VARCHAR (64) NOT NULL, '
+        command += 'interval VARCHAR (16) NOT NULL, '
+        command += 'timestamp INTEGER NOT NULL, '
+        command += 'open REAL, '
+        command += 'high REAL, '
+        command += 'low REAL, '
+        command += 'close REAL, '
+        command += 'count INTEGER, '
+        command += 'total REAL, '
+        command += 'PRIMARY KEY (id, interval, timestamp)'
+        command += ')'
+
+        commands[Database.ROLLUPS_ID] = command
+
+        #
+        # Change feed table
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.CHANGES_ID)
+        command += 'sequence INTEGER PRIMARY KEY AUTOINCREMENT, '
+        command += 'id VARCHAR (64) NOT NULL, '
+        command += 'start INTEGER NOT NULL, '
+        command += 'end INTEGER NOT NULL, '
+        command += 'count INTEGER NOT NULL'
+        command += ')'
+
+        commands[Database.CHANGES_ID] = command
+
+        #
+        # Coverage table with one bitmap block of sampling slots per row
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.COVERAGE_ID)
+        command += 'id VARCHAR (64) NOT NULL, '
+        command += 'block INTEGER NOT NULL, '
+        command += 'bits BLOB NOT NULL, '
+        command += 'PRIMARY KEY (id, block)'
+        command += ') WITHOUT ROWID'
+
+        commands[Database.COVERAGE_ID] = command
+
+        #
+        # Table with the committed state of the channels in the columnar storage engine
+        #
+        command = 'CREATE TABLE "{id}" ('.format (id=Database.COLUMNS_ID)
+        command += 'id VARCHAR (64) PRIMARY KEY, '
+        command += 'generation INTEGER NOT NULL, '
+        command += 'size INTEGER NOT NULL'
+        command += ')'
+
+        commands[Database.COLUMNS_ID] = command
+
+        for id, command in commands.items ():
+            if id not in tables:
+                self.cursor.execute (command)
+
+    #
+    # Compute the derived data which has not been maintained by older database versions
+    #
+    # @param version Version of the database before the migration
+    #
+    def migrate (self, version):
+
+        if version < 5:
+            self.migrate_time ()
+
+        #
+        # Compute statistics for channels which do not have any yet
+        #
+        command = 'SELECT id FROM "{table}"'.format (table=Database.STATISTICS_ID)
+        existing = set ([row[0] for row in self.cursor.execute (command)])
+
+        for id in self.active_channels:
+            if id not in existing:
+                self.create_statistics (self.get_channel (id))
+
+        #
+        # Compute rollups for float channels with content but without rollups
+        #
+        command = 'SELECT DISTINCT id FROM "{table}"'.format (table=Database.ROLLUPS_ID)
+        existing = set ([row[0] for row in self.cursor.execute (command)])
+
+        for id in self.active_channels:
+            channel = self.get_channel (id)
+
+            if channel.type is float and id not in existing and self.read_statistics (id).count > 0:
+                self.update_rollups (channel, None, None)
+
+    #
+    # Convert the timestamps written by database versions up to 4 into UTC
+    #
+    # These versions interpreted times in the local time zone of the host, so the stored
+    # epochs are representing the local wall clock time. Each epoch is converted into the
+    # epoch of that wall clock time in UTC and floored again. If two epochs are mapped onto
+    # the same one, like at the end of daylight saving time, the later entry is kept. The
+    # data derived from the timestamps is recomputed for the changed channels.
+    #
+    # It is assumed that the database has been written in the time zone of the current
+    # host. On hosts running in UTC, nothing is changed.
+    #
+    def migrate_time (self):
+
+        if time.timezone == 0 and time.altzone == 0:
+            return
+
+        def to_utc (epoch):
+            return Timestamp (calendar.timegm (time.localtime (epoch))).epoch ()
+
+        self.connection.create_function ('to_utc', 1, to_utc)
+
+        command = 'UPDATE "{table}" SET start=to_utc (start), end=to_utc (end)'.format (table=Database.CHANGES_ID)
+        self.cursor.execute (command)
+
+        changed = False
+
+        for channel in self.get_all_channels (active_channels_only=False):
+
+            engine = self.get_engine (channel)
+
+            rows = list (engine.read (channel, None, None, None, Order.ascending))
+            converted = {to_utc (row[0]): row[1] for row in rows}
+
+            if list (converted.keys ()) == [row[0] for row in rows]:
+                continue
+
+            engine.clear (channel)
+            engine.write (channel, list (converted.items ()))
+
+            self.create_statistics (channel)
+
+            if channel.type is float:
+                self.cursor.execute ('DELETE FROM "{table}" WHERE id=?'.format (table=Database.ROLLUPS_ID), (channel.id,))
+                self.update_rollups (channel, None, None)
+
+            if channel.encoding == Channel.ENCODING_TOKENS:
+                self.rebuild_postings (channel)
+
+            changed = True
+
+        if changed:
+            self.create_coverage ()
+
+    #
+    # Close database connection
+    #
+    def close (self):
+        self.encryption.clear ()
+        self.connection.close ()
+
+    #
+    # Context for reading a consistent snapshot of the database
+    #
+    # All reads within the context are executed in a single read transaction on a separate
+    # connection, so data written by other processes in the meantime is not visible. In WAL
+    # mode, this does not block these writers. The snapshot should be kept short, because
+    # the WAL file cannot be checkpointed beyond an active reader.
+    #
+    # Usage:
+    #
+    #   with database.snapshot ():
+    #       timestamps, values, mask = database.get_aligned (...)
+    #
+    @contextlib.contextmanager
+    def snapshot (self):
+
+        assert not self.in_snapshot
+
+        #
+        # An in memory database cannot be shared with other connections or processes
+        #
+        if self.file == ':memory:':
+            yield self
+            return
+
+        connection = sqlite3.connect (self.file, timeout=Database.BUSY_TIMEOUT, isolation_level=None)
+        cursor = connection.cursor ()
+
+        #
+        # The read transaction is started explicitly by the first read
+        #
+        cursor.execute ('BEGIN')
+        cursor.execute ('SELECT COUNT (*) FROM sqlite_master').fetchone ()
+
+        writer = self.cursor
+
+        self.cursor = cursor
+        self.in_snapshot = True
+        self.clear_cache ()
+        self.sqlite_engine.refresh ()
+        self.float_engine.refresh ()
+
+        try:
+            yield self
+        finally:
+            self.cursor = writer
+            self.in_snapshot = False
+            self.clear_cache ()
+            self.sqlite_engine.refresh ()
+            self.float_engine.refresh ()
+
+            cursor.execute ('COMMIT')
+            connection.close ()
+
+    #
+    # Write a consistent copy of the database into a file
+    #
+    # The copy is created with the SQLite online backup API in steps of 'pages' database
+    # pages, so other processes like the acquirer are blocked for a single step at most.
+    # In between two steps, the backup pauses for 'delay' seconds to limit the IO load.
+    #
+    # In WAL mode, all steps are reading from a single snapshot, so concurrent writes are
+    # neither blocked nor part of the copy. Otherwise, SQLite restarts the backup whenever
+    # another process has written in between two steps, so with a busy writer the backup
+    # might not finish before the database has been switched into WAL mode.
+    #
+    # The column files of the columnar engine are copied into '<file>.columns' in the
+    # state recorded in the copied database. The copies are written into temporary files
+    # first, which are removed if the backup fails.
+    #
+    # @param file     Backup file. An existing file is replaced after the backup succeeded.
+    # @param pages    Number of pages copied per step
+    # @param delay    Time in seconds to pause in between two steps
+    # @param compress If 'True', the backup file is gzip compressed. Column files are
+    #                 always copied uncompressed.
+    # @param progress Function called with the number of remaining and total pages after
+    #                 each step
+    #
+    def backup (self, file, pages=BACKUP_PAGES, delay=BACKUP_DELAY, compress=False, progress=None):
+
+        assert pages > 0
+
+        source = self.connection
+
+        if self.file != ':memory:':
+            source = sqlite3.connect (self.file, timeout=Database.BUSY_TIMEOUT, isolation_level=None)
+
+            if source.execute ('PRAGMA journal_mode').fetchone ()[0] == 'wal':
+                source.execute ('BEGIN')
+                source.execute ('SELECT COUNT (*) FROM sqlite_master').fetchone ()
+
+        def step (status, remaining, total):
+
+            if progress is not None:
+                progress (remaining, total)
+
+            if remaining > 0 and delay > 0:
+                time.sleep (delay)
+
+        target_file = file + '.tmp'
+        directory = target_file + '.columns'
+        columnar = isinstance (self.float_engine, ColumnarEngine)
+
+        def remove_temporaries ():
+            for name in [target_file, target_file + '.gz']:
+                if os.path.exists (name):
+                    os.remove (name)
+
+            shutil.rmtree (directory, ignore_errors=True)
+
+        #
+        # Leftovers of an interrupted backup must not become part of this one
+        #
+        remove_temporaries ()
+
+        try:
+            target = sqlite3.connect (target_file)
+
+            try:
+                source.backup (target, pages=pages, progress=step)
+
+                if columnar:
+                    os.makedirs (directory)
+
+                    command = 'SELECT generation, size FROM "{table}" WHERE id=?'.format (table=Database.COLUMNS_ID)
+
+                    for channel in self.get_all_channels (active_channels_only=False):
+                        if channel.type is float:
+                            row = target.execute (command, (channel.id,)).fetchone ()
+                            self.float_engine.copy (channel, directory, *(row if row is not None else self.float_engine.get_state (channel)))
+
+            finally:
+                target.close ()
+
+                if source is not self.connection:
+                    source.close ()
+
+            if compress:
+                with open (target_file, 'rb') as input, gzip.open (target_file + '.gz', 'wb', compresslevel=6) as output:
+                    shutil.copyfileobj (input, output)
+
+                os.remove (target_file)
+
+        except Exception:
+            remove_temporaries ()
+            raise
+
+        os.replace (target_file + '.gz' if compress else target_file, file)
+
+        if columnar:
+            shutil.rmtree (file + '.columns', ignore_errors=True)
+            os.replace (directory, file + '.columns')
+
+    #
+    # Add entry to the database
+    #
+    # If an entry with the same timestamp is already existing in the database, it will
+    # be replaced by the new entry. So it is assumed that data added later is
+    # 'more correct' or generally of a higher quality.
+    #
+    # @param id      Id of the database to be used
+    # @param entries Entries in JSON format to be added (or single entry)
+    #
+    def add (self, id, entries):
+
+        assert id is not Database.CHANNELS_ID
+        assert id is not Database.CREDENTIALS_ID
+
+        if self.in_snapshot:
+            raise RuntimeError ('Database cannot be written during a snapshot')
+
+        #
+        # Fetch channel entry
+        #
+        channel = self.get_channel (id)
+
+        if not isinstance (entries, list):
+            entries = [entries]
+
+        #
+        # Upsert all entries in a single transaction. Entries with duplicate timestamps
+        # within the list are resolved in favour of the last one.
+        #
+        params = []
+
+        for entry in entries:
+
+            assert isinstance (entry, Entry)
+            assert isinstance (entry.timestamp, Timestamp)
+            assert isinstance (entry.value, float) or isinstance (entry.value, str)
+            assert isinstance (entry.value, channel.type)
+
+            params.append ((entry.timestamp.epoch (), entry.value))
+
+        batch = dict (params)
+        engine = self.get_engine (channel)
+
+        try:
+            with self.connection:
+                self.write (channel, engine, batch)
+
+        #
+        # Tokens interned and partitions created during a failed write have been
+        # rolled back, too. Content stored outside of the SQLite database is reverted
+        # by the engine.
+        #
+        except Exception:
+            engine.rollback ()
+            self.vocabulary.refresh ()
+            self.sqlite_engine.refresh ()
+            raise
+
+        engine.commit ()
+
+    #
+    # Write a batch of entries into a channel within the running transaction
+    #
+    # @param channel Channel to write to
+    # @param engine  Storage engine of the channel
+    # @param batch   Map of {epoch: value} pairs
+    #
+    def write (self, channel, engine, batch):
+
+        if channel.encoding == Channel.ENCODING_TOKENS:
+            ids = {epoch: self.vocabulary.parse (value) for epoch, value in batch.items ()}
+            batch = {epoch: self.vocabulary.pack (value) for epoch, value in ids.items ()}
+
+        statistics = self.read_statistics (channel.id)
+        replaced = {}
+
+        #
+        # Rows which are overwritten are read first, so that the statistics can be
+        # corrected incrementally
+        #
+        if batch and statistics.count > 0:
+            for epoch, value in engine.read (channel, min (batch.keys ()), max (batch.keys ()), None, Order.ascending):
+                if epoch in batch:
+                    replaced[epoch] = value
+
+        engine.write (channel, list (batch.items ()))
+        self.update_statistics (channel, statistics, batch, replaced)
+
+        if channel.type is float and batch:
+            self.update_rollups (channel, min (batch.keys ()), max (batch.keys ()))
+
+        if channel.encoding == Channel.ENCODING_TOKENS:
+            self.update_postings (channel, ids, replaced)
+
+        if batch:
+            self.update_coverage (channel.id, self.get_slots (list (batch.keys ())), True)
+            self.write_change (channel.id, min (batch.keys ()), max (batch.keys ()), len (batch))
+
+    #
+    # Record a change in the change feed
+    #
+    def write_change (self, id, start, end, count):
+
+        command = 'INSERT INTO "{table}" (id, start, end, count) values (?, ?, ?, ?)'.format (table=Database.CHANGES_ID)
+        self.cursor.execute (command, (id, start, end, count))
+
+    #
+    # Update the inverted index of a token encoded text channel
+    #
+    # @param channel  Channel which has been written to
+    # @param ids      Map of {epoch: token ids} of the written entries
+    # @param replaced Map of {epoch: value} pairs which have been overwritten
+    #
+    def update_postings (self, channel, ids, replaced):
+
+        params = []
+
+        for epoch, value in replaced.items ():
+            for token in set (self.vocabulary.unpack (value)):
+                params.append ((token, epoch))
+
+        command = 'DELETE FROM "{table}" WHERE token=? AND timestamp=?'.format (table=Database.get_postings_table (channel))
+        self.cursor.executemany (command, params)
+
+        params = []
+
+        for epoch, tokens in ids.items ():
+            for token, count in collections.Counter (tokens).items ():
+                params.append ((token, epoch, count))
+
+        #
+        # Inserting in key order keeps the b-tree updates local
+        #
+        params.sort ()
+
+        command = 'INSERT OR REPLACE INTO "{table}" (token, timestamp, count) values (?, ?, ?)'.format (table=Database.get_postings_table (channel))
+        self.cursor.executemany (command, params)
+
+    #
+    # Create the inverted index table of a token encoded text channel
+    #
+    # The table maps each (token, timestamp) pair to the number of occurrences of the
+    # token in the entry. If the table is created for a channel with content, the index
+    # is built from that content. An existing table is left unchanged.
+    #
+    def create_postings (self, channel):
+
+        table = Database.get_postings_table (channel)
+
+        command = 'SELECT COUNT (*) FROM sqlite_master WHERE type=\'table\' AND name=?'
+        exists = self.cursor.execute (command, (table,)).fetchone ()[0] > 0
+
+        command = 'CREATE TABLE IF NOT EXISTS "{table}" ('.format (table=table)
+        command += 'token INTEGER NOT NULL, '
+        command += 'timestamp INTEGER NOT NULL, '
+        command += 'count INTEGER NOT NULL, '
+        command += 'PRIMARY KEY (token, timestamp)'
+        command += ') WITHOUT ROWID'
+
+        self.cursor.execute (command)
+
+        if not exists:
+            self.index_postings (channel)
+
+    #
+    # Add the content of a token encoded text channel to its inverted index
+    #
+    def index_postings (self, channel):
+
+        for rows in self.sqlite_engine.iterate (channel, None, None, Database.CHUNK_SIZE):
+            self.update_postings (channel, {row[0]: self.vocabulary.unpack (row[1]) for row in rows}, {})
+
+    #
+    # Rebuild the inverted index of a token encoded text channel from its content
+    #
+    def rebuild_postings (self, channel):
+        self.cursor.execute ('DELETE FROM "{table}"'.format (table=Database.get_postings_table (channel)))
+        self.index_postings (channel)
+
+    #
+    # Return the name of the inverted index table of a channel
+    #
+    @staticmethod
+    def get_postings_table (channel):
+        return '{id}::postings'.format (id=channel.id)
+
+    #
+    # Update the channel statistics after a write
+    #
+    # Only if an overwritten value has been the channel minimum or maximum the value
+    # range is recomputed from the complete channel content.
+    #
+    # @param channel    Channel which has been written to
+    # @param statistics Statistics row before the write
+    # @param batch      Map of written {epoch: value} pairs
+    # @param replaced   Map of {epoch: value} pairs which have been overwritten
+    #
+    def update_statistics (self, channel, statistics, batch, replaced):
+
+        if not batch:
+            return
+
+        start = min (batch.keys ())
+        end = max (batch.keys ())
+
+        count = statistics.count + len (batch) - len (replaced)
+        last = None
+        minimum = None
+        maximum = None
+        total = None
+
+        if statistics.count > 0:
+            start = min (start, statistics.start)
+            end = max (end, statistics.end)
+
+        if channel.type is float:
+
+            values = list (batch.values ())
+
+            last = batch[end] if end in batch else statistics.last
+            minimum = min (values)
+            maximum = max (values)
+            total = sum (values) - sum (replaced.values ())
+
+            if statistics.count > 0:
+                minimum = min (minimum, statistics.minimum)
+                maximum = max (maximum, statistics.maximum)
+                total += statistics.total
+
+                changed = [value for epoch, value in replaced.items () if batch[epoch] != value]
+
+                if [value for value in changed if value <= statistics.minimum or value >= statistics.maximum]:
+                    minimum, maximum = self.get_engine (channel).aggregate (channel)[3:5]
+
+        self.write_statistics (channel.id, count, start, end, last, minimum, maximum, total)
+
+    #
+    # Recompute the rollup buckets of a float channel touching the given time range
+    #
+    # Each affected bucket is computed completely from the raw channel content, so
+    # overwritten samples are handled just like new ones. As the week buckets cover the
+    # day buckets, a single read of the raw content is sufficient.
+    #
+    # @param channel Float channel which has been written to
+    # @param start   First written epoch ('None' for the complete channel)
+    # @param end     Last written epoch ('None' for the complete channel)
+    #
+    def update_rollups (self, channel, start, end):
+
+        assert channel.type is float
+
+        first = None
+        last = None
+
+        if start is not None:
+            first = int (Database.get_rollup_bucket (start, Interval.week))
+        if end is not None:
+            last = int (Database.get_rollup_bucket (end, Interval.week)) + Database.ROLLUP_INTERVALS[Interval.week] - 1
+
+        epochs, values = self.get_engine (channel).read_array (channel, first, last)
+
+        if len (epochs) == 0:
+            return
+
+        command = 'INSERT OR REPLACE INTO "{table}" '.format (table=Database.ROLLUPS_ID)
+        command += '(id, interval, timestamp, open, high, low, close, count, total) '
+        command += 'values (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+        for interval, size in Database.ROLLUP_INTERVALS.items ():
+
+            timestamps, index, count = np.unique (Database.get_rollup_bucket (epochs, interval),
+                                                  return_index=True, return_counts=True)
+
+            #
+            # Buckets outside of the written range are not affected by the write
+            #
+            affected = np.ones (len (timestamps), dtype=bool)
+
+            if start is not None and end is not None:
+                affected = (timestamps + size > start) & (timestamps <= end)
+
+            rows = zip ([channel.id] * int (affected.sum ()),
+                        [interval.name] * int (affected.sum ()),
+                        timestamps[affected].tolist (),
+                        values[index][affected].tolist (),
+                        np.maximum.reduceat (values, index)[affected].tolist (),
+                        np.minimum.reduceat (values, index)[affected].tolist (),
+                        values[index + count - 1][affected].tolist (),
+                        count[affected].tolist (),
+                        np.add.reduceat (values, index)[affected].tolist ())
+
+            self.cursor.executemany (command, rows)
+
+    #
+    # Return the start of the rollup buckets the given epochs are falling into
+    #
+    # Buckets are aligned to UTC days. Weeks are starting on mondays.
+    #
+    # @param epochs   Epoch seconds as integer or int64 array
+    # @param interval Rollup interval
+    # @return Bucket start epochs
+    #
+    @staticmethod
+    def get_rollup_bucket (epochs, interval):
+
+        size = Database.ROLLUP_INTERVALS[interval]
+
+        #
+        # The epoch starts on a thursday, so week buckets are shifted by three days
+        #
+        offset = 3 * Database.ROLLUP_INTERVALS[Interval.day] if interval is Interval.week else 0
+
+        return (epochs + offset) // size * size - offset
+
+    #
+    # Return the coverage slots of epochs
+    #
+    # The slots are counting the sampling steps since the UNIX epoch.
+    #
+    # @param epochs Epoch seconds (scalar or array)
+    # @return Slot indices as int64
+    #
+    def get_slots (self, epochs):
+        return np.asarray (epochs, dtype=np.int64) // self.coverage_step
+
+    #
+    # Set or clear coverage bits of a channel
+    #
+    # @param id      Id of the channel
+    # @param slots   Array of slot indices
+    # @param covered New state of the slot bits
+    #
+    def update_coverage (self, id, slots, covered):
+
+        blocks = slots // Database.COVERAGE_BLOCK
+
+        command = 'SELECT bits FROM "{table}" WHERE id=? AND block=?'.format (table=Database.COVERAGE_ID)
+
+        for block in np.unique (blocks).tolist ():
+
+            row = self.cursor.execute (command, (id, block)).fetchone ()
+
+            if row is not None:
+                bits = np.unpackbits (np.frombuffer (row[0], dtype=np.uint8), bitorder='little').astype (bool)
+            else:
+                bits = np.zeros (Database.COVERAGE_BLOCK, dtype=bool)
+
+            bits[slots[blocks == block] - block * Database.COVERAGE_BLOCK] = covered
+
+            if bits.any ():
+                self.cursor.execute ('INSERT OR REPLACE INTO "{table}" (id, block, bits) values (?, ?, ?)'
+                                     .format (table=Database.COVERAGE_ID),
+                                     (id, block, np.packbits (bits, bitorder='little').tobytes ()))
+            elif row is not None:
+                self.cursor.execute ('DELETE FROM "{table}" WHERE id=? AND block=?'.format (table=Database.COVERAGE_ID),
+                                     (id, block))
+
+    #
+    # Compute the coverage bitmaps of all channels from the channel content
+    #
+    def create_coverage (self):
+
+        self.cursor.execute ('DELETE FROM "{table}"'.format (table=Database.COVERAGE_ID))
+
+        for channel in self.get_all_channels (active_channels_only=False):
+            if self.read_statistics (channel.id).count > 0:
+
+                engine = self.get_engine (channel)
+
+                if channel.type is float:
+                    chunks = (epochs for epochs, values in engine.iterate_array (channel, None, None, Database.CHUNK_SIZE))
+                else:
+                    chunks = ([row[0] for row in rows] for rows in engine.iterate (channel, None, None, Database.CHUNK_SIZE))
+
+                for epochs in chunks:
+                    self.update_coverage (channel.id, self.get_slots (epochs), True)
+
+    #
+    # Read the packed coverage bitmap of a channel
+    #
+    # @param id    Id of the channel
+    # @param first First block to read
+    # @param last  Last block to read (inclusive)
+    # @return Bitmap of the blocks as uint8 array with little endian bit order
+    #
+    def read_coverage (self, id, first, last):
+
+        bits = np.zeros ((last - first + 1) * Database.COVERAGE_BLOCK // 8, dtype=np.uint8)
+        size = Database.COVERAGE_BLOCK // 8
+
+        command = 'SELECT block, bits FROM "{table}" WHERE id=? AND block >= ? AND block <= ?'.format (table=Database.COVERAGE_ID)
+
+        for block, data in self.cursor.execute (command, (id, first, last)):
+            bits[(block - first) * size:(block - first + 1) * size] = np.frombuffer (data, dtype=np.uint8)
+
+        return bits
+
+    #
+    # Return the sampling slots which are covered by entries of some channels
+    #
+    # The coverage is maintained with one bit per sampling step and channel, so it can
+    # be determined without reading the channel content.
+    #
+    # @param channel_ids Ids of the channels forming the mask columns
+    # @param start       First slot ('None' for the earliest entry of all channels)
+    # @param end         Last slot ('None' for the latest entry of all channels)
+    # @return Tuple of (slot epoch seconds as int64 array with shape (steps,),
+    #                   coverage mask as bool array with shape (steps, channels))
+    #
+    def get_coverage (self, channel_ids, start=None, end=None):
+
+        first, last = self.get_slot_range (channel_ids, start, end)
+
+        if first is None or last < first:
+            return np.zeros (0, dtype=np.int64), np.zeros ((0, len (channel_ids)), dtype=bool)
+
+        offset = first // Database.COVERAGE_BLOCK * Database.COVERAGE_BLOCK
+        mask = np.zeros ((last - first + 1, len (channel_ids)), dtype=bool)
+
+        for x, id in enumerate (channel_ids):
+            bits = self.read_coverage (id, first // Database.COVERAGE_BLOCK, last // Database.COVERAGE_BLOCK)
+            mask[:, x] = np.unpackbits (bits, bitorder='little')[first - offset:last - offset + 1]
+
+        return np.arange (first, last + 1, dtype=np.int64) * self.coverage_step, mask
+
+    #
+    # Return the time intervals in which not all of some channels have been sampled
+    #
+    # The bitmaps of the channels are combined in their packed form, so only the
+    # combined bitmap is expanded.
+    #
+    # @param channel_ids Ids of the channels which have to be sampled
+    # @param start       First timestamp of the checked time span
+    # @param end         Last timestamp of the checked time span
+    # @param distance    Missing runs separated by less than this timedelta are merged
+    #                    into a single one ('None' for no merging)
+    # @return List of (start, end) timestamp tuples of the missing slot runs (inclusive)
+    #
+    def get_gaps (self, channel_ids, start, end, distance=None):
+
+        assert isinstance (start, Timestamp)
+        assert isinstance (end, Timestamp)
+
+        first, last = self.get_slot_range (channel_ids, start, end)
+
+        if last < first:
+            return []
+
+        offset = first // Database.COVERAGE_BLOCK * Database.COVERAGE_BLOCK
+        complete = np.full ((last // Database.COVERAGE_BLOCK - first // Database.COVERAGE_BLOCK + 1) * Database.COVERAGE_BLOCK // 8,
+                            0xff, dtype=np.uint8)
+
+        for id in channel_ids:
+            complete &= self.read_coverage (id, first // Database.COVERAGE_BLOCK, last // Database.COVERAGE_BLOCK)
+
+        missing = np.unpackbits (~complete, bitorder='little')[first - offset:last - offset + 1].astype (np.int8)
+
+        #
+        # Missing runs are starting at raising and ending before falling edges
+        #
+        edges = np.diff (np.concatenate (([0], missing, [0])))
+        starts = np.flatnonzero (edges == 1) + first
+        ends = np.flatnonzero (edges == -1) + first - 1
+
+        if distance is not None and len (starts) > 1:
+            separate = (starts[1:] - ends[:-1] - 1) * self.coverage_step >= distance.total_seconds ()
+
+            starts = starts[np.concatenate (([True], separate))]
+            ends = ends[np.concatenate ((separate, [True]))]
+
+        return [(Timestamp (int (run_start) * self.coverage_step), Timestamp (int (run_end) * self.coverage_step))
+                for run_start, run_end in zip (starts.tolist (), ends.tolist ())]
+
+    #
+    # Return the slot range of a time span
+    #
+    # Missing bounds are taken from the earliest / latest entry of the channels.
+    #
+    # @return Tuple of (first slot, last slot) or (None, None) if the channels are empty
+    #
+    def get_slot_range (self, channel_ids, start, end):
+
+        statistics = [self.read_statistics (id) for id in channel_ids]
+        statistics = [row for row in statistics if row.count > 0]
+
+        first = start.epoch () if start is not None else min ([row.start for row in statistics], default=None)
+        last = end.epoch () if end is not None else max ([row.end for row in statistics], default=None)
+
+        if first is None or last is None:
+            return None, None
+
+        return int (self.get_slots (first)), int (self.get_slots (last))
+
+    #
+    # Compute the statistics of a channel from the channel content
+    #
+    def create_statistics (self, channel):
+
+        engine = self.get_engine (channel)
+
+        count, start, end, minimum, maximum, total = engine.aggregate (channel)
+
+        last = None
+
+        if count > 0 and channel.type is float:
+            last = list (engine.read (channel, None, None, 1, Order.descending))[0][1]
+
+        self.write_statistics (channel.id, count, start, end, last, minimum, maximum, total)
+
+    #
+    # Write statistics row of a channel
+    #
+    def write_statistics (self, id, count, start, end, last, minimum, maximum, total):
+
+        command = 'INSERT OR REPLACE INTO "{table}" '.format (table=Database.STATISTICS_ID)
+        command += '(id, count, start, end, last, minimum, maximum, total) '
+        command += 'values (?, ?, ?, ?, ?, ?, ?, ?)'
+
+        self.cursor.execute (command, (id, count, start, end, last, minimum, maximum, total))
+
+    #
+    # Read the raw statistics row of a channel
+    #
+    # @return Row with attribute access to the table columns and epoch seconds as timestamps
+    #
+    def read_statistics (self, id):
+
+        command = 'SELECT count, start, end, last, minimum, maximum, total FROM "{table}" '.format (table=Database.STATISTICS_ID)
+        command += 'WHERE id=?'
+
+        row = self.cursor.execute (command, (id,)).fetchone ()
+
+        if row is None:
+            row = (0, None, None, None, None, None, None)
+
+        return AttrDict (zip (['count', 'start', 'end', 'last', 'minimum', 'maximum', 'total'], row))
+
+    #
+    # Return statistics of a channel
+    #
+    # @param id Id of the channel
+    # @return Statistics object
+    #
+    def get_statistics (self, id):
+
+        assert self.get_channel (id)
+
+        row = self.read_statistics (id)
+
+        if row.count == 0:
+            return Statistics (id=id, count=0, start=None, end=None, last=None, minimum=None, maximum=None, mean=None)
+
+        return Statistics (id=id, count=row.count, start=Timestamp (row.start), end=Timestamp (row.end), last=row.last,
+                           minimum=row.minimum, maximum=row.maximum,
+                           mean=row.total / row.count if row.total is not None else None)
+
+    #
+    # Return the sequence number of the latest write batch
+    #
+    # @return Sequence number ('0' if the database has never been written to)
+    #
+    def get_sequence (self):
+
+        command = 'SELECT MAX (sequence) FROM "{table}"'.format (table=Database.CHANGES_ID)
+        sequence = self.cursor.execute (command).fetchone ()[0]
+
+        return sequence if sequence is not None else 0
+
+    #
+    # Return the write batches following a sequence number
+    #
+    # Consumers keep the sequence number of the last change they have processed and
+    # refresh only the channel time ranges reported here.
+    #
+    # Usage:
+    #
+    #   sequence = database.get_sequence ()
+    #   ...
+    #   for change in database.changes_since (sequence):
+    #       ...
+    #       sequence = change.sequence
+    #
+    # @param sequence Sequence number of the last known change
+    # @return List of changes sorted by sequence number
+    #
+    def changes_since (self, sequence):
+
+        command = 'SELECT sequence, id, start, end, count FROM "{table}" '.format (table=Database.CHANGES_ID)
+        command += 'WHERE sequence > ? ORDER BY sequence ASC'
+
+        return [Change (sequence=row[0], id=row[1], start=Timestamp (row[2]), end=Timestamp (row[3]), count=row[4])
+                for row in self.cursor.execute (command, (sequence,))]
+
+    #
+    # Return entries of a channel
+    #
+    # The time range is served by the timestamp key of the channel table, so only the
+    # requested rows are read.
+    #
+    # @param id    Id of the channel
+    # @param start First timestamp to return (inclusive, 'None' for no lower bound)
+    # @param end   Last timestamp to return (inclusive, 'None' for no upper bound)
+    # @param limit Maximum number of entries returned
+    # @param order Sort order of the entries by timestamp
+    # @return List of entries
+    #
+    def get (self, id, start=None, end=None, limit=None, order=Order.ascending):
+
+        assert id is not Database.CHANNELS_ID
+        assert id is not Database.CREDENTIALS_ID
+        assert isinstance (order, Order)
 
-        self.id = id
-        self.description = description
-        self.type = type_id
+        channel = self.get_channel (id)
+        assert channel
 
-    def __repr__ (self):
-        return 'Channel (id={id}, description={description}, type={type})' \
-        .format (id=self.id, description=self.description, type=self.type)
+        if self.cache_size > 0:
+            self.validate_cache ()
 
+            key = (id, *self.to_epochs (start, end), limit, order)
 
+            #
+            # The cache keeps the decoded rows only, so each caller gets entries of its own
+            # and modifications like 'Timestamp.advance' do not affect later results
+            #
+            if key in self.cache:
+                self.cache.move_to_end (key)
+                self.cache_hits += 1
 
-#--------------------------------------------------------------------------
-# Database
-#
-class Database:
+                return [Entry (timestamp=Timestamp (epoch), value=value) for epoch, value in self.cache[key]]
+
+            self.cache_misses += 1
+
+        rows = self.get_engine (channel).read (channel, *self.to_epochs (start, end), limit, order)
+        entries = self.to_entries (channel, rows)
+
+        if self.cache_size > 0:
+            self.cache[key] = [(entry.timestamp.epoch (), entry.value) for entry in entries]
+
+            while len (self.cache) > self.cache_size:
+                self.cache.popitem (last=False)
+
+        return entries
 
     #
-    # Internal table ids
+    # Drop cached 'get' results invalidated by writes
     #
-    CHANNELS_ID    = 'internal::channels'
-    CREDENTIALS_ID = 'internal::credentials'
+    # The cache is validated against the change feed, so writes by other connections
+    # or processes are detected, too. Only results of the written channels overlapping
+    # the written time ranges are dropped.
+    #
+    def validate_cache (self):
+
+        sequence = self.get_sequence ()
+
+        if self.cache_sequence is not None and sequence != self.cache_sequence:
+            for change in self.changes_since (self.cache_sequence):
+
+                start = change.start.epoch ()
+                end = change.end.epoch ()
+
+                for key in [key for key in self.cache.keys () if key[0] == change.id and
+                            (key[1] is None or key[1] <= end) and (key[2] is None or key[2] >= start)]:
+                    del self.cache[key]
+
+        self.cache_sequence = sequence
 
     #
-    # Constructor
+    # Empty the read cache
+    #
+    def clear_cache (self):
+        self.cache.clear ()
+        self.cache_sequence = None
+
     #
-    # @param file     Location of the database in the file system
-    # @param password Password to access encrypted database entries
+    # Return read cache statistics
     #
-    def __init__ (self, file, password=None):
+    # @return Dictionary with the number of cache 'hits' and 'misses' and the number of
+    #         cached results ('size')
+    #
+    def get_cache_statistics (self):
+        return AttrDict (hits=self.cache_hits, misses=self.cache_misses, size=len (self.cache))
 
-        self.encryption = Encryption ()
-        self.types = {str.__name__: str, float.__name__: float}
-        self.active_channels = []
+    #
+    # Iterate over the entries of a channel in chunks
+    #
+    # In contrast to 'get', the result is never materialized as a whole, so channels of
+    # arbitrary size can be processed with constant memory usage.
+    #
+    # Usage:
+    #
+    #   for entries in database.iter ('Twitter::ETH', start, end):
+    #       ...
+    #
+    # @param id         Id of the channel
+    # @param start      First timestamp to return (inclusive, 'None' for no lower bound)
+    # @param end        Last timestamp to return (inclusive, 'None' for no upper bound)
+    # @param chunk_size Maximum number of entries per chunk
+    # @param array      If 'True', chunks of float channels are yielded as tuples of
+    #                   (epoch seconds as int64 array, values as float64 array)
+    # @param tokens     If 'True', chunks of text channels containing JSON token lists are
+    #                   yielded as tuples of (epoch seconds as int64 array, list of token
+    #                   lists). Token encoded entries are not converted into JSON then.
+    # @return Generator yielding lists of entries in ascending order
+    #
+    def iter (self, id, start=None, end=None, chunk_size=CHUNK_SIZE, array=False, tokens=False):
 
-        self.file = file
-        self.password = password
-        self.connection = sqlite3.connect (file)
-        self.cursor = self.connection.cursor ()
+        assert chunk_size > 0
 
-        #
-        # Create channel table
-        #
-        command = 'CREATE TABLE "{id}" ('.format (id=Database.CHANNELS_ID)
-        command += 'id VARCHAR (64), '
-        command += 'description MEMO, '
-        command += 'type VARCHAR (64)'
-        command += ')'
+        channel = self.get_channel (id)
+        assert channel
 
-        try:
-            self.cursor.execute (command)
-        except sqlite3.OperationalError as e:
-            pass
+        engine = self.get_engine (channel)
 
-        #
-        # Create credential table
-        #
-        command = 'CREATE TABLE "{id}" ('.format (id=Database.CREDENTIALS_ID)
-        command += 'id VARCHAR (64), '
-        command += 'value MEMO'
-        command += ')'
+        if array:
+            assert channel.type is float
+            yield from engine.iterate_array (channel, *self.to_epochs (start, end), chunk_size)
 
-        try:
-            self.cursor.execute (command)
-        except sqlite3.OperationalError as e:
-            pass
+        elif tokens:
+            assert channel.type is str
 
-        #
-        # Create tables for the registered scraper channels
-        #
-        for scr in ScraperRegistry.get_all ():
-            for channel in scr.get_channels ():
+            for rows in engine.iterate (channel, *self.to_epochs (start, end), chunk_size):
+                yield np.array ([row[0] for row in rows], dtype=np.int64), self.vocabulary.get_token_lists ([row[1] for row in rows])
 
-                assert len (channel.id) <= 64
-                assert channel.type in self.types.values ()
-                assert len (channel.type.__name__) <= 64
+        else:
+            for rows in engine.iterate (channel, *self.to_epochs (start, end), chunk_size):
+                yield self.to_entries (channel, rows)
 
-                command = 'CREATE TABLE "{id}" ('.format (id=channel.id)
-                command += 'timestamp LONG NOT NULL, '
+    #
+    # Convert (epoch, value) rows read from a storage engine into entries
+    #
+    # Token blobs are decoded independent of the current channel encoding, because a
+    # channel switched back to plain text still contains the blobs written before.
+    #
+    def to_entries (self, channel, rows):
 
-                if channel.type is str:
-                    command += 'value MEMO'
-                elif channel.type is float:
-                    command += 'value REAL'
+        if channel.type is str:
+            rows = list (rows)
+            return [Entry (timestamp=Timestamp (row[0]), value=value)
+                    for row, value in zip (rows, self.vocabulary.decode_many ([row[1] for row in rows]))]
 
-                command += ')'
+        return [Entry (timestamp=Timestamp (row[0]), value=row[1]) for row in rows]
 
-                exists = False
+    #
+    # Return content of a float channel as column arrays
+    #
+    # The rows are converted in a single step without creating an entry object per
+    # sample, so this is the preferred read path for numeric processing. With the
+    # columnar storage engine, the arrays are read only views into the mapped files.
+    #
+    # @param id    Id of the channel
+    # @param start First timestamp to return (inclusive, 'None' for no lower bound)
+    # @param end   Last timestamp to return (inclusive, 'None' for no upper bound)
+    # @return Tuple of (epoch seconds as int64 array, values as float64 array), sorted by time
+    #
+    def get_array (self, id, start=None, end=None):
 
-                try:
-                    self.cursor.execute (command)
-                except sqlite3.OperationalError as e:
-                    exists = True
+        channel = self.get_channel (id)
+        assert channel
+        assert channel.type is float
 
-                self.active_channels.append (channel.id)
+        return self.get_engine (channel).read_array (channel, *self.to_epochs (start, end))
 
-                #
-                # Register type in channel database
-                #
-                if not exists:
-                    command = 'INSERT INTO "{id}" '.format (id=Database.CHANNELS_ID)
-                    command += '(id, description, type) '
-                    command += 'values (?, ?, ?)'
+    #
+    # Search token encoded text channel for entries containing the given tokens
+    #
+    # The search is served by the inverted index of the channel, so the entries itself
+    # are not read.
+    #
+    # @param channel_id Id of the token encoded text channel
+    # @param tokens     Token or list of tokens to search for
+    # @param start      First timestamp to return (inclusive, 'None' for no lower bound)
+    # @param end        Last timestamp to return (inclusive, 'None' for no upper bound)
+    # @return Tuple of (epoch seconds of the entries containing any of the tokens as int64 array,
+    #                   number of token occurrences in these entries as int64 array), sorted by time
+    #
+    def search (self, channel_id, tokens, start=None, end=None):
 
-                    params = []
-                    params.append (channel.id)
-                    params.append (channel.description)
-                    params.append (channel.type.__name__)
+        channel = self.get_channel (channel_id)
+        assert channel
+        assert channel.encoding == Channel.ENCODING_TOKENS
 
-                    self.cursor.execute (command, params)
+        if isinstance (tokens, str):
+            tokens = [tokens]
 
+        ids = self.vocabulary.find_ids (tokens)
 
-        self.connection.commit ()
+        if not ids:
+            return np.zeros (0, dtype=np.int64), np.zeros (0, dtype=np.int64)
+
+        command = 'SELECT timestamp, SUM (count) FROM "{table}" '.format (table=Database.get_postings_table (channel))
+        command += 'WHERE token IN ({tokens})'.format (tokens=', '.join (['?'] * len (ids)))
+
+        params = ids
 
+        first, last = self.to_epochs (start, end)
+
+        if first is not None:
+            command += ' AND timestamp >= ?'
+            params.append (first)
+
+        if last is not None:
+            command += ' AND timestamp <= ?'
+            params.append (last)
+
+        command += ' GROUP BY timestamp ORDER BY timestamp ASC'
+
+        rows = np.array (self.cursor.execute (command, params).fetchall (), dtype=np.int64).reshape ((-1, 2))
+
+        return np.ascontiguousarray (rows[:, 0]), np.ascontiguousarray (rows[:, 1])
 
     #
-    # Add entry to the database
+    # Return the rollup of a float channel
     #
-    # If an entry with the same timestamp is already existing in the database, it will
-    # be replaced by the new entry. So it is assumed that data added later is
-    # 'more correct' or generally of a higher quality.
+    # The rollups are maintained on each write, so this is the preferred read path for
+    # views spanning long time ranges.
     #
-    # @param id      Id of the database to be used
-    # @param entries Entries in JSON format to be added (or single entry)
+    # @param id       Id of the float channel
+    # @param interval Rollup interval (one of ROLLUP_INTERVALS)
+    # @param start    Timestamp within the first bucket to return ('None' for no lower bound)
+    # @param end      Timestamp within the last bucket to return ('None' for no upper bound)
+    # @return Array of type ROLLUP_TYPE with one row per bucket, sorted by bucket start
     #
-    def add (self, id, entries):
+    def get_rollup (self, id, interval, start=None, end=None):
 
-        assert id is not Database.CHANNELS_ID
-        assert id is not Database.CREDENTIALS_ID
-
-        #
-        # Fetch channel entry
-        #
         channel = self.get_channel (id)
+        assert channel
+        assert channel.type is float
+        assert interval in Database.ROLLUP_INTERVALS
 
-        if not isinstance (entries, list):
-            entries = [entries]
+        command = 'SELECT timestamp, open, high, low, close, total / count, count FROM "{table}" '.format (table=Database.ROLLUPS_ID)
+        command += 'WHERE id=? AND interval=?'
 
-        #
-        # Insert new entries into database
-        #
-        for entry in entries:
+        params = [id, interval.name]
 
-            assert isinstance (entry, Entry)
-            assert isinstance (entry.timestamp, Timestamp)
-            assert isinstance (entry.value, float) or isinstance (entry.value, str)
-            assert isinstance (entry.value, channel.type)
+        if start is not None:
+            command += ' AND timestamp >= ?'
+            params.append (int (Database.get_rollup_bucket (start.epoch (), interval)))
+
+        if end is not None:
+            command += ' AND timestamp <= ?'
+            params.append (end.epoch ())
+
+        command += ' ORDER BY timestamp ASC'
+
+        return np.array (self.cursor.execute (command, params).fetchall (), dtype=Database.ROLLUP_TYPE)
+
+    #
+    # Return the content of multiple float channels aligned to a common time grid
+    #
+    # The grid starts at 'start' and advances in 'step' distance up to 'end'. Each
+    # channel sample is sorted into the grid step it falls into. If there are multiple
+    # samples within a single step, the latest one is used.
+    #
+    # If a rollup interval is given, the closing values of the channel rollups are
+    # aligned instead of the raw samples. The grid is then aligned to the rollup buckets.
+    #
+    # @param channel_ids Ids of the float channels forming the matrix columns
+    # @param start       First grid timestamp ('None' for the earliest sample of all channels)
+    # @param end         Last grid timestamp ('None' for the latest sample of all channels)
+    # @param step        Grid step as timedelta ('None' for the database sampling step or
+    #                    the rollup interval)
+    # @param interval    Rollup interval to read the channels from ('None' for raw samples)
+    # @return Tuple of (grid epoch seconds as int64 array with shape (steps,),
+    #                   values as float64 array with shape (steps, channels),
+    #                   presence mask as bool array with shape (steps, channels))
+    #                   Values without a sample are 'NaN'.
+    #
+    def get_aligned (self, channel_ids, start=None, end=None, step=None, interval=None):
 
-            command = 'DELETE FROM "{channel}"'.format (channel=id)
-            command += ' WHERE timestamp="{timestamp}"'.format (timestamp=entry.timestamp.epoch ())
-            self.cursor.execute (command)
+        if interval is not None:
+            step = int (step.total_seconds ()) if step is not None else Database.ROLLUP_INTERVALS[interval]
+        else:
+            step = int ((step if step is not None else Configuration.DATABASE_SAMPLING_STEP).total_seconds ())
 
-            command = 'INSERT INTO "{channel}" '.format (channel=id)
-            command += '(timestamp, value) '
-            command += 'values (?, ?)'
+        assert step > 0
 
-            params = []
-            params.append (entry.timestamp.epoch ())
-            params.append (entry.value)
+        first = start.epoch () if start is not None else None
+        last = end.epoch () if end is not None else None
 
-            self.cursor.execute (command, params)
+        if interval is not None:
+            columns = [(rollup['timestamp'], rollup['close']) for rollup in [self.get_rollup (id, interval, start, end)
+                                                                              for id in channel_ids]]
 
-        self.connection.commit ()
+            if first is not None:
+                first = int (Database.get_rollup_bucket (first, interval))
+
+        else:
+            columns = [self.get_array (id, start, end) for id in channel_ids]
+
+        columns_with_data = [column for column in columns if len (column[0]) > 0]
+
+        if first is None and columns_with_data:
+            first = min ([int (column[0][0]) for column in columns_with_data])
+
+        if last is None and columns_with_data:
+            last = max ([int (column[0][-1]) for column in columns_with_data])
+
+        if first is None or last is None or last < first:
+            return np.zeros (0, dtype=np.int64), \
+                np.zeros ((0, len (channel_ids)), dtype=np.float64), \
+                np.zeros ((0, len (channel_ids)), dtype=bool)
+
+        timestamps = np.arange (first, last + 1, step, dtype=np.int64)
+        values = np.full ((len (timestamps), len (channel_ids)), np.nan, dtype=np.float64)
+        mask = np.zeros ((len (timestamps), len (channel_ids)), dtype=bool)
+
+        for x, (epochs, data) in enumerate (columns):
+
+            index = (epochs - first) // step
+
+            #
+            # Channel samples are sorted by time, so the last sample of each group of
+            # identical grid indices is the latest one in that step
+            #
+            latest = np.append (index[1:] != index[:-1], True) if len (index) > 0 else np.zeros (0, dtype=bool)
+
+            values[index[latest], x] = data[latest]
+            mask[index[latest], x] = True
 
+        return timestamps, values, mask
 
     #
-    # Return all entries in a table
+    # Return number of entries of a channel
     #
-    def get (self, id):
+    # @param id    Id of the channel
+    # @param start First timestamp to count (inclusive, 'None' for no lower bound)
+    # @param end   Last timestamp to count (inclusive, 'None' for no upper bound)
+    #
+    def count (self, id, start=None, end=None):
 
-        assert id is not Database.CHANNELS_ID
-        assert id is not Database.CREDENTIALS_ID
+        if start is None and end is None:
+            return self.get_statistics (id).count
 
         channel = self.get_channel (id)
         assert channel
 
-        command = 'SELECT * FROM "{channel}"'.format (channel=id)
-        rows = self.cursor.execute (command)
+        return self.get_engine (channel).count (channel, *self.to_epochs (start, end))
 
-        return [Entry (timestamp=Timestamp (row[0]), value=row[1]) for row in rows]
+    #
+    # Convert optional time range limits into epoch seconds
+    #
+    def to_epochs (self, start, end):
+
+        assert start is None or isinstance (start, Timestamp)
+        assert end is None or isinstance (end, Timestamp)
+
+        return start.epoch () if start is not None else None, end.epoch () if end is not None else None
 
     #
-    # Return administrative entry for a single channel
+    # Return the partitions of a channel
     #
-    def get_channel (self, id):
+    # @param id Id of the channel
+    # @return Sorted list of partition keys like '2017' or '2017-06'
+    #
+    def get_partitions (self, id):
+
+        channel = self.get_channel (id)
+        assert channel
+
+        engine = self.get_engine (channel)
 
-        command = 'SELECT * FROM "{table}"'.format (table=Database.CHANNELS_ID)
-        command += ' WHERE id="{id}"'.format (id=id)
+        if not isinstance (engine, PartitionedEngine):
+            raise RuntimeError ('Channel \'{id}\' is not partitioned'.format (id=id))
 
-        rows = list (self.cursor.execute (command))
+        return list (engine.get_partitions (channel))
 
-        if not rows:
-            return None
+    #
+    # Drop a partition of a channel
+    #
+    # The statistics, rollups and the inverted index of the channel are corrected, the
+    # dropped time range is reported in the change feed with an entry count of '0'.
+    #
+    # @param id        Id of the channel
+    # @param partition Key of the partition
+    #
+    def drop_partition (self, id, partition):
+
+        if self.in_snapshot:
+            raise RuntimeError ('Database cannot be written during a snapshot')
+
+        assert partition in self.get_partitions (id)
+
+        channel = self.get_channel (id)
+        engine = self.get_engine (channel)
 
-        assert len (rows) == 1
-        row = rows[0]
+        start, end = engine.get_range (partition)
 
-        assert row[2] in self.types
-        return Channel (id=row[0], description=row[1], type_id=self.types[row[2]])
+        try:
+            with self.connection:
+                #
+                # Dropping a table does not start a transaction implicitly
+                #
+                if not self.connection.in_transaction:
+                    self.cursor.execute ('BEGIN')
+
+                self.remove_partition (channel, engine, partition, start, end)
 
+        #
+        # The partitions dropped in the failed transaction are present again
+        #
+        except Exception:
+            engine.rollback ()
+            self.sqlite_engine.refresh ()
+            raise
+
+        engine.commit ()
 
     #
-    # Return administrative entries for all channels
+    # Drop a partition and correct the derived data within the running transaction
     #
-    def get_all_channels (self, active_channels_only=True):
+    def remove_partition (self, channel, engine, partition, start, end):
 
-        command = 'SELECT * FROM "{table}"'.format (table=Database.CHANNELS_ID)
+        id = channel.id
 
-        rows = self.cursor.execute (command)
+        statistics = self.read_statistics (id)
+        count, first, last, minimum, maximum, total = engine.aggregate_partition (channel, partition)
 
-        entries = []
+        if channel.encoding == Channel.ENCODING_TOKENS:
+            command = 'DELETE FROM "{table}" WHERE timestamp >= ? AND timestamp <= ?'.format (table=Database.get_postings_table (channel))
+            self.cursor.execute (command, (start, end))
 
-        for row in rows:
-            assert row[2] in self.types
+        engine.drop (channel, partition)
+
+        self.update_coverage (id, np.arange (self.get_slots (start), self.get_slots (end) + 1, dtype=np.int64), False)
+
+        #
+        # The statistics are corrected incrementally unless the dropped partition
+        # contained the channel value range extremes
+        #
+        if count == statistics.count or (channel.type is float and count > 0 and
+                                         (minimum <= statistics.minimum or maximum >= statistics.maximum)):
+            self.create_statistics (channel)
+
+        elif count > 0:
+            remaining = [engine.read (channel, None, None, 1, order)[0] for order in [Order.ascending, Order.descending]]
+
+            self.write_statistics (id, statistics.count - count, remaining[0][0], remaining[1][0],
+                                   remaining[1][1] if channel.type is float else None,
+                                   statistics.minimum, statistics.maximum,
+                                   statistics.total - total if channel.type is float else None)
+
+        #
+        # The rollup buckets overlapping the dropped range are deleted and recomputed
+        # from the remaining content. Buckets of other intervals starting before the
+        # range, like the days of a week crossing the partition border, are kept.
+        #
+        if channel.type is float:
+            command = 'DELETE FROM "{table}" WHERE id=? AND interval=? AND timestamp >= ? AND timestamp <= ?'.format (table=Database.ROLLUPS_ID)
+
+            for interval in Database.ROLLUP_INTERVALS.keys ():
+                self.cursor.execute (command, (id, interval.name, int (Database.get_rollup_bucket (start, interval)), end))
+
+            self.update_rollups (channel, start, end)
+
+        self.write_change (id, start, end, 0)
 
-            id = row[0]
+    #
+    # Return storage engine responsible for the content of a channel
+    #
+    def get_engine (self, channel):
+        return self.float_engine if channel.type is float else self.sqlite_engine
+
+    #
+    # Return administrative entry for a single channel
+    #
+    # @param id Id of the channel
+    # @return Channel or 'None' if there is no channel with that id
+    #
+    def get_channel (self, id):
+        return self.get_channel_registry ().get (id, None)
+
+
+    #
+    # Return administrative entries for all channels
+    #
+    def get_all_channels (self, active_channels_only=True):
+
+        entries = []
 
+        for id, channel in self.get_channel_registry ().items ():
             if not active_channels_only or id in self.active_channels:
-                entries.append (Channel (id=id, description=row[1], type_id=self.types[row[2]]))
+                entries.append (channel)
 
         return entries
 
+    #
+    # Return the channel registry as a map of {channel id: channel}
+    #
+    # The registry is read from the channel table once and kept until the channel table
+    # is modified again.
+    #
+    def get_channel_registry (self):
+
+        if self.channels is None:
+
+            command = 'SELECT id, description, type, encoding FROM "{table}"'.format (table=Database.CHANNELS_ID)
+
+            self.channels = {}
+
+            for row in self.cursor.execute (command):
+                assert row[2] in self.types
+                self.channels[row[0]] = Channel (id=row[0], description=row[1], type_id=self.types[row[2]],
+                                                 encoding=row[3])
+
+        return self.channels
+
     #
     # Add credential to database
     #
     def add_credential (self, id, value):
 
+        if self.in_snapshot:
+            raise RuntimeError ('Database cannot be written during a snapshot')
+
         assert isinstance (self.password, str)
         assert len (self.password) >= 4
         assert isinstance (id, str)
@@ -272,9 +1877,9 @@ class Database:
         assert isinstance (value, str)
 
         command = 'DELETE FROM "{channel}"'.format (channel=Database.CREDENTIALS_ID)
-        command += ' WHERE id="{id}"'.format (id=id)
+        command += ' WHERE id=?'
 
-        self.cursor.execute (command)
+        self.cursor.execute (command, (id,))
 
         command = 'INSERT INTO "{channel}" '.format (channel=Database.CREDENTIALS_ID)
         command += '(id, value) '
@@ -292,14 +1897,56 @@ class Database:
     # Read credentials
     #
     def get_credential (self, id):
+        return self.get_credentials ([id])[id]
 
-        command = 'SELECT * FROM "{channel}"'.format (channel=Database.CREDENTIALS_ID)
-        command += ' WHERE id="{id}"'.format (id=id)
+    #
+    # Read multiple credentials
+    #
+    # @param ids List of credential ids
+    # @return Dictionary mapping each id to the decrypted credential ('None' if not present)
+    #
+    def get_credentials (self, ids):
+
+        command = 'SELECT id, value FROM "{channel}"'.format (channel=Database.CREDENTIALS_ID)
+        command += ' WHERE id IN ({ids})'.format (ids=', '.join (['?'] * len (ids)))
 
-        rows = list (self.cursor.execute (command))
-        assert len (rows) < 2
+        rows = list (self.cursor.execute (command, list (ids)))
+        assert len (rows) == len (set ([row[0] for row in rows]))
 
-        return self.encryption.decrypt (rows[0][1], self.password) if rows else None
+        credentials = {id: None for id in ids}
+
+        for row in rows:
+            credentials[row[0]] = self.encryption.decrypt (row[1], self.password)
+
+        return credentials
+
+    #
+    # Change the password the credentials are encrypted with
+    #
+    # All credentials are re-encrypted within a single transaction.
+    #
+    # @param password New password
+    #
+    def rekey (self, password):
+
+        if self.in_snapshot:
+            raise RuntimeError ('Database cannot be written during a snapshot')
+
+        assert isinstance (password, str)
+        assert len (password) >= 4
+
+        credentials = self.get_credentials (self.get_all_credential_ids ())
+
+        if [id for id, value in credentials.items () if value is None]:
+            raise RuntimeError ('Credentials cannot be decrypted with the current password')
+
+        command = 'UPDATE "{channel}" SET value=? WHERE id=?'.format (channel=Database.CREDENTIALS_ID)
+
+        with self.connection:
+            self.cursor.executemany (command, [(self.encryption.encrypt (value, password), id)
+                                               for id, value in credentials.items ()])
+
+        self.password = password
 
     #
     # Return list of credential ids present in the database
@@ -330,35 +1977,68 @@ def database_list (args):
     for channel in channels:
         if channel.id in ids or 'all' in ids:
 
-            entries = database.get (channel.id)
-            frame = pd.DataFrame (columns=['timestamp', 'value'], index=range (len (entries)))
+            title = '{0} [{1}]'.format (channel.id, channel.description)
 
-            for entry in entries:
-                frame.loc[len (frame)] = [entry.timestamp, entry.value]
+            print (title)
+            print ('-' * len (title))
+
+            count = 0
+            for entries in database.iter (channel.id):
+
+                frame = pd.DataFrame ([[entry.timestamp, entry.value] for entry in entries],
+                                      columns=['timestamp', 'value'],
+                                      index=range (count, count + len (entries)))
+
+                print (frame.to_string (header=count == 0))
+                count += len (entries)
 
-            core.common.print_frame ('{0} [{1}]'.format (channel.id, channel.description), frame)
             print ('')
 
 
+#
+# Write backup of the database
+#
+def database_backup (args):
+
+    database = Database (args.database, args.password)
+
+    def progress (remaining, total):
+        print ('\rBackup: {0:.0f}%'.format (100.0 * (total - remaining) / total if total > 0 else 100.0), end='', flush=True)
+
+    database.backup (args.backup, pages=args.pages, delay=args.delay, compress=args.compress, progress=progress)
+    database.close ()
+
+    print ('')
+
+
 #
 # Print database summary
 #
 def database_summary (args):
 
     database = Database (args.database, args.password)
-    frame = pd.DataFrame (columns=['id', 'description', 'type', 'entries', 'last value', 'start time', 'end time'])
+    frame = pd.DataFrame (columns=['id', 'description', 'type', 'entries', 'last value', 'minimum', 'maximum', 'mean',
+                                   'start time', 'end time'])
 
     for channel in database.get_all_channels ():
-        entries = database.get (channel.id)
-        entries.sort (key=lambda entry: entry.timestamp)
+        statistics = database.get_statistics (channel.id)
+
+        if statistics.count == 0:
+            frame.loc[len (frame)] = [channel.id, channel.description, channel.type.__name__, 0, '-', '-', '-', '-', '-', '-']
+            continue
+
+        numeric = channel.type is float
 
         frame.loc[len (frame)] = [channel.id,
                                   channel.description,
                                   channel.type.__name__,
-                                  len (entries),
-                                  entries[-1].value if channel.type is float else '<text>',
-                                  entries[0].timestamp,
-                                  entries[-1].timestamp]
+                                  statistics.count,
+                                  statistics.last if numeric else '<text>',
+                                  statistics.minimum if numeric else '-',
+                                  statistics.maximum if numeric else '-',
+                                  statistics.mean if numeric else '-',
+                                  statistics.start,
+                                  statistics.end]
 
     core.common.print_frame ('Channels', frame)
 
@@ -383,6 +2063,10 @@ if __name__ == '__main__':
     parser.add_argument ('-l', '--list',     action='store', default=False, help='List database channel content')
     parser.add_argument ('-s', '--summary',  action='store_true', default=False, help='Print database summary')
     parser.add_argument ('-p', '--password', type=str, default=None, help='Passwort for database encryption')
+    parser.add_argument ('-b', '--backup',   type=str, default=None, help='Write online backup into the given file')
+    parser.add_argument ('-z', '--compress', action='store_true', default=False, help='Compress backup file')
+    parser.add_argument ('--pages',          type=int, default=Database.BACKUP_PAGES, help='Number of pages copied per backup step')
+    parser.add_argument ('--delay',          type=float, default=Database.BACKUP_DELAY, help='Delay in seconds between two backup steps')
     parser.add_argument ('database',         type=str, default=None, help='Database file')
 
     args = parser.parse_args ()
@@ -390,7 +2074,10 @@ if __name__ == '__main__':
 
     database = Database (args.database, args.password)
 
-    if args.summary:
+    if args.backup:
+        database_backup (args)
+
+    elif args.summary:
         database_summary (args)
 
     elif args.list:
@@ -0,0 +1,521 @@
+#!/usr/bin/python3
+#
+# engine.py - Storage engines for the channel content
+#
+# Frank Blankenburg, Jul. 2017
+#
+
+import copy
+import numpy as np
+import re
+import sqlite3
+
+from abc import ABC, abstractmethod
+from core.common import Interval
+from core.common import Order
+
+
+#--------------------------------------------------------------------------
+# Abstract base class for all storage engines
+#
+# A storage engine is responsible for the samples of the channels only. Administrative
+# data like the channel registry, credentials and statistics is always kept in the
+# SQLite database. All timestamps are passed as epoch seconds.
+#
+class Engine (ABC):
+
+    #
+    # Row layout of float channels in array based queries
+    #
+    ARRAY_TYPE = np.dtype ([('timestamp', np.int64), ('value', np.float64)])
+
+    #
+    # Constructor
+    #
+    # @param database Database the engine is storing the channel content for
+    #
+    def __init__ (self, database):
+        self.database = database
+
+    #
+    # Create storage for a channel if not already present
+    #
+    # @param channel Channel to create the storage for
+    # @return 'True' if the storage has already been present
+    #
+    @abstractmethod
+    def create (self, channel):
+        pass
+
+    #
+    # Check if the storage of a channel is present
+    #
+    # @param channel Channel to check
+    # @param tables  Set of the table names present in the SQLite database
+    #
+    @abstractmethod
+    def exists (self, channel, tables):
+        pass
+
+    #
+    # Write samples into a channel
+    #
+    # Samples with a timestamp already present in the channel replace the existing ones.
+    #
+    # @param channel Channel to write to
+    # @param params  List of (epoch, value) tuples with unique epochs
+    #
+    @abstractmethod
+    def write (self, channel, params):
+        pass
+
+    #
+    # Remove all samples of a channel
+    #
+    # @param channel Channel to be cleared
+    #
+    @abstractmethod
+    def clear (self, channel):
+        pass
+
+    #
+    # Read samples from a channel
+    #
+    # @param channel Channel to read from
+    # @param start   First epoch to return (inclusive, 'None' for no lower bound)
+    # @param end     Last epoch to return (inclusive, 'None' for no upper bound)
+    # @param limit   Maximum number of samples returned
+    # @param order   Sort order of the samples by timestamp
+    # @return Iterable of (epoch, value) tuples
+    #
+    @abstractmethod
+    def read (self, channel, start, end, limit, order):
+        pass
+
+    #
+    # Read samples of a float channel as column arrays
+    #
+    # @return Tuple of (epochs as int64 array, values as float64 array)
+    #
+    @abstractmethod
+    def read_array (self, channel, start, end):
+        pass
+
+    #
+    # Read samples from a channel in chunks of bounded size
+    #
+    # @param channel    Channel to read from
+    # @param start      First epoch to return (inclusive, 'None' for no lower bound)
+    # @param end        Last epoch to return (inclusive, 'None' for no upper bound)
+    # @param chunk_size Maximum number of samples per chunk
+    # @return Generator yielding lists of (epoch, value) tuples in ascending order
+    #
+    @abstractmethod
+    def iterate (self, channel, start, end, chunk_size):
+        pass
+
+    #
+    # Read samples of a float channel in chunks of column arrays
+    #
+    # @return Generator yielding tuples of (epochs as int64 array, values as float64 array)
+    #
+    def iterate_array (self, channel, start, end, chunk_size):
+
+        for rows in self.iterate (channel, start, end, chunk_size):
+            rows = np.array (rows, dtype=Engine.ARRAY_TYPE)
+            yield np.ascontiguousarray (rows['timestamp']), np.ascontiguousarray (rows['value'])
+
+    #
+    # Return the number of samples in a channel time range
+    #
+    @abstractmethod
+    def count (self, channel, start, end):
+        pass
+
+    #
+    # Drop cached channel content so that writes by other processes become visible
+    #
+    def refresh (self):
+        pass
+
+    #
+    # Finish the writes of a committed database transaction
+    #
+    def commit (self):
+        pass
+
+    #
+    # Revert the writes of a rolled back database transaction
+    #
+    # Engines storing the content outside of the SQLite database must undo the writes
+    # done since the last commit here.
+    #
+    def rollback (self):
+        pass
+
+    #
+    # Compute aggregated values over the complete channel
+    #
+    # @return Tuple of (count, first epoch, last epoch, minimum, maximum, sum). The value
+    #         related fields are 'None' for text channels.
+    #
+    @abstractmethod
+    def aggregate (self, channel):
+        pass
+
+
+#--------------------------------------------------------------------------
+# Storage engine keeping each channel in a SQLite table keyed by timestamp
+#
+class SQLiteEngine (Engine):
+
+    def __init__ (self, database):
+        super ().__init__ (database)
+
+    def create (self, channel):
+
+        command = 'CREATE TABLE "{id}" ('.format (id=channel.id)
+        command += 'timestamp INTEGER NOT NULL PRIMARY KEY, '
+
+        if channel.type is str:
+            command += 'value MEMO'
+        elif channel.type is float:
+            command += 'value REAL'
+
+        command += ')'
+
+        try:
+            self.database.cursor.execute (command)
+        except sqlite3.OperationalError as e:
+
+            #
+            # Tables created by older versions are lacking the timestamp key. A unique
+            # index is added instead, keeping only the latest entry of duplicate timestamps.
+            #
+            columns = self.database.cursor.execute ('PRAGMA table_info ("{id}")'.format (id=channel.id)).fetchall ()
+
+            if not [column for column in columns if column[1] == 'timestamp' and column[5] > 0]:
+                self.create_timestamp_index (channel.id)
+
+            return True
+
+        return False
+
+    def exists (self, channel, tables):
+        return channel.id in tables
+
+    #
+    # Add unique timestamp index to a channel table
+    #
+    # @param id Id of the channel
+    #
+    def create_timestamp_index (self, id):
+
+        command = 'CREATE UNIQUE INDEX IF NOT EXISTS "{id}::timestamp" '.format (id=id)
+        command += 'ON "{id}" (timestamp)'.format (id=id)
+
+        try:
+            self.database.cursor.execute (command)
+        except sqlite3.IntegrityError:
+            remove = 'DELETE FROM "{id}" '.format (id=id)
+            remove += 'WHERE rowid NOT IN (SELECT MAX (rowid) FROM "{id}" GROUP BY timestamp)'.format (id=id)
+
+            self.database.cursor.execute (remove)
+            self.database.cursor.execute (command)
+
+    def write (self, channel, params):
+
+        command = 'INSERT INTO "{channel}" '.format (channel=channel.id)
+        command += '(timestamp, value) '
+        command += 'values (?, ?) '
+        command += 'ON CONFLICT (timestamp) DO UPDATE SET value=excluded.value'
+
+        self.database.cursor.executemany (command, params)
+
+    def clear (self, channel):
+        self.database.cursor.execute ('DELETE FROM "{channel}"'.format (channel=channel.id))
+
+    def read (self, channel, start, end, limit, order):
+
+        command = 'SELECT timestamp, value FROM "{channel}"'.format (channel=channel.id)
+        command, params = self.add_range_clause (command, start, end, limit, order)
+
+        return self.database.cursor.execute (command, params)
+
+    def read_array (self, channel, start, end):
+
+        rows = np.array (self.read (channel, start, end, None, Order.ascending).fetchall (), dtype=Engine.ARRAY_TYPE)
+        return np.ascontiguousarray (rows['timestamp']), np.ascontiguousarray (rows['value'])
+
+    #
+    # Read samples in chunks
+    #
+    # The query runs on a cursor of its own, so other database operations can be
+    # executed while the chunks are processed.
+    #
+    def iterate (self, channel, start, end, chunk_size):
+
+        command = 'SELECT timestamp, value FROM "{channel}"'.format (channel=channel.id)
+        command, params = self.add_range_clause (command, start, end, None, Order.ascending)
+
+        cursor = self.database.cursor.connection.cursor ()
+
+        try:
+            cursor.execute (command, params)
+
+            rows = cursor.fetchmany (chunk_size)
+            while rows:
+                yield rows
+                rows = cursor.fetchmany (chunk_size)
+
+        finally:
+            cursor.close ()
+
+    def count (self, channel, start, end):
+
+        command = 'SELECT COUNT (*) FROM "{channel}"'.format (channel=channel.id)
+        command, params = self.add_range_clause (command, start, end, None, Order.ascending)
+
+        return self.database.cursor.execute (command, params).fetchone ()[0]
+
+    def aggregate (self, channel):
+
+        if channel.type is float:
+            command = 'SELECT COUNT (*), MIN (timestamp), MAX (timestamp), MIN (value), MAX (value), SUM (value) '
+        else:
+            command = 'SELECT COUNT (*), MIN (timestamp), MAX (timestamp), NULL, NULL, NULL '
+
+        command += 'FROM "{channel}"'.format (channel=channel.id)
+
+        return self.database.cursor.execute (command).fetchone ()
+
+    #
+    # Extend a channel query by time range, sort order and limit
+    #
+    # @return Tuple of (command, parameters)
+    #
+    def add_range_clause (self, command, start, end, limit, order):
+
+        conditions = []
+        params = []
+
+        if start is not None:
+            conditions.append ('timestamp >= ?')
+            params.append (start)
+
+        if end is not None:
+            conditions.append ('timestamp <= ?')
+            params.append (end)
+
+        if conditions:
+            command += ' WHERE ' + ' AND '.join (conditions)
+
+        command += ' ORDER BY timestamp ASC' if order is Order.ascending else ' ORDER BY timestamp DESC'
+
+        if limit is not None:
+            command += ' LIMIT ?'
+            params.append (limit)
+
+        return command, params
+
+
+#--------------------------------------------------------------------------
+# Storage engine splitting each channel into per month or per year SQLite tables
+#
+# The partition tables are named '<channel id>::<key>' with a key like '2017' for yearly
+# or '2017-06' for monthly partitions. Partitions are aligned to UTC and are created on
+# the first write into their time range. Reads spanning multiple partitions are routed
+# to the affected partitions and merged in timestamp order.
+#
+class PartitionedEngine (SQLiteEngine):
+
+    #
+    # Numpy datetime units of the supported partition intervals
+    #
+    UNITS = {Interval.month: 'M', Interval.year: 'Y'}
+
+    #
+    # Constructor
+    #
+    # @param database Database the engine is storing the channel content for
+    # @param interval Partition interval (Interval.month or Interval.year)
+    #
+    def __init__ (self, database, interval):
+
+        assert interval in PartitionedEngine.UNITS
+
+        super ().__init__ (database)
+
+        self.interval = interval
+        self.unit = PartitionedEngine.UNITS[interval]
+        self.partitions = None
+
+    #
+    # Return the sorted keys of the partitions present for a channel
+    #
+    # The partitions of all channels are read from the database once and kept until
+    # the next refresh.
+    #
+    def get_partitions (self, channel):
+
+        if self.partitions is None:
+
+            pattern = re.compile (r'^(.*)::(\d{4}-\d{2})$' if self.interval is Interval.month else r'^(.*)::(\d{4})$')
+
+            self.partitions = {}
+
+            for row in self.database.cursor.execute ('SELECT name FROM sqlite_master WHERE type=\'table\''):
+                match = pattern.match (row[0])
+
+                if match:
+                    self.partitions.setdefault (match.group (1), []).append (match.group (2))
+
+            for keys in self.partitions.values ():
+                keys.sort ()
+
+        return self.partitions.get (channel.id, [])
+
+    #
+    # Return the partition keys of epochs
+    #
+    # @param epochs Epoch seconds as int64 array
+    # @return Array of partition keys
+    #
+    def get_keys (self, epochs):
+        return np.datetime_as_string (epochs.astype ('datetime64[s]').astype ('datetime64[{unit}]'.format (unit=self.unit)))
+
+    #
+    # Return the epoch range covered by a partition
+    #
+    # @return Tuple of (first epoch, last epoch), both inclusive
+    #
+    def get_range (self, key):
+
+        start = np.datetime64 (key, self.unit)
+
+        return int (start.astype ('datetime64[s]').astype (np.int64)), \
+            int ((start + 1).astype ('datetime64[s]').astype (np.int64)) - 1
+
+    #
+    # Return a channel object addressing a single partition table
+    #
+    def get_partition (self, channel, key):
+
+        partition = copy.copy (channel)
+        partition.id = '{id}::{key}'.format (id=channel.id, key=key)
+
+        return partition
+
+    #
+    # Return the partitions of a channel overlapping an epoch range
+    #
+    # @return List of partition channels in the given order
+    #
+    def select (self, channel, start, end, order=Order.ascending):
+
+        partitions = []
+
+        for key in self.get_partitions (channel):
+            first, last = self.get_range (key)
+
+            if (start is None or last >= start) and (end is None or first <= end):
+                partitions.append (self.get_partition (channel, key))
+
+        return partitions if order is Order.ascending else list (reversed (partitions))
+
+    def refresh (self):
+        self.partitions = None
+
+    #
+    # Partitions are created on demand, so there is nothing to create upfront
+    #
+    def create (self, channel):
+        return len (self.get_partitions (channel)) > 0
+
+    def exists (self, channel, tables):
+        return True
+
+    def write (self, channel, params):
+
+        if not params:
+            return
+
+        keys = self.get_keys (np.array ([param[0] for param in params], dtype=np.int64))
+
+        for key in np.unique (keys):
+
+            partitions = self.get_partitions (channel)
+
+            if key not in partitions:
+                SQLiteEngine.create (self, self.get_partition (channel, key))
+
+                partitions.append (str (key))
+                partitions.sort ()
+                self.partitions[channel.id] = partitions
+
+            SQLiteEngine.write (self, self.get_partition (channel, key), [params[index] for index in np.flatnonzero (keys == key)])
+
+    def clear (self, channel):
+        for key in list (self.get_partitions (channel)):
+            self.drop (channel, key)
+
+    def read (self, channel, start, end, limit, order):
+
+        rows = []
+
+        for partition in self.select (channel, start, end, order):
+
+            rows += SQLiteEngine.read (self, partition, start, end, limit - len (rows) if limit is not None else None, order).fetchall ()
+
+            if limit is not None and len (rows) >= limit:
+                break
+
+        return rows
+
+    def read_array (self, channel, start, end):
+
+        rows = np.array (self.read (channel, start, end, None, Order.ascending), dtype=Engine.ARRAY_TYPE)
+        return np.ascontiguousarray (rows['timestamp']), np.ascontiguousarray (rows['value'])
+
+    def iterate (self, channel, start, end, chunk_size):
+
+        for partition in self.select (channel, start, end):
+            yield from SQLiteEngine.iterate (self, partition, start, end, chunk_size)
+
+    def count (self, channel, start, end):
+        return sum ([SQLiteEngine.count (self, partition, start, end) for partition in self.select (channel, start, end)])
+
+    def aggregate (self, channel):
+
+        results = [SQLiteEngine.aggregate (self, partition) for partition in self.select (channel, None, None)]
+        results = [result for result in results if result[0] > 0]
+
+        if not results:
+            return 0, None, None, None, None, None
+
+        count = sum ([result[0] for result in results])
+
+        if channel.type is not float:
+            return count, results[0][1], results[-1][2], None, None, None
+
+        return count, results[0][1], results[-1][2], \
+            min ([result[3] for result in results]), max ([result[4] for result in results]), sum ([result[5] for result in results])
+
+    #
+    # Compute aggregated values over a single partition of a channel
+    #
+    def aggregate_partition (self, channel, key):
+        return SQLiteEngine.aggregate (self, self.get_partition (channel, key))
+
+    #
+    # Drop a partition of a channel
+    #
+    # @param channel Channel to drop the partition from
+    # @param key     Key of the partition
+    #
+    def drop (self, channel, key):
+
+        assert key in self.get_partitions (channel)
+
+        self.database.cursor.execute ('DROP TABLE "{table}"'.format (table=self.get_partition (channel, key).id))
+        self.partitions[channel.id].remove (key)
@@ -10,7 +10,12 @@ import math
 import numpy as np
 import scraper
 
+from datetime import timedelta
+
+from core.common import Interval
 from core.config import Configuration
+from core.time import Timestamp
+from core.time import TimestampArray
 from database.database import Database
 
 #----------------------------------------------------------------------------
@@ -60,45 +65,63 @@ class Generator:
     # Will prepare the data in the databases channels for as training input
     # for the LSTM
     #
+    # For coarse training runs, the closing values of the channel rollups can be used
+    # instead of the raw samples.
+    #
     # @param database  Database to fetch the channels from
     # @param batchsize Size of a training batch
+    # @param interval  Rollup interval the sequences are sampled in ('None' for raw samples)
     #
-    def __init__ (self, database, batchsize):
+    def __init__ (self, database, batchsize, interval=None):
 
         self.database = database
         self.batchsize = batchsize
+        self.step = Configuration.DATABASE_SAMPLING_STEP
+
+        if interval is not None:
+            self.step = timedelta (seconds=Database.ROLLUP_INTERVALS[interval])
 
         #
         # Compute timespan in which training data is available and the channels
-        # which are providing a numeric data stream
+        # which are providing a numeric data stream. For raw samples, this is derived
+        # from the coverage bitmaps and only the content of the complete block is read.
         #
-        timestamps = self.create_timestamp_map ()
+        channels = sorted ([channel.id for channel in database.get_all_channels () if channel.type is float])
+
+        if interval is None:
+            self.timestamps, self.mask = database.get_coverage (channels)
+        else:
+            self.timestamps, values, self.mask = database.get_aligned (channels, interval=interval)
+
+        if len (self.timestamps) == 0:
+            raise RuntimeError ('No numeric data available')
 
-        self.start = min (timestamps.keys ())
-        self.end = max (timestamps.keys ())
+        self.start = Timestamp (int (self.timestamps[0]))
+        self.end = Timestamp (int (self.timestamps[-1]))
 
-        self.channels = []
-        for k, v in timestamps.items ():
-            self.channels.extend (v)
-        self.channels = sorted (list (set (self.channels)))
+        present = self.mask.any (axis=0)
 
-        timestamps = {k: v for k, v in timestamps.items () if len (v) == len (self.channels)}
+        self.channels = [channel for channel, used in zip (channels, present) if used]
+        self.mask = self.mask[:, present]
 
         #
-        # Compute the time span with complete data which can be used for training
+        # Compute the time span with complete data which can be used for training. This
+        # is the last continuous run of steps where all channels are providing data.
         #
-        keys = sorted (timestamps.keys ())
+        runs = TimestampArray.from_sorted (self.timestamps[self.mask.all (axis=1)]).runs (self.step)
 
-        self.block_end = keys[-1] if keys else None
-        self.block_start = self.block_end.copy ()
+        self.block_start = None
+        self.block_end = None
+        self.data = np.zeros ((0, len (self.channels)))
 
-        if self.block_end:
-            previous = self.block_start.copy ()
-            previous.advance (step=-Configuration.DATABASE_SAMPLING_STEP)
+        if runs:
+            self.block_start, self.block_end = runs[-1]
 
-            while previous in timestamps:
-                self.block_start = previous.copy ()
-                previous.advance (step=-Configuration.DATABASE_SAMPLING_STEP)
+            if interval is None:
+                self.data = database.get_aligned (self.channels, self.block_start, self.block_end)[1]
+            else:
+                first, last = np.searchsorted (self.timestamps, [self.block_start.epoch (), self.block_end.epoch ()])
+                self.data = values[first:last + 1, present]
 
         if self.get_number_of_sequences () < 1:
             raise RuntimeError ('Batchsize too large for available data')
@@ -113,7 +136,10 @@ class Generator:
     # Return number of steps in the continuous data interval
     #
     def get_number_of_steps (self):
-        return int (math.floor ((self.block_end - self.block_start) / Configuration.DATABASE_SAMPLING_STEP))
+        if self.block_start is None:
+            return 0
+
+        return int (math.floor ((self.block_end - self.block_start) / self.step))
 
     #
     # Return number of available sequences
@@ -135,69 +161,15 @@ class Generator:
             raise RuntimeError ('Index {index} out of bounds. There are {sequences} valid sequences.'
                                 .format (index=index, sequences=self.get_number_of_sequences ()))
 
-        input_data = np.zeros ((self.batchsize, len (self.channels)))
-        expected_data = np.zeros ((1, len (self.channels)))
-
-        for x in range (len (self.channels)):
-            channel = self.channels[x]
-
-            entries = database.get (channel)
-
-            #
-            # Build input data array
-            #
-            for y in range (self.batchsize):
-                assert index + y < len (entries)
-                entry = entries[index + y]
-
-                if not isinstance (entry.value, float):
-                    raise RuntimeError ('Non numeric data present in channel \'{channel}\' at position {position}'
-                                        .format (channel=channel.id, position=index + y))
-
-                input_data[y][x] = entry.value
-
-            #
-            # Build expected data array
-            #
-            assert index + self.batchsize < len (entries)
-            entry = entries[index + self.batchsize]
-
-            if not isinstance (entry.value, float):
-                raise RuntimeError ('Non numeric data present in channel \'{channel}\' at position {position}'
-                                    .format (channel=channel.id, position=index + y))
-
-            expected_data[0][x] = entry.value
+        #
+        # The first 'batchsize' samples are the input data, the following one is the
+        # expected outcome
+        #
+        input_data = self.data[index:index + self.batchsize].copy ()
+        expected_data = self.data[index + self.batchsize:index + self.batchsize + 1].copy ()
 
         return Sequence (input_data, expected_data)
 
-    #
-    # Return all timestamps available in the database together with the ids of the
-    # channels contributing to these.
-    #
-    # Only channels containing float data are considered.
-    #
-    # @return Map of {timestamp: [channel ids]} format
-    #
-    def create_timestamp_map (self):
-
-        timestamps = {}
-
-        for channel in database.get_all_channels ():
-
-            if channel.type is float:
-
-                for entry in database.get (channel.id):
-
-                    if entry.timestamp not in timestamps:
-                        timestamps[entry.timestamp] = [channel.id]
-                    else:
-                        timestamps[entry.timestamp].append (channel.id)
-
-        for key in timestamps.keys ():
-            timestamps[key].sort ()
-
-        return timestamps
-
 
 #----------------------------------------------------------------------------
 # MAIN
@@ -207,30 +179,30 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser ()
 
     parser.add_argument ('-b', '--batchsize', type=int, default=50, help='Training batchsize / sequence length')
+    parser.add_argument ('-i', '--interval', type=str, default=None, choices=['day', 'week'], help='Rollup interval to sample in')
     parser.add_argument ('-p', '--password', type=str, default=None, help='Passwort for database encryption')
     parser.add_argument ('database', type=str, default=':memory:', help='Database file')
 
     args = parser.parse_args ()
 
     database = Database (args.database, args.password)
-    generator = Generator (database, args.batchsize)
+    interval = Interval[args.interval] if args.interval is not None else None
+
+    with database.snapshot ():
+        generator = Generator (database, args.batchsize, interval)
 
     #
     # Compute the channel which is limiting the number of sequences
     #
-    timestamps = generator.create_timestamp_map ()
     limiting_channels = '-'
 
-    if generator.block_start != generator.start:
-
-        t = generator.block_start.copy ()
-        assert generator.block_start in timestamps
+    if generator.block_start is not None and generator.block_start != generator.start:
 
-        channels_block_start = set (timestamps[t])
-        t.advance (step=-Configuration.DATABASE_SAMPLING_STEP)
+        index = np.flatnonzero (generator.timestamps == generator.block_start.epoch ())[0]
+        previous = generator.mask[index - 1]
 
-        if t in timestamps:
-            limiting_channels = [x for x in channels_block_start if x not in timestamps[t]]
+        if previous.any ():
+            limiting_channels = [channel for channel, present in zip (generator.channels, previous) if not present]
         else:
             limiting_channels = 'all'
 
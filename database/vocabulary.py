@@ -0,0 +1,386 @@
+#!/usr/bin/python3
+#
+# vocabulary.py - Token interning for text channels
+#
+# Frank Blankenburg, Jul. 2017
+#
+
+import json
+import numpy as np
+import zlib
+
+
+#--------------------------------------------------------------------------
+# Vocabulary mapping the tokens of text channels to integer ids
+#
+# Text channels with token encoding are storing JSON token lists like the ones created
+# by the twitter scraper. Instead of the JSON text, each entry is stored as a blob of
+# variable length encoded token ids. The token strings itself are kept only once in the
+# vocabulary table.
+#
+# Blob layout: One format byte (FORMAT_PLAIN or FORMAT_ZLIB) followed by the token ids
+# as unsigned LEB128 varints, optionally zlib compressed.
+#
+# Each entry is compressed on its own, because entries must stay individually keyed by
+# timestamp to be overwritten. So only long entries are compressed at all, the size
+# reduction of typical entries is due to the token ids.
+#
+class Vocabulary:
+
+    FORMAT_PLAIN = 0
+    FORMAT_ZLIB  = 1
+
+    #
+    # Blobs up to this size are never compressed, zlib would only add overhead
+    #
+    COMPRESSION_THRESHOLD = 64
+
+    #
+    # Constructor
+    #
+    # @param database Database containing the vocabulary table
+    # @param table    Id of the vocabulary table
+    #
+    def __init__ (self, database, table):
+
+        self.database = database
+        self.table = table
+        self.ids = None
+        self.tokens = None
+        self.arrays = None
+
+    #
+    # Drop cached vocabulary so that it is reloaded from the database on next access
+    #
+    def refresh (self):
+        self.ids = None
+        self.tokens = None
+        self.arrays = None
+
+    #
+    # Load vocabulary from the database if not already present
+    #
+    def load (self):
+
+        if self.ids is None:
+
+            command = 'SELECT id, token FROM "{table}" ORDER BY id ASC'.format (table=self.table)
+
+            self.ids = {}
+            self.tokens = []
+
+            for row in self.database.cursor.execute (command):
+                assert row[0] == len (self.tokens)
+
+                self.ids[row[1]] = row[0]
+                self.tokens.append (row[1])
+
+    #
+    # Return the ids of a list of tokens
+    #
+    # Unknown tokens are added to the vocabulary. This is done within the running
+    # transaction of the database, so the vocabulary must be refreshed if that
+    # transaction is rolled back.
+    #
+    def get_ids (self, tokens):
+
+        self.load ()
+
+        missing = []
+
+        for token in tokens:
+            if token not in self.ids:
+                self.ids[token] = len (self.tokens)
+                self.tokens.append (token)
+                missing.append ((self.ids[token], token))
+
+        if missing:
+            command = 'INSERT INTO "{table}" (id, token) values (?, ?)'.format (table=self.table)
+            self.database.cursor.executemany (command, missing)
+
+        return [self.ids[token] for token in tokens]
+
+    #
+    # Return the ids of the tokens which are present in the vocabulary
+    #
+    # In contrast to 'get_ids', unknown tokens are skipped instead of being added.
+    #
+    def find_ids (self, tokens):
+
+        self.load ()
+
+        ids = []
+
+        for token in tokens:
+            if token in self.ids:
+                ids.append (self.ids[token])
+
+            #
+            # The token might have been added by another process in the meantime
+            #
+            else:
+                command = 'SELECT id FROM "{table}" WHERE token=?'.format (table=self.table)
+                ids += [row[0] for row in self.database.cursor.execute (command, (token,))]
+
+        return ids
+
+    #
+    # Return the tokens of a list of ids
+    #
+    def get_tokens (self, ids):
+
+        self.load ()
+
+        try:
+            return [self.tokens[id] for id in ids]
+
+        #
+        # Tokens might have been added by another process in the meantime
+        #
+        except IndexError:
+            self.refresh ()
+            self.load ()
+
+        return [self.tokens[id] for id in ids]
+
+    #
+    # Convert JSON token list into token ids
+    #
+    # @param value JSON encoded list of token strings or a plain text entry
+    # @return List of token ids
+    #
+    def parse (self, value):
+
+        tokens = json.loads (value)
+        assert isinstance (tokens, list)
+
+        return self.get_ids ([str (token) for token in tokens])
+
+    #
+    # Pack token ids into blob
+    #
+    def pack (self, ids):
+
+        data = bytearray ()
+
+        for id in ids:
+            while id >= 0x80:
+                data.append ((id & 0x7f) | 0x80)
+                id >>= 7
+            data.append (id)
+
+        if len (data) > Vocabulary.COMPRESSION_THRESHOLD:
+            compressed = zlib.compress (bytes (data))
+
+            if len (compressed) < len (data):
+                return bytes ([Vocabulary.FORMAT_ZLIB]) + compressed
+
+        return bytes ([Vocabulary.FORMAT_PLAIN]) + bytes (data)
+
+    #
+    # Unpack blob into token ids
+    #
+    # Entries written before the channel has been switched to token encoding are
+    # stored as plain text and are parsed instead.
+    #
+    def unpack (self, value):
+
+        if isinstance (value, str):
+            return self.parse (value)
+
+        data = value[1:]
+
+        if value[0] == Vocabulary.FORMAT_ZLIB:
+            data = zlib.decompress (data)
+        else:
+            assert value[0] == Vocabulary.FORMAT_PLAIN
+
+        #
+        # Fast path: All ids are below 128 and encoded as a single byte
+        #
+        if not data or max (data) < 0x80:
+            return list (data)
+
+        ids = []
+        id = 0
+        shift = 0
+
+        for byte in data:
+            id |= (byte & 0x7f) << shift
+            shift += 7
+
+            if not byte & 0x80:
+                ids.append (id)
+                id = 0
+                shift = 0
+
+        return ids
+
+    #
+    # Unpack a list of blobs into token ids
+    #
+    # The varints of all blobs are decoded together in a few array operations instead
+    # of byte by byte.
+    #
+    # @param values List of blobs as created by 'pack'
+    # @return Tuple of (token ids of all blobs as int64 array, list of len (values) + 1
+    #         offsets of the ids of each blob in that array)
+    #
+    def unpack_many (self, values):
+
+        blobs = [value if value[0] == Vocabulary.FORMAT_PLAIN else
+                 bytes ([Vocabulary.FORMAT_PLAIN]) + zlib.decompress (value[1:]) for value in values]
+
+        lengths = np.fromiter (map (len, blobs), dtype=np.int64, count=len (blobs))
+        boundaries = np.zeros (len (blobs) + 1, dtype=np.int64)
+        np.cumsum (lengths, out=boundaries[1:])
+
+        #
+        # Strip the format bytes
+        #
+        data = np.frombuffer (b''.join (blobs), dtype=np.uint8)
+        payload = np.ones (len (data), dtype=bool)
+        payload[boundaries[:-1]] = False
+
+        data = data[payload].astype (np.int64)
+        boundaries -= np.arange (len (blobs) + 1)
+
+        #
+        # Fast path: All ids are below 128 and encoded as a single byte
+        #
+        if len (data) == 0 or data.max () < 0x80:
+            return data, boundaries.tolist ()
+
+        #
+        # Each varint ends with a byte without continuation bit. The bytes are shifted
+        # by their position within the varint and summed up per varint.
+        #
+        ends = (data & 0x80) == 0
+        starts = np.concatenate (([True], ends[:-1]))
+
+        positions = np.arange (len (data))
+        shifts = 7 * (positions - np.maximum.accumulate (np.where (starts, positions, 0)))
+
+        ids = np.add.reduceat ((data & 0x7f) << shifts, np.flatnonzero (starts))
+
+        counts = np.zeros (len (data) + 1, dtype=np.int64)
+        np.cumsum (ends, out=counts[1:])
+
+        return ids, counts[boundaries].tolist ()
+
+    #
+    # Return the arrays of the token strings and their JSON representations
+    #
+    # The arrays are indexed by token id and are rebuilt after tokens have been added.
+    #
+    def get_arrays (self):
+
+        self.load ()
+
+        if self.arrays is None or len (self.arrays[0]) != len (self.tokens):
+            self.arrays = (np.array (self.tokens, dtype=object),
+                           np.array ([json.dumps (token) for token in self.tokens], dtype=object))
+
+        return self.arrays
+
+    #
+    # Look up token ids in one of the arrays returned by 'get_arrays'
+    #
+    # @param ids   Token ids as int64 array
+    # @param index Index of the array (0 for the token strings, 1 for their JSON representations)
+    # @return List of the looked up values
+    #
+    def lookup (self, ids, index):
+
+        #
+        # Tokens might have been added by another process in the meantime
+        #
+        if len (ids) > 0 and ids.max () >= len (self.get_arrays ()[index]):
+            self.refresh ()
+
+        return self.get_arrays ()[index][ids].tolist ()
+
+    #
+    # Convert a list of values into token lists
+    #
+    # @param values List of blobs or JSON encoded plain text entries
+    # @return List of token string lists
+    #
+    def get_token_lists (self, values):
+
+        positions = [n for n, value in enumerate (values) if not isinstance (value, str)]
+
+        ids, offsets = self.unpack_many ([values[n] for n in positions])
+        tokens = self.lookup (ids, 0)
+
+        token_lists = [tokens[first:last] for first, last in zip (offsets, offsets[1:])]
+
+        return self.merge (values, positions, token_lists, json.loads)
+
+    #
+    # Decode a list of blobs into JSON token lists
+    #
+    # The JSON representations of the tokens are joined directly, so no token list is
+    # serialized per entry. Entries stored as plain text are returned unchanged.
+    #
+    # @param values List of blobs as created by 'encode' or plain text entries
+    # @return List of JSON encoded token lists
+    #
+    def decode_many (self, values):
+
+        positions = [n for n, value in enumerate (values) if not isinstance (value, str)]
+
+        if not positions:
+            return list (values)
+
+        ids, offsets = self.unpack_many ([values[n] for n in positions])
+        tokens = self.lookup (ids, 1)
+
+        decoded = ['[' + ', '.join (tokens[first:last]) + ']' for first, last in zip (offsets, offsets[1:])]
+
+        return self.merge (values, positions, decoded, lambda value: value)
+
+    #
+    # Merge the results for the blobs in a list of values with the plain text entries
+    #
+    # @param values    List of blobs and plain text entries
+    # @param positions Indices of the blobs in 'values'
+    # @param results   Results for the blobs
+    # @param convert   Conversion function for the plain text entries
+    # @return List of results for all values
+    #
+    def merge (self, values, positions, results, convert):
+
+        if len (positions) == len (values):
+            return results
+
+        merged = [convert (value) if isinstance (value, str) else None for value in values]
+
+        for position, result in zip (positions, results):
+            merged[position] = result
+
+        return merged
+
+    #
+    # Encode JSON token list into blob
+    #
+    # @param value JSON encoded list of token strings
+    # @return Blob as 'bytes'
+    #
+    def encode (self, value):
+        return self.pack (self.parse (value))
+
+    #
+    # Decode blob into JSON token list
+    #
+    # Entries stored as plain text are returned unchanged.
+    #
+    # @param value Blob as created by 'encode' or plain text
+    # @return JSON encoded list of token strings
+    #
+    def decode (self, value):
+
+        if isinstance (value, str):
+            return value
+
+        return json.dumps (self.get_tokens (self.unpack (value)))
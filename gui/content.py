@@ -6,36 +6,25 @@
 #
 
 import argparse
-import copy
-import numpy as np
-import math
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
-from datetime import timedelta
-
 from core.config import Configuration
-from core.common import Interval
 from core.time import Timestamp
+from core.time import TimestampArray
 from database.database import Database
-from database.database import Entry
 
 
 #----------------------------------------------------------------------------
 # CLASS TimestampFormatter
 #
-class TimestampFormatter (mpl.ticker.OldScalarFormatter):
+class TimestampFormatter (mpl.ticker.Formatter):
 
-    def __init__ (self, start, step):
-        self.start = start
-        self.step = step
+    def __init__ (self, timestamps):
+        self.timestamps = timestamps
 
     def __call__ (self, x, pos=None):
-
-        t = copy.copy (self.start)
-        t.advance (step=int (x) * step)
-
-        return t
+        return str (self.timestamps[int (x)]) if 0 <= int (x) < len (self.timestamps) else ''
 
 #----------------------------------------------------------------------------
 # MAIN
@@ -55,67 +44,22 @@ if __name__ == '__main__':
     database = Database (args.database, args.password)
 
     #
-    # Fetch all entries from database and compute earliest entry. The latest entry is
-    # always expected to be at the current date.
+    # The displayed time span starts at the configured database start date. The latest
+    # entry is always expected to be at the current date.
     #
     minimum_timestamp = Timestamp (Configuration.DATABASE_START_DATE)
     maximum_timestamp = Timestamp.now ()
 
-    diff = maximum_timestamp - minimum_timestamp
-    number_of_steps = 0
-    step = None
-
-    if Configuration.DATABASE_SAMPLING_INTERVAL is Interval.day:
-        number_of_steps = abs (diff.days)
-        step = timedelta (days=1)
-    elif Configuration.DATABASE_SAMPLING_INTERVAL is Interval.hour:
-        number_of_steps = int (math.floor (abs (diff.days) * 24 + abs (diff.seconds) / 60 / 60))
-        step = timedelta (hours=1)
-    elif Configuration.DATABASE_SAMPLING_INTERVAL is Interval.minute:
-        number_of_steps = int (math.floor (abs (diff.days) * 24 * 60 + abs (diff.seconds) / 60))
-        step = timedelta (minutes=1)
-
-    #
-    # Count the number of different entries in the database
-    #
-    ids = []
-
-    for t in Database.types:
-
-        #
-        # Only entries which do not represent pure administrative records are displayed
-        #
-        if t.get_data_type () is not Entry.Type.administration:
-            entries = database.get_entries (t.ID)
-            entry_ids = set (map (lambda entry: entry.id, entries))
-
-            ids.extend (list (zip (len (entry_ids) * [t.ID], list (entry_ids))))
-
-    ids = sorted (ids)
-
     #
-    # Build array showing the sampling state
+    # Build array showing the sampling state of all numeric channels from the coverage
+    # bitmaps, so the channel content itself is not read
     #
-    state = np.zeros ((len (ids), number_of_steps))
-
-    for y in range (len (ids)):
-
-        table_id = ids[y][0]
-        entry_id = ids[y][1]
-        t = minimum_timestamp
-
-        entries = database.get_entries (table_id)
-
-        timestamps = []
-        for entry in entries:
-            if entry.id == entry_id:
-                timestamps.append (entry.timestamp)
+    ids = sorted ([channel.id for channel in database.get_all_channels () if channel.type is float])
 
-        timestamps = set (timestamps)
+    with database.snapshot ():
+        timestamps, mask = database.get_coverage (ids, minimum_timestamp, maximum_timestamp)
+    state = mask.T.astype (float)
 
-        for x in range (number_of_steps):
-            state[y][x] = 1.0 if t in timestamps else 0.0
-            t += step
     #
     # Setup custom discrete colormap
     #
@@ -129,9 +73,9 @@ if __name__ == '__main__':
     #
     axis.set_xlabel ('Timestamp')
     axis.set_ylabel ('Dataset')
-    axis.xaxis.set_major_formatter (TimestampFormatter (minimum_timestamp, step))
+    axis.xaxis.set_major_formatter (TimestampFormatter (TimestampArray.from_sorted (timestamps)))
 
-    plt.yticks (range (len (ids)), ['{0} ({1})'.format (id[1], id[0]) for id in ids], rotation='horizontal')
+    plt.yticks (range (len (ids)), ids, rotation='horizontal')
 
     #
     # Display content diagram
@@ -8,32 +8,36 @@
 import argparse
 import matplotlib.pyplot as plt
 
+from core.common import Interval
 from database.database import Database
-from database.database import CoinEntry
 
 #
 # Plot database content
 #
-def plot (database):
-
-    entries = database.get_entries (CoinEntry.ID)
-
-    parts = {}
+# All channels containing float data are plotted in separate subplots
+#
+# @param database Database to plot
+# @param interval Rollup interval to plot the daily / weekly closing values ('None' for raw samples)
+#
+def plot (database, interval=None):
 
-    for entry in entries:
+    channels = [channel for channel in database.get_all_channels () if channel.type is float]
 
-        if entry.id not in parts:
-            parts[entry.id] = []
+    with database.snapshot ():
 
-        parts[entry.id].append ((entry.timestamp, entry.course))
+        count = 1
+        for channel in sorted (channels, key=lambda channel: channel.id):
+            if interval is not None:
+                rollup = database.get_rollup (channel.id, interval)
+                timestamps, values = rollup['timestamp'], rollup['close']
+            else:
+                timestamps, values = database.get_array (channel.id)
 
-    count = 1
-    for coin in sorted (list (parts.keys ())):
-        plt.subplot (len (coin), 1, count)
-        plt.plot ([m[0] for m in parts[coin]], [m[1] for m in parts[coin]])
-        plt.ylabel (coin)
+            plt.subplot (len (channels), 1, count)
+            plt.plot (timestamps.astype ('datetime64[s]'), values)
+            plt.ylabel (channel.id)
 
-        count += 1
+            count += 1
 
     plt.show ()
 
@@ -47,6 +51,7 @@ if __name__ == '__main__':
     # Parse command line arguments
     #
     parser = argparse.ArgumentParser ()
+    parser.add_argument ('-i', '--interval', type=str, default=None, choices=['day', 'week'], help='Plot rollups of the given interval')
     parser.add_argument ('database',  type=str, default=None, help='Database file')
 
     args = parser.parse_args ()
@@ -54,4 +59,4 @@ if __name__ == '__main__':
     assert args.database is not None
 
     database = Database (args.database)
-    plot (database)
+    plot (database, Interval[args.interval] if args.interval is not None else None)
@@ -7,6 +7,7 @@
 
 import api.cryptocompare
 import core
+import functools
 import pandas as pd
 
 from core.common import Interval
@@ -25,6 +26,8 @@ class CryptoCompareScraper (Scraper):
 
     ID = 'CryptoCompare'
 
+    MAX_WORKERS = 4
+
     def __init__ (self):
         super ().__init__ (CryptoCompareScraper.ID)
 
@@ -67,6 +70,20 @@ class CryptoCompareScraper (Scraper):
     #
     def run (self, database, start, end, interval, log):
 
+        for part in self.get_parts ():
+            part (database, start, end, interval, log)
+
+    #
+    # Each channel is fetched separately and can be scraped concurrently
+    #
+    def get_parts (self):
+        return [functools.partial (self.run_channel, channel) for channel in self.get_channels ()]
+
+    #
+    # Run scraper for a single channel
+    #
+    def run_channel (self, channel, database, start, end, interval, log):
+
         assert isinstance (start, Timestamp)
         assert isinstance (end, Timestamp)
         assert isinstance (interval, Interval)
@@ -77,51 +94,54 @@ class CryptoCompareScraper (Scraper):
 
         client = api.cryptocompare.CryptoCompare ()
 
+        add_to_log ('Scraping information for {channel}'.format (channel=channel.id))
+
         #
-        # Iterate over each channel
+        # We are scraping backwards in time because the CryptoCompare REST API will only
+        # support a 'to timestamp' parameter.
         #
-        for channel in self.get_channels ():
-            add_to_log ('Scraping information for {channel}'.format (channel=channel.id))
+        try:
+            to = end.copy ()
 
-            #
-            # We are scraping backwards in time because the CryptoCompare REST API will only
-            # support a 'to timestamp' parameter.
-            #
-            try:
-                to = end
+            entries = []
 
-                entries = []
+            ok = True
+            while ok and to >= start:
 
-                ok = True
-                while ok and to >= start:
+                token = self.split_channel_id (channel.id).token
+                add_to_log ('Fetching information for {token} until {to}'.format (token=token, to=to))
 
-                    token = self.split_channel_id (channel.id).token
-                    add_to_log ('Fetching information for {token} until {to}'.format (token=token, to=to))
+                #
+                # Request just the slots still missing, but at least two entries to allow
+                # filtering invalid responses
+                #
+                limit = (to.epoch () - start.epoch ()) // int (Configuration.DATABASE_SAMPLING_STEP.total_seconds ()) + 1
+                limit = min (max (limit, 2), api.cryptocompare.CryptoCompare.limit)
 
-                    prices = client.get_historical_prices (id=token, to=to, interval=interval)
-                    ok = False
+                prices = client.get_historical_prices (id=token, to=to, interval=interval, limit=limit)
+                ok = False
 
-                    for price in prices:
-                        price_time = Timestamp (price['time'])
-                        price = (price['high'] + price['low']) / 2
+                for price in prices:
+                    price_time = Timestamp (price['time'])
+                    price = (price['high'] + price['low']) / 2
 
-                        #
-                        # The REST API returns '0' for times where no information is available instead of
-                        # raising an exception.
-                        #
-                        if price_time >= Timestamp (Configuration.DATABASE_START_DATE) and price > 0:
-                            entries.append (Entry (timestamp=price_time, value=price))
+                    #
+                    # The REST API returns '0' for times where no information is available instead of
+                    # raising an exception.
+                    #
+                    if price_time >= Timestamp (Configuration.DATABASE_START_DATE) and price > 0:
+                        entries.append (Entry (timestamp=price_time, value=price))
 
-                        if price_time < to:
-                            to = price_time
-                            ok = True
+                    if price_time < to:
+                        to = price_time
+                        ok = True
 
-                    to.advance (step=-Configuration.DATABASE_SAMPLING_STEP)
+                to.advance (step=-Configuration.DATABASE_SAMPLING_STEP)
 
-                database.add (channel.id, entries)
+            database.add (channel.id, entries)
 
-            except api.cryptocompare.HTTPError as e:
-                add_to_log ('ERROR: {error}'.format (error=e.message))
+        except api.cryptocompare.HTTPError as e:
+            add_to_log ('ERROR: {error}'.format (error=e.message))
 
 
 #--------------------------------------------------------------------------
@@ -13,6 +13,18 @@ from core.common import AttrDict
 #
 class Scraper (ABC):
 
+    #
+    # Maximum number of parts of this scraper which are run concurrently, for example to
+    # stay within the rate limits of the data source
+    #
+    MAX_WORKERS = 1
+
+    #
+    # If the data source can be queried for arbitrary time ranges. Scrapers which can only
+    # fetch the latest data are run once over all data holes instead of once per hole.
+    #
+    RANGE_QUERIES = True
+
     #
     # Constructor
     #
@@ -43,6 +55,17 @@ class Scraper (ABC):
     def run (self, database, start, end, interval, log):
         pass
 
+    #
+    # Split scraper run into independent parts which can be run concurrently
+    #
+    # The default is a single part covering all channels. Scrapers fetching their channels
+    # separately can return one part per channel instead.
+    #
+    # @return List of functions with the same parameters as 'run'
+    #
+    def get_parts (self):
+        return [self.run]
+
     #
     # Split channel id into scraper id / token id
     #
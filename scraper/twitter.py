@@ -12,6 +12,7 @@
 
 import argparse
 import codecs
+import functools
 import nltk.corpus
 import pandas as pd
 import re
@@ -35,6 +36,11 @@ class TwitterScraper (Scraper):
     ID = 'Twitter'
     APP_NAME = 'AssetMind'
 
+    #
+    # The search API returns the latest tweets only
+    #
+    RANGE_QUERIES = False
+
     OAUTH_CHANNEL_ID = 'OAuth'
     CHANNELS = { 'ETH': ['ethereum'],
                  'BTC': ['bitcoin'] }
@@ -78,7 +84,7 @@ class TwitterScraper (Scraper):
         for channel in TwitterScraper.CHANNELS.keys ():
             channels.append (Channel (id=TwitterScraper.ID + '::' + channel,
                                       description='Twitter stream ({0})'.format (channel),
-                                      type_id=str))
+                                      type_id=str, encoding=Channel.ENCODING_TOKENS))
 
         return channels
 
@@ -134,6 +140,23 @@ class TwitterScraper (Scraper):
     # @param log      Callback for logging outputs
     #
     def run (self, database, start, end, interval, log):
+
+        for part in self.get_parts ():
+            part (database, start, end, interval, log)
+
+    #
+    # Each channel is a separate search query and can be scraped concurrently
+    #
+    def get_parts (self):
+        return [functools.partial (self.run_channel, channel, tags) for channel, tags in TwitterScraper.CHANNELS.items ()]
+
+    #
+    # Run scraper for a single channel
+    #
+    # @param channel Channel token
+    # @param tags    Tags to search for
+    #
+    def run_channel (self, channel, tags, database, start, end, interval, log):
         credentials = self.get_credentials (database)
 
         server = twitter.Twitter (auth=twitter.OAuth (credentials['access_key'],
@@ -141,20 +164,18 @@ class TwitterScraper (Scraper):
                                                       credentials['consumer_key'],
                                                       credentials['consumer_secret']))
 
-        for channel, tags in TwitterScraper.CHANNELS.items ():
-
-            query = server.search.tweets (q=' '.join (tags), count=100)
-            entries = []
+        query = server.search.tweets (q=' '.join (tags), count=100)
+        entries = []
 
-            for q in query['statuses']:
+        for q in query['statuses']:
 
-                tweet = self.to_string (q['text'])
-                tweet = self.tokenize (tweet)
-                tweet = [token if self.emoticon_regexp.search (token) else token.lower () for token in tweet]
+            tweet = self.to_string (q['text'])
+            tweet = self.tokenize (tweet)
+            tweet = [token if self.emoticon_regexp.search (token) else token.lower () for token in tweet]
 
-                entries.append (Entry (timestamp=Timestamp (q['created_at']), value=json.dumps (tweet)))
+            entries.append (Entry (timestamp=Timestamp (q['created_at']), value=json.dumps (tweet)))
 
-            database.add (TwitterScraper.ID + '::' + channel, entries)
+        database.add (TwitterScraper.ID + '::' + channel, entries)
 
     #
     # Print feed summany
@@ -5,6 +5,7 @@
 # Frank Blankenburg, Jun. 2017
 #
 
+import threading
 import unittest
 
 from datetime import timedelta
@@ -30,7 +31,7 @@ class TestScraper (Scraper):
     def __init__ (self):
         super ().__init__ (TestScraper.ID)
 
-        self.refresh = (None, None)
+        self.refresh = []
 
     def get_channels (self):
 
@@ -43,7 +44,41 @@ class TestScraper (Scraper):
 
 
     def run (self, database, start, end, interval, log):
-        self.refresh = (start, end)
+        self.refresh.append ((start, end))
+
+
+#--------------------------------------------------------------------------
+# CLASS TestParallelScraper
+#
+# Scraper with two channels which are fetched concurrently
+#
+class TestParallelScraper (Scraper):
+
+    ID = 'Parallel'
+    MAX_WORKERS = 2
+
+    def __init__ (self, barrier):
+        super ().__init__ (TestParallelScraper.ID)
+
+        self.barrier = barrier
+
+    def get_channels (self):
+        return [Channel (id='{scraper}::{token}'.format (scraper=TestParallelScraper.ID, token=token),
+                         description='Test channel', type_id=float) for token in ['A', 'B']]
+
+    def get_parts (self):
+        return [lambda *args, channel=channel: self.run_channel (channel, *args) for channel in self.get_channels ()]
+
+    def run (self, database, start, end, interval, log):
+        for part in self.get_parts ():
+            part (database, start, end, interval, log)
+
+    def run_channel (self, channel, database, start, end, interval, log):
+
+        self.barrier.wait ()
+
+        log ('Scraping {id}'.format (id=channel.id))
+        database.add (channel.id, Entry (start, 1.0))
 
 
 #--------------------------------------------------------------------------
@@ -53,7 +88,20 @@ class TestAcquirer (unittest.TestCase):
 
     Configuration.DATABASE_SAMPLING_INTERVAL = Interval.hour
     Configuration.DATABASE_SAMPLING_STEP = timedelta (hours=1)
-    ScraperRegistry.register (TestScraper ())
+
+    #
+    # Use the test scraper exclusively and restore the scrapers registered by other
+    # test modules afterwards
+    #
+    def setUp (self):
+        self.scrapers = ScraperRegistry.scrapers
+        self.scraper = TestScraper ()
+
+        ScraperRegistry.scrapers = {}
+        ScraperRegistry.register (self.scraper)
+
+    def tearDown (self):
+        ScraperRegistry.scrapers = self.scrapers
 
     #
     # Test if the acquirer detects the correct gaps in the sampled timestamps
@@ -71,28 +119,123 @@ class TestAcquirer (unittest.TestCase):
 
         database.add ('Test::TST', entries)
 
-        scr = TestScraper ()
-        ScraperRegistry.scrapers = {}
-        ScraperRegistry.register (scr)
-
+        scr = self.scraper
         acquirer = Acquirer ()
 
-        scr.refresh = (None, None)
+        scr.refresh = []
         acquirer.run (database, Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 16:00'))
-        self.assertEqual (scr.refresh[0], Timestamp ('2017-08-12 12:00'))
-        self.assertEqual (scr.refresh[1], Timestamp ('2017-08-12 13:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 13:00'))])
 
-        scr.refresh = (None, None)
+        scr.refresh = []
         acquirer.run (database, Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 17:00'))
-        self.assertEqual (scr.refresh[0], Timestamp ('2017-08-12 12:00'))
-        self.assertEqual (scr.refresh[1], Timestamp ('2017-08-12 13:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 13:00'))])
 
-        scr.refresh = (None, None)
+        scr.refresh = []
         acquirer.run (database, Timestamp ('2017-08-12 14:00'), Timestamp ('2017-08-12 19:00'))
-        self.assertEqual (scr.refresh[0], Timestamp ('2017-08-12 18:00'))
-        self.assertEqual (scr.refresh[1], Timestamp ('2017-08-12 19:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 18:00'), Timestamp ('2017-08-12 19:00'))])
 
-        scr.refresh = (None, None)
+        scr.refresh = []
         acquirer.run (database, Timestamp ('2017-08-12 14:00'), Timestamp ('2017-08-12 17:00'))
-        self.assertEqual (scr.refresh[0], None)
-        self.assertEqual (scr.refresh[1], None)
+        self.assertEqual (scr.refresh, [])
+
+        #
+        # Holes on both sides are fetched separately unless they are close enough
+        # to be merged
+        #
+        scr.refresh = []
+        Acquirer (merge_distance=timedelta (hours=4)).run (database, Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 19:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 13:00')),
+                                        (Timestamp ('2017-08-12 18:00'), Timestamp ('2017-08-12 19:00'))])
+
+        scr.refresh = []
+        Acquirer (merge_distance=timedelta (hours=5)).run (database, Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 19:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 19:00'))])
+
+        #
+        # Scrapers which cannot fetch time ranges are run once for all holes
+        #
+        scr.refresh = []
+        scr.RANGE_QUERIES = False
+        acquirer.run (database, Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 19:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 19:00'))])
+
+    #
+    # Test concurrent scraper execution with all writes done by the calling thread
+    #
+    def test_parallel_execution (self):
+
+        #
+        # All three scraper parts must be running at the same time to pass the barrier
+        #
+        barrier = threading.Barrier (3, timeout=10)
+
+        scr = TestParallelScraper (barrier)
+        ScraperRegistry.register (scr)
+
+        self.scraper.run = lambda *args: barrier.wait ()
+
+        database = Database (':memory:')
+        lines = []
+
+        changes = Acquirer ().run (database, Timestamp ('2017-08-12 12:00'), Timestamp ('2017-08-12 16:00'), log=lines.append)
+
+        self.assertEqual (sorted ([change.id for change in changes]), ['Parallel::A', 'Parallel::B'])
+        self.assertEqual (len (database.get ('Parallel::A')), 1)
+        self.assertTrue ('    Parallel: Scraping Parallel::B' in lines)
+
+    #
+    # Test incremental acquisition starting at the latest stored entry
+    #
+    def test_tail (self):
+
+        database = Database (':memory:')
+
+        scr = self.scraper
+        acquirer = Acquirer ()
+
+        acquirer.run_tail (database, Timestamp ('2017-08-12 19:00'))
+        self.assertEqual (scr.refresh, [(Timestamp (Configuration.DATABASE_START_DATE), Timestamp ('2017-08-12 19:00'))])
+
+        database.add ('Test::TST', [Entry (Timestamp ('2017-08-12 14:00'), 10.0),
+                                    Entry (Timestamp ('2017-08-12 17:00'), 12.0)])
+
+        scr.refresh = []
+        acquirer.run_tail (database, Timestamp ('2017-08-12 19:00'))
+        self.assertEqual (scr.refresh, [(Timestamp ('2017-08-12 17:00'), Timestamp ('2017-08-12 19:00'))])
+
+        scr.refresh = []
+        acquirer.run_tail (database, Timestamp ('2017-08-12 16:00'))
+        self.assertEqual (scr.refresh, [])
+
+    #
+    # Test continuous acquisition waiting for the sampling step boundaries
+    #
+    def test_daemon (self):
+
+        class TestStop (threading.Event):
+
+            def __init__ (self):
+                super ().__init__ ()
+                self.timeouts = []
+
+            def wait (self, timeout=None):
+                self.timeouts.append (timeout)
+
+                if len (self.timeouts) == 2:
+                    self.set ()
+
+                return self.is_set ()
+
+        database = Database (':memory:')
+        stop = TestStop ()
+
+        self.scraper.run = lambda *args: 1 / 0
+        lines = []
+
+        Acquirer ().run_daemon (database, stop, jitter=timedelta (seconds=10), log=lines.append)
+
+        self.assertEqual (len (stop.timeouts), 2)
+        self.assertEqual (len ([line for line in lines if line.startswith ('ERROR')]), 2)
+
+        for timeout in stop.timeouts:
+            self.assertTrue (0 < timeout <= 3600 + 10)
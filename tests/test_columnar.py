@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+#
+# test_columnar.py - Unittest
+#
+# Frank Blankenburg, Jul. 2017
+#
+
+import os
+import re
+import tempfile
+import unittest
+import unittest.mock
+import urllib.parse
+
+from datetime import timedelta
+
+from core.common import Interval
+from core.common import Order
+from core.config import Configuration
+from core.time import Timestamp
+from scraper.scraper import Scraper
+from scraper.scraper import ScraperRegistry
+
+from database.columnar import ColumnarEngine
+from database.database import Database
+from database.database import Entry
+from database.database import Channel
+
+
+#--------------------------------------------------------------------------
+# CLASS TestColumnarScraper
+#
+class TestColumnarScraper (Scraper):
+
+    ID = 'Columnar'
+
+    def __init__ (self):
+        super ().__init__ (TestColumnarScraper.ID)
+
+    def get_channels (self):
+
+        channels = []
+
+        channels.append (Channel (id='{scraper}::ETH'.format (scraper=TestColumnarScraper.ID),
+                                  description='Ethereum course', type_id=float))
+        channels.append (Channel (id='{scraper}::Twitter::ETH'.format (scraper=TestColumnarScraper.ID),
+                                  description='Twitter channel', type_id=str))
+
+        return channels
+
+    def run (self, database, start, end, interval, log):
+        pass
+
+
+#--------------------------------------------------------------------------
+# CLASS TestColumnar
+#
+class TestColumnar (unittest.TestCase):
+
+    Configuration.DATABASE_SAMPLING_INTERVAL = Interval.hour
+    Configuration.DATABASE_SAMPLING_STEP = timedelta (hours=1)
+    ScraperRegistry.register (TestColumnarScraper ())
+
+    #
+    # Create list of entries with the given hours and values
+    #
+    def create_entries (self, hours, offset=0.0):
+        return [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour) + offset) for hour in hours]
+
+    #
+    # Test appending, merging and reading of channel content
+    #
+    def test_columnar_read_write (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            database = Database (os.path.join (directory, 'columnar.db'), engine=Database.ENGINE_COLUMNAR)
+            self.assertTrue (isinstance (database.float_engine, ColumnarEngine))
+
+            database.add ('Columnar::ETH', self.create_entries ([10, 11, 12]))
+            database.add ('Columnar::ETH', self.create_entries ([14, 15]))
+
+            timestamps, values = database.get_array ('Columnar::ETH')
+            self.assertEqual (list (values), [10.0, 11.0, 12.0, 14.0, 15.0])
+
+            #
+            # Late and overwriting samples are merged into the existing content
+            #
+            database.add ('Columnar::ETH', self.create_entries ([9, 11, 13], offset=0.5))
+
+            timestamps, values = database.get_array ('Columnar::ETH')
+            self.assertEqual (list (values), [9.5, 10.0, 11.5, 12.0, 13.5, 14.0, 15.0])
+            self.assertEqual (list (timestamps), sorted (timestamps))
+
+            timestamps, values = database.get_array ('Columnar::ETH', Timestamp ('2017-06-18 11:00'), Timestamp ('2017-06-18 13:00'))
+            self.assertEqual (list (values), [11.5, 12.0, 13.5])
+
+            entries = database.get ('Columnar::ETH', limit=2, order=Order.descending)
+            self.assertEqual ([entry.value for entry in entries], [15.0, 14.0])
+            self.assertEqual (entries[0].timestamp, Timestamp ('2017-06-18 15:00'))
+
+            self.assertEqual (database.count ('Columnar::ETH', start=Timestamp ('2017-06-18 12:00')), 4)
+
+            chunks = list (database.iter ('Columnar::ETH', chunk_size=3))
+            self.assertEqual ([len (chunk) for chunk in chunks], [3, 3, 1])
+            self.assertEqual (chunks[1][0].value, 12.0)
+
+            chunks = list (database.iter ('Columnar::ETH', end=Timestamp ('2017-06-18 12:00'), chunk_size=2, array=True))
+            self.assertEqual ([list (chunk[1]) for chunk in chunks], [[9.5, 10.0], [11.5, 12.0]])
+
+            statistics = database.get_statistics ('Columnar::ETH')
+            self.assertEqual (statistics.count, 7)
+            self.assertEqual (statistics.minimum, 9.5)
+            self.assertEqual (statistics.last, 15.0)
+
+            #
+            # Text channels are still stored in the SQLite database
+            #
+            database.add ('Columnar::Twitter::ETH', Entry (timestamp=Timestamp ('2017-06-18 10:00'), value='["a"]'))
+            self.assertEqual (database.get ('Columnar::Twitter::ETH')[0].value, '["a"]')
+
+            database.connection.close ()
+
+            #
+            # The engine is detected automatically when opening the database again
+            #
+            database = Database (os.path.join (directory, 'columnar.db'))
+            self.assertTrue (isinstance (database.float_engine, ColumnarEngine))
+
+            timestamps, values = database.get_array ('Columnar::ETH')
+            self.assertEqual (len (values), 7)
+
+            #
+            # Temporary files of a failed backup are removed
+            #
+            with unittest.mock.patch.object (ColumnarEngine, 'copy', side_effect=RuntimeError ('Copy failed')):
+                with self.assertRaises (RuntimeError):
+                    database.backup (os.path.join (directory, 'backup.db'))
+
+            self.assertEqual ([file for file in os.listdir (directory) if file.startswith ('backup.db')], [])
+
+            #
+            # Column files are part of the backup. Stale column files of an interrupted
+            # backup are not.
+            #
+            os.makedirs (os.path.join (directory, 'backup.db.tmp.columns'))
+
+            with open (os.path.join (directory, 'backup.db.tmp.columns', 'stale.epoch'), 'wb') as output:
+                output.write (b'stale')
+
+            database.backup (os.path.join (directory, 'backup.db'))
+            database.connection.close ()
+
+            self.assertFalse ('stale.epoch' in os.listdir (os.path.join (directory, 'backup.db.columns')))
+
+            database = Database (os.path.join (directory, 'backup.db'))
+            self.assertTrue (isinstance (database.float_engine, ColumnarEngine))
+
+            timestamps, values = database.get_array ('Columnar::ETH')
+            self.assertEqual (list (values), [9.5, 10.0, 11.5, 12.0, 13.5, 14.0, 15.0])
+
+            database.connection.close ()
+
+    #
+    # Return the column files of a channel
+    #
+    def get_files (self, database, channel):
+        name = urllib.parse.quote (channel.id, safe='')
+        return [file for file in os.listdir (database.float_engine.directory) if re.match (re.escape (name) + r'[.@]', file)]
+
+    #
+    # Test that interrupted and failed writes are not leaving inconsistent content
+    #
+    def test_columnar_consistency (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            database = Database (os.path.join (directory, 'columnar.db'), engine=Database.ENGINE_COLUMNAR)
+            channel = database.get_channel ('Columnar::ETH')
+
+            database.add ('Columnar::ETH', self.create_entries ([10, 11, 12]))
+
+            #
+            # An append interrupted in between the two columns leaves an orphan epoch
+            # which is ignored and overwritten
+            #
+            generation, size = database.float_engine.get_state (channel)
+
+            with open (database.float_engine.get_file (channel, 'epoch', generation), 'ab') as file:
+                file.write (ColumnarEngine.EPOCH_TYPE.type (Timestamp ('2017-06-18 13:00').epoch ()).tobytes ())
+
+            database.float_engine.refresh ()
+            self.assertEqual (len (database.get_array ('Columnar::ETH')[0]), 3)
+
+            database.add ('Columnar::ETH', self.create_entries ([14]))
+
+            timestamps, values = database.get_array ('Columnar::ETH')
+            self.assertEqual (list (values), [10.0, 11.0, 12.0, 14.0])
+            self.assertEqual (timestamps[-1], Timestamp ('2017-06-18 14:00').epoch ())
+
+            #
+            # Failing writes are reverted together with the database transaction
+            #
+            update_rollups = database.update_rollups
+
+            def fail (*args):
+                raise RuntimeError ('Failed')
+
+            for hours in [[15, 16], [9, 13]]:
+
+                database.update_rollups = fail
+
+                with self.assertRaises (RuntimeError):
+                    database.add ('Columnar::ETH', self.create_entries (hours, offset=0.5))
+
+                database.update_rollups = update_rollups
+
+                self.assertEqual (list (database.get_array ('Columnar::ETH')[1]), [10.0, 11.0, 12.0, 14.0])
+                self.assertEqual (database.get_statistics ('Columnar::ETH').count, 4)
+                self.assertEqual (len (self.get_files (database, channel)), 2)
+
+            #
+            # Merges are written into new files, so arrays returned before are unchanged
+            # and the files of the former generation are removed
+            #
+            before = database.get_array ('Columnar::ETH')
+
+            database.add ('Columnar::ETH', self.create_entries ([9, 11], offset=0.5))
+            database.add ('Columnar::ETH', self.create_entries ([15]))
+
+            self.assertEqual (list (before[1]), [10.0, 11.0, 12.0, 14.0])
+            self.assertEqual (list (database.get_array ('Columnar::ETH')[1]), [9.5, 10.0, 11.5, 12.0, 14.0, 15.0])
+            self.assertEqual (database.get_gaps (['Columnar::ETH'], Timestamp ('2017-06-18 09:00'), Timestamp ('2017-06-18 15:00')),
+                              [(Timestamp ('2017-06-18 13:00'), Timestamp ('2017-06-18 13:00'))])
+            self.assertEqual (len (self.get_files (database, channel)), 2)
+
+            database.connection.close ()
+            del before
+
+            database = Database (os.path.join (directory, 'columnar.db'))
+            self.assertEqual (list (database.get_array ('Columnar::ETH')[1]), [9.5, 10.0, 11.5, 12.0, 14.0, 15.0])
+
+            database.connection.close ()
+
+    #
+    # Test reads of the columns written by another connection
+    #
+    def test_columnar_snapshot (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'columnar.db')
+
+            writer = Database (file, engine=Database.ENGINE_COLUMNAR, wal=True)
+            reader = Database (file)
+
+            writer.add ('Columnar::ETH', self.create_entries ([10]))
+            self.assertEqual (len (reader.get_array ('Columnar::ETH')[0]), 1)
+
+            writer.add ('Columnar::ETH', self.create_entries ([11]))
+            self.assertEqual (len (reader.get_array ('Columnar::ETH')[0]), 2)
+            self.assertEqual (len (reader.get ('Columnar::ETH')), reader.get_statistics ('Columnar::ETH').count)
+
+            with reader.snapshot ():
+                writer.add ('Columnar::ETH', self.create_entries ([12]))
+                writer.add ('Columnar::ETH', self.create_entries ([9]))
+
+                self.assertEqual (list (reader.get_array ('Columnar::ETH')[1]), [10.0, 11.0])
+                self.assertEqual (reader.get_statistics ('Columnar::ETH').count, 2)
+
+            self.assertEqual (list (reader.get_array ('Columnar::ETH')[1]), [9.0, 10.0, 11.0, 12.0])
+
+            reader.close ()
+            writer.close ()
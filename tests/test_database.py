@@ -5,15 +5,28 @@
 # Frank Blankenburg, Jun. 2017
 #
 
+import gzip
+import json
+import numpy as np
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
 import unittest
+import unittest.mock
+
+from datetime import timedelta
 
 from core.common import Interval
+from core.common import Order
 from core.config import Configuration
 from core.encryption import Encryption
 from core.time import Timestamp
 from scraper.scraper import Scraper
 from scraper.scraper import ScraperRegistry
 
+from database.columnar import ColumnarEngine
 from database.database import Database
 from database.database import Entry
 from database.database import Channel
@@ -44,6 +57,9 @@ class TestDatabaseScraper (Scraper):
                                   description='Bitcoin course', type_id=float))
         channels.append (Channel (id='{scraper}::Twitter::ETH'.format (scraper=TestDatabaseScraper.ID),
                                   description='Twitter channel', type_id=str))
+        channels.append (Channel (id='{scraper}::Twitter::BTC'.format (scraper=TestDatabaseScraper.ID),
+                                  description='Token encoded twitter channel', type_id=str,
+                                  encoding=Channel.ENCODING_TOKENS))
 
         return channels
 
@@ -66,6 +82,7 @@ class TestDatabaseScraper (Scraper):
 class TestDatabase (unittest.TestCase):
 
     Configuration.DATABASE_SAMPLING_INTERVAL = Interval.hour
+    Configuration.DATABASE_SAMPLING_STEP = timedelta (hours=1)
     ScraperRegistry.register (TestDatabaseScraper ())
 
     #
@@ -166,3 +183,839 @@ class TestDatabase (unittest.TestCase):
         self.assertEqual (database.get_credential ('Test::Text1'), text1)
         self.assertEqual (database.get_credential ('Test::Text2'), text2)
         self.assertEqual (database.get_credential ('Test::Text3'), None)
+
+        credentials = database.get_credentials (['Test::Text1', 'Test::Text2', 'Test::Text3'])
+        self.assertEqual (credentials, {'Test::Text1': text1, 'Test::Text2': text2, 'Test::Text3': None})
+
+        #
+        # Change password
+        #
+        database.rekey ('secret2')
+
+        self.assertEqual (database.password, 'secret2')
+        self.assertEqual (database.get_credential ('Test::Text1'), text1)
+
+        database.password = 'secret'
+        self.assertEqual (database.get_credential ('Test::Text1'), None)
+
+        with self.assertRaises (RuntimeError):
+            database.rekey ('secret3')
+
+    #
+    # Test if tables of older database versions are migrated to a unique timestamp key
+    #
+    def test_database_legacy_table (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'legacy.db')
+
+            #
+            # Older database versions were storing the epochs of local time
+            #
+            epoch = int (time.mktime ((2017, 6, 18, 12, 0, 0, 0, 0, -1)))
+
+            connection = sqlite3.connect (file)
+            connection.execute ('CREATE TABLE "internal::channels" (id VARCHAR (64), description MEMO, type VARCHAR (64))')
+            connection.execute ('INSERT INTO "internal::channels" VALUES (?, ?, ?)', ('Test::ETH', 'Ethereum course', 'float'))
+            connection.execute ('CREATE TABLE "Test::ETH" (timestamp LONG NOT NULL, value REAL)')
+            connection.execute ('INSERT INTO "Test::ETH" VALUES (?, ?)', (epoch, 1.0))
+            connection.execute ('INSERT INTO "Test::ETH" VALUES (?, ?)', (epoch, 2.0))
+            connection.commit ()
+            connection.close ()
+
+            database = Database (file)
+
+            entries = database.get ('Test::ETH')
+            self.assertEqual (len (entries), 1)
+            self.assertEqual (entries[0].value, 2.0)
+            self.assertEqual (database.get_statistics ('Test::ETH').count, 1)
+            self.assertEqual (list (database.get_rollup ('Test::ETH', Interval.day)['close']), [2.0])
+
+            database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=3.0))
+
+            entries = database.get ('Test::ETH')
+            self.assertEqual (len (entries), 1)
+            self.assertEqual (entries[0].value, 3.0)
+            self.assertEqual (database.get_statistics ('Test::ETH').last, 3.0)
+
+    #
+    # Test time range queries
+    #
+    def test_database_range (self):
+
+        database = Database (':memory:')
+
+        entries = []
+        for hour in range (10, 20):
+            entries.append (Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour)))
+
+        database.add ('Test::ETH', list (reversed (entries)))
+
+        result = database.get ('Test::ETH')
+        self.assertEqual ([entry.value for entry in result], [float (hour) for hour in range (10, 20)])
+
+        result = database.get ('Test::ETH', start=Timestamp ('2017-06-18 12:00'), end=Timestamp ('2017-06-18 14:00'))
+        self.assertEqual ([entry.value for entry in result], [12.0, 13.0, 14.0])
+
+        result = database.get ('Test::ETH', start=Timestamp ('2017-06-18 17:00'))
+        self.assertEqual ([entry.value for entry in result], [17.0, 18.0, 19.0])
+
+        result = database.get ('Test::ETH', limit=2, order=Order.descending)
+        self.assertEqual ([entry.value for entry in result], [19.0, 18.0])
+
+        self.assertEqual (database.count ('Test::ETH'), 10)
+        self.assertEqual (database.count ('Test::ETH', end=Timestamp ('2017-06-18 11:00')), 2)
+
+    #
+    # Test token encoded text channels
+    #
+    def test_database_tokens (self):
+
+        database = Database (':memory:')
+
+        tweets = [json.dumps (['bitcoin', 'price', 'moon']),
+                  json.dumps (['bitcoin', 'crash']),
+                  json.dumps ([]),
+                  json.dumps (['bitcoin', 'price'] * 100)]
+
+        database.add ('Test::Twitter::BTC', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (10 + n)), value=tweet)
+                                             for n, tweet in enumerate (tweets)])
+
+        self.assertEqual ([entry.value for entry in database.get ('Test::Twitter::BTC')], tweets)
+        self.assertEqual ([entry.value for chunk in database.iter ('Test::Twitter::BTC', chunk_size=3) for entry in chunk], tweets)
+
+        #
+        # Entries are stored as token id blobs, each token only once in the vocabulary
+        #
+        rows = database.cursor.execute ('SELECT value FROM "Test::Twitter::BTC" ORDER BY timestamp').fetchall ()
+        self.assertTrue (all ([isinstance (row[0], bytes) for row in rows]))
+        self.assertEqual (rows[0][0], bytes ([0, 0, 1, 2]))
+        self.assertTrue (len (rows[3][0]) < 50)
+
+        tokens = database.cursor.execute ('SELECT token FROM "internal::vocabulary" ORDER BY id').fetchall ()
+        self.assertEqual ([row[0] for row in tokens], ['bitcoin', 'price', 'moon', 'crash'])
+
+        #
+        # Entries stored as plain text before are returned unchanged
+        #
+        database.cursor.execute ('INSERT INTO "Test::Twitter::BTC" VALUES (?, ?)', (Timestamp ('2017-06-18 09:00').epoch (), '["old"]'))
+        self.assertEqual (database.get ('Test::Twitter::BTC', limit=1)[0].value, '["old"]')
+
+        self.assertEqual (database.get_channel ('Test::Twitter::BTC').encoding, Channel.ENCODING_TOKENS)
+        self.assertEqual (database.get_statistics ('Test::Twitter::BTC').count, 4)
+
+        #
+        # Token lists are read without conversion into JSON. Ids above 127 are spanning
+        # multiple bytes.
+        #
+        more = [json.dumps (['token{0}'.format (n * 10 + m) for m in range (n % 12)]) for n in range (40)]
+
+        database.add ('Test::Twitter::BTC', [Entry (timestamp=Timestamp (Timestamp ('2017-06-19 00:00').epoch () + n * 3600), value=tweet)
+                                             for n, tweet in enumerate (more)])
+
+        chunks = list (database.iter ('Test::Twitter::BTC', chunk_size=16, tokens=True))
+
+        self.assertEqual ([len (chunk[0]) for chunk in chunks], [16, 16, 13])
+        self.assertEqual (int (chunks[0][0][0]), Timestamp ('2017-06-18 09:00').epoch ())
+        self.assertEqual ([tokens for chunk in chunks for tokens in chunk[1]], [json.loads (tweet) for tweet in ['["old"]'] + tweets + more])
+
+        self.assertEqual ([entry.value for entry in database.get ('Test::Twitter::BTC')], ['["old"]'] + tweets + more)
+
+        #
+        # Blobs are still decoded after the channel has been switched back to plain text
+        #
+        database.get_channel ('Test::Twitter::BTC').encoding = None
+        self.assertEqual ([entry.value for entry in database.get ('Test::Twitter::BTC')], ['["old"]'] + tweets + more)
+
+    #
+    # Test inverted index of token encoded text channels
+    #
+    def test_database_search (self):
+
+        database = Database (':memory:')
+
+        database.add ('Test::Twitter::BTC', [Entry (timestamp=Timestamp ('2017-06-18 10:00'), value=json.dumps (['bitcoin', 'price', 'bitcoin'])),
+                                             Entry (timestamp=Timestamp ('2017-06-18 11:00'), value=json.dumps (['crash'])),
+                                             Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=json.dumps (['price', 'moon']))])
+
+        timestamps, counts = database.search ('Test::Twitter::BTC', 'bitcoin')
+        self.assertEqual (list (timestamps), [Timestamp ('2017-06-18 10:00').epoch ()])
+        self.assertEqual (list (counts), [2])
+
+        timestamps, counts = database.search ('Test::Twitter::BTC', ['bitcoin', 'moon', 'unknown'])
+        self.assertEqual (list (timestamps), [Timestamp ('2017-06-18 10:00').epoch (), Timestamp ('2017-06-18 12:00').epoch ()])
+        self.assertEqual (list (counts), [2, 1])
+
+        timestamps, counts = database.search ('Test::Twitter::BTC', 'price', start=Timestamp ('2017-06-18 11:00'))
+        self.assertEqual (list (counts), [1])
+
+        timestamps, counts = database.search ('Test::Twitter::BTC', 'unknown')
+        self.assertEqual (len (timestamps), 0)
+
+        #
+        # Overwritten entries are removed from the index
+        #
+        database.add ('Test::Twitter::BTC', Entry (timestamp=Timestamp ('2017-06-18 10:00'), value=json.dumps (['moon'])))
+
+        timestamps, counts = database.search ('Test::Twitter::BTC', 'bitcoin')
+        self.assertEqual (len (timestamps), 0)
+
+        timestamps, counts = database.search ('Test::Twitter::BTC', 'moon')
+        self.assertEqual (len (timestamps), 2)
+
+    #
+    # Test if entries written while a channel was stored as plain text are found after
+    # switching back to token encoding
+    #
+    def test_database_search_encoding (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'search.db')
+
+            database = Database (file)
+            database.add ('Test::Twitter::BTC', Entry (timestamp=Timestamp ('2017-06-18 10:00'), value=json.dumps (['bitcoin'])))
+            database.close ()
+
+            scraper = ScraperRegistry.get (TestDatabaseScraper.ID)
+            channels = scraper.get_channels ()
+
+            for channel in channels:
+                channel.encoding = None
+
+            with unittest.mock.patch.object (scraper, 'get_channels', return_value=channels):
+                database = Database (file)
+                database.add ('Test::Twitter::BTC', Entry (timestamp=Timestamp ('2017-06-18 11:00'), value=json.dumps (['bitcoin', 'moon'])))
+                database.close ()
+
+            database = Database (file)
+
+            timestamps, counts = database.search ('Test::Twitter::BTC', 'bitcoin')
+            self.assertEqual (list (timestamps), [Timestamp ('2017-06-18 10:00').epoch (), Timestamp ('2017-06-18 11:00').epoch ()])
+
+            timestamps, counts = database.search ('Test::Twitter::BTC', 'moon')
+            self.assertEqual (list (timestamps), [Timestamp ('2017-06-18 11:00').epoch ()])
+
+            database.close ()
+
+    #
+    # Test rollups of float channels
+    #
+    def test_database_rollups (self):
+
+        database = Database (':memory:')
+
+        entries = []
+        for value, timestamp in enumerate (['2017-06-18 22:00', '2017-06-18 23:00', '2017-06-19 00:00',
+                                            '2017-06-19 01:00', '2017-06-19 02:00']):
+            entries.append (Entry (timestamp=Timestamp (timestamp), value=float (value + 1)))
+
+        database.add ('Test::ETH', list (reversed (entries)))
+
+        rollup = database.get_rollup ('Test::ETH', Interval.day)
+        self.assertEqual (len (rollup), 2)
+        self.assertEqual (rollup[0]['timestamp'], Timestamp ('2017-06-18 00:00').epoch ())
+        self.assertEqual ([rollup[1][column] for column in ['open', 'high', 'low', 'close', 'mean', 'count']],
+                          [3.0, 5.0, 3.0, 5.0, 4.0, 3])
+
+        #
+        # 2017-06-19 is a monday, so a new week starts
+        #
+        rollup = database.get_rollup ('Test::ETH', Interval.week)
+        self.assertEqual (list (rollup['timestamp']), [Timestamp ('2017-06-12 00:00').epoch (),
+                                                       Timestamp ('2017-06-19 00:00').epoch ()])
+        self.assertEqual (list (rollup['count']), [2, 3])
+
+        #
+        # Overwriting a sample updates the buckets it falls into
+        #
+        database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-19 01:00'), value=10.0))
+
+        rollup = database.get_rollup ('Test::ETH', Interval.day, start=Timestamp ('2017-06-19 12:00'))
+        self.assertEqual (len (rollup), 1)
+        self.assertEqual ([rollup[0][column] for column in ['open', 'high', 'low', 'close', 'mean', 'count']],
+                          [3.0, 10.0, 3.0, 5.0, 6.0, 3])
+
+        timestamps, values, mask = database.get_aligned (['Test::ETH'], interval=Interval.day)
+        self.assertEqual (list (values[:, 0]), [2.0, 5.0])
+
+    #
+    # Test chunked iteration over channel content
+    #
+    def test_database_iter (self):
+
+        database = Database (':memory:')
+
+        entries = []
+        for hour in range (10, 20):
+            entries.append (Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour)))
+
+        database.add ('Test::ETH', entries)
+
+        chunks = list (database.iter ('Test::ETH', chunk_size=4))
+        self.assertEqual ([len (chunk) for chunk in chunks], [4, 4, 2])
+        self.assertEqual ([entry.value for chunk in chunks for entry in chunk], [float (hour) for hour in range (10, 20)])
+
+        chunks = list (database.iter ('Test::ETH', start=Timestamp ('2017-06-18 12:00'), chunk_size=3, array=True))
+        self.assertEqual ([len (chunk[0]) for chunk in chunks], [3, 3, 2])
+        self.assertEqual (list (chunks[0][1]), [12.0, 13.0, 14.0])
+        self.assertEqual (chunks[0][0][0], Timestamp ('2017-06-18 12:00').epoch ())
+
+        #
+        # Writes are possible while iterating
+        #
+        for chunk in database.iter ('Test::Twitter::ETH'):
+            pass
+
+        for chunk in database.iter ('Test::ETH', chunk_size=5):
+            database.add ('Test::Twitter::ETH', Entry (timestamp=chunk[0].timestamp, value='["a"]'))
+
+        self.assertEqual (database.count ('Test::Twitter::ETH'), 2)
+
+    #
+    # Test array based access to float channels
+    #
+    def test_database_array (self):
+
+        database = Database (':memory:')
+
+        entries = []
+        entries.append (Entry (timestamp=Timestamp ('2017-06-18 14:00'), value=3.0))
+        entries.append (Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=1.0))
+        entries.append (Entry (timestamp=Timestamp ('2017-06-18 13:00'), value=2.0))
+
+        database.add ('Test::ETH', entries)
+
+        timestamps, values = database.get_array ('Test::ETH')
+
+        self.assertEqual (timestamps.dtype, np.int64)
+        self.assertEqual (values.dtype, np.float64)
+        self.assertEqual (list (timestamps), [Timestamp ('2017-06-18 {0}:00'.format (hour)).epoch () for hour in [12, 13, 14]])
+        self.assertEqual (list (values), [1.0, 2.0, 3.0])
+
+        timestamps, values = database.get_array ('Test::ETH', start=Timestamp ('2017-06-18 13:00'))
+        self.assertEqual (list (values), [2.0, 3.0])
+
+        timestamps, values = database.get_array ('Test::BTC')
+        self.assertEqual (len (timestamps), 0)
+        self.assertEqual (len (values), 0)
+
+    #
+    # Test aligned multi channel access
+    #
+    def test_database_aligned (self):
+
+        database = Database (':memory:')
+
+        database.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour))
+                                    for hour in [10, 11, 12, 14]])
+        database.add ('Test::BTC', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour) * 10)
+                                    for hour in [11, 12, 13]])
+
+        timestamps, values, mask = database.get_aligned (['Test::ETH', 'Test::BTC'])
+
+        self.assertEqual (list (timestamps), [Timestamp ('2017-06-18 {0}:00'.format (hour)).epoch () for hour in range (10, 15)])
+        self.assertEqual (values.shape, (5, 2))
+        self.assertEqual (mask[:, 0].tolist (), [True, True, True, False, True])
+        self.assertEqual (mask[:, 1].tolist (), [False, True, True, True, False])
+        self.assertEqual (values[2].tolist (), [12.0, 120.0])
+        self.assertTrue (np.isnan (values[3, 0]))
+
+        timestamps, values, mask = database.get_aligned (['Test::ETH', 'Test::BTC'],
+                                                         start=Timestamp ('2017-06-18 10:00'),
+                                                         end=Timestamp ('2017-06-18 13:00'),
+                                                         step=timedelta (hours=2))
+
+        self.assertEqual (len (timestamps), 2)
+        self.assertEqual (values[:, 0].tolist (), [11.0, 12.0])
+        self.assertEqual (values[:, 1].tolist (), [110.0, 130.0])
+        self.assertTrue (mask.all ())
+
+    #
+    # Test if channel metadata is served from the in-process registry
+    #
+    def test_database_channel_cache (self):
+
+        database = Database (':memory:')
+        database.get_all_channels ()
+
+        statements = []
+        database.connection.set_trace_callback (lambda statement: statements.append (statement))
+
+        for hour in range (10, 15):
+            database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour)))
+            database.get ('Test::ETH')
+
+        self.assertEqual (database.get_channel ('Test::ETH').type, float)
+        self.assertEqual (database.get_channel ('Test::Twitter::ETH').type, str)
+        self.assertEqual (database.get_channel ('Test::XYZ'), None)
+        self.assertTrue ('Test::BTC' in [channel.id for channel in database.get_all_channels ()])
+
+        self.assertEqual ([statement for statement in statements if Database.CHANNELS_ID in statement], [])
+
+    #
+    # Test if opening an up to date database does not issue any schema operations
+    #
+    def test_database_startup (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'startup.db')
+
+            database = Database (file)
+            database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=1.0))
+            database.close ()
+
+            statements = []
+            connect = sqlite3.connect
+
+            def connect_traced (*args, **kwargs):
+                connection = connect (*args, **kwargs)
+                connection.set_trace_callback (lambda statement: statements.append (statement))
+                return connection
+
+            with unittest.mock.patch ('sqlite3.connect', connect_traced):
+                database = Database (file)
+
+            self.assertEqual (len (statements), 3)
+            self.assertEqual ([statement for statement in statements if 'CREATE' in statement or 'INSERT' in statement], [])
+            self.assertEqual (database.get ('Test::ETH')[0].value, 1.0)
+
+            database.close ()
+
+            #
+            # The storage engine is recorded in the database
+            #
+            with self.assertRaises (RuntimeError):
+                Database (file, engine=Database.ENGINE_COLUMNAR)
+
+            #
+            # Databases of newer versions are not opened
+            #
+            connection = sqlite3.connect (file)
+            connection.execute ('UPDATE "internal::schema" SET value=? WHERE key=?', (str (Database.SCHEMA_VERSION + 1), 'version'))
+            connection.commit ()
+            connection.close ()
+
+            with self.assertRaises (RuntimeError):
+                Database (file)
+
+            #
+            # The column files of the registered channels are not probed either
+            #
+            file = os.path.join (directory, 'columnar.db')
+
+            database = Database (file, engine=Database.ENGINE_COLUMNAR)
+            database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=1.0))
+            database.close ()
+
+            statements.clear ()
+
+            with unittest.mock.patch ('sqlite3.connect', connect_traced), \
+                 unittest.mock.patch.object (ColumnarEngine, 'get_state') as get_state:
+                database = Database (file)
+
+            self.assertEqual (len (statements), 3)
+            get_state.assert_not_called ()
+            self.assertEqual (database.get ('Test::ETH')[0].value, 1.0)
+
+            database.close ()
+
+    #
+    # Test change feed
+    #
+    def test_database_changes (self):
+
+        database = Database (':memory:')
+        self.assertEqual (database.get_sequence (), 0)
+
+        database.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour))
+                                    for hour in [12, 10, 11]])
+
+        sequence = database.get_sequence ()
+
+        database.add ('Test::BTC', Entry (timestamp=Timestamp ('2017-06-18 14:00'), value=1.0))
+        database.add ('Test::ETH', [])
+        database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 09:00'), value=1.0))
+
+        changes = database.changes_since (0)
+        self.assertEqual ([change.id for change in changes], ['Test::ETH', 'Test::BTC', 'Test::ETH'])
+        self.assertEqual (changes[0].start, Timestamp ('2017-06-18 10:00'))
+        self.assertEqual (changes[0].end, Timestamp ('2017-06-18 12:00'))
+        self.assertEqual (changes[0].count, 3)
+
+        changes = database.changes_since (sequence)
+        self.assertEqual ([change.id for change in changes], ['Test::BTC', 'Test::ETH'])
+        self.assertTrue (changes[0].sequence > sequence)
+        self.assertEqual (changes[-1].sequence, database.get_sequence ())
+
+        self.assertEqual (database.changes_since (database.get_sequence ()), [])
+
+    #
+    # Test read cache and its invalidation on writes
+    #
+    def test_database_cache (self):
+
+        database = Database (':memory:', cache_size=2)
+
+        database.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour))
+                                    for hour in range (10, 15)])
+        database.add ('Test::BTC', Entry (timestamp=Timestamp ('2017-06-18 10:00'), value=1.0))
+
+        early = (Timestamp ('2017-06-18 10:00'), Timestamp ('2017-06-18 11:00'))
+        late = (Timestamp ('2017-06-18 13:00'), Timestamp ('2017-06-18 14:00'))
+
+        self.assertEqual (len (database.get ('Test::ETH', *early)), 2)
+        self.assertEqual (len (database.get ('Test::ETH', *late)), 2)
+        self.assertEqual (len (database.get ('Test::ETH', *early)), 2)
+
+        statistics = database.get_cache_statistics ()
+        self.assertEqual ((statistics.hits, statistics.misses, statistics.size), (1, 2, 2))
+
+        #
+        # Only results overlapping the written range are invalidated
+        #
+        database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 13:00'), value=0.0))
+
+        self.assertEqual (database.get ('Test::ETH', *early)[0].value, 10.0)
+        self.assertEqual (database.get ('Test::ETH', *late)[0].value, 0.0)
+        self.assertEqual (database.get_cache_statistics ().hits, 2)
+
+        database.add ('Test::BTC', Entry (timestamp=Timestamp ('2017-06-18 11:00'), value=1.0))
+        database.get ('Test::ETH', *late)
+        self.assertEqual (database.get_cache_statistics ().hits, 3)
+
+        #
+        # Least recently used results are evicted
+        #
+        database.get ('Test::BTC')
+        database.get ('Test::ETH', *early)
+        self.assertEqual (database.get_cache_statistics ().misses, 5)
+
+        #
+        # Cached results are not affected by modifications of returned lists
+        #
+        database.get ('Test::BTC').clear ()
+        self.assertEqual (len (database.get ('Test::BTC')), 2)
+
+        database.get ('Test::BTC')[0].timestamp.advance (hours=1)
+        self.assertEqual (database.get ('Test::BTC')[0].timestamp, Timestamp ('2017-06-18 10:00'))
+
+    #
+    # Test time partitioned channel tables
+    #
+    def test_database_partitions (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'partitions.db')
+            database = Database (file, partition=Interval.month)
+
+            timestamps = ['2017-05-31 22:00', '2017-05-31 23:00', '2017-06-01 00:00', '2017-06-30 23:00', '2017-07-01 00:00']
+            database.add ('Test::ETH', [Entry (timestamp=Timestamp (timestamp), value=float (n)) for n, timestamp in enumerate (timestamps)])
+
+            self.assertEqual (database.get_partitions ('Test::ETH'), ['2017-05', '2017-06', '2017-07'])
+
+            self.assertEqual ([entry.value for entry in database.get ('Test::ETH')], [0.0, 1.0, 2.0, 3.0, 4.0])
+            self.assertEqual ([entry.value for entry in database.get ('Test::ETH', limit=3, order=Order.descending)], [4.0, 3.0, 2.0])
+            self.assertEqual ([entry.value for entry in database.get ('Test::ETH', start=Timestamp ('2017-05-31 23:00'),
+                                                                      end=Timestamp ('2017-06-01 00:00'))], [1.0, 2.0])
+
+            self.assertEqual (list (database.get_array ('Test::ETH')[1]), [0.0, 1.0, 2.0, 3.0, 4.0])
+            self.assertEqual ([len (chunk) for chunk in database.iter ('Test::ETH', chunk_size=2)], [2, 2, 1])
+            self.assertEqual (database.count ('Test::ETH', start=Timestamp ('2017-06-01 00:00')), 3)
+
+            #
+            # A failed drop leaves the partitions unchanged
+            #
+            with unittest.mock.patch.object (database, 'update_coverage', side_effect=sqlite3.OperationalError ('Disk full')):
+                with self.assertRaises (sqlite3.OperationalError):
+                    database.drop_partition ('Test::ETH', '2017-05')
+
+            self.assertEqual (database.get_partitions ('Test::ETH'), ['2017-05', '2017-06', '2017-07'])
+            self.assertEqual ([entry.value for entry in database.get ('Test::ETH')], [0.0, 1.0, 2.0, 3.0, 4.0])
+
+            #
+            # Dropping a partition corrects the derived data
+            #
+            database.drop_partition ('Test::ETH', '2017-05')
+
+            self.assertEqual (database.get_partitions ('Test::ETH'), ['2017-06', '2017-07'])
+            self.assertEqual ([entry.value for entry in database.get ('Test::ETH')], [2.0, 3.0, 4.0])
+
+            statistics = database.get_statistics ('Test::ETH')
+            self.assertEqual (statistics.count, 3)
+            self.assertEqual (statistics.start, Timestamp ('2017-06-01 00:00'))
+            self.assertEqual (statistics.minimum, 2.0)
+            self.assertEqual (statistics.mean, 3.0)
+
+            self.assertEqual (database.get_rollup ('Test::ETH', Interval.day)[0]['timestamp'], Timestamp ('2017-06-01 00:00').epoch ())
+            self.assertEqual (database.changes_since (0)[-1].count, 0)
+
+            self.assertEqual (database.get_gaps (['Test::ETH'], Timestamp ('2017-05-31 22:00'), Timestamp ('2017-06-01 00:00')),
+                              [(Timestamp ('2017-05-31 22:00'), Timestamp ('2017-05-31 23:00'))])
+
+            database.close ()
+
+            #
+            # The partitioning is recorded in the database
+            #
+            database = Database (file)
+            self.assertEqual (database.get_partitions ('Test::ETH'), ['2017-06', '2017-07'])
+            database.close ()
+
+            with self.assertRaises (RuntimeError):
+                Database (file, partition=Interval.year)
+
+            #
+            # Rollups of the remaining days in a week crossing the partition border are kept
+            #
+            database = Database (os.path.join (directory, 'rollups.db'), partition=Interval.month)
+
+            timestamps = [Timestamp (Timestamp ('2017-05-25').epoch () + day * 24 * 60 * 60) for day in range (14)]
+            database.add ('Test::ETH', [Entry (timestamp=timestamp, value=float (n)) for n, timestamp in enumerate (timestamps)])
+
+            database.drop_partition ('Test::ETH', '2017-06')
+
+            self.assertEqual (list (database.get_rollup ('Test::ETH', Interval.day)['timestamp']), [timestamp.epoch () for timestamp in timestamps[:7]])
+            self.assertEqual (list (database.get_rollup ('Test::ETH', Interval.week)['count']), [4, 3])
+
+            database.close ()
+
+        with self.assertRaises (RuntimeError):
+            Database (':memory:').get_partitions ('Test::ETH')
+
+    #
+    # Test conversion of the local time epochs written by older database versions
+    #
+    @unittest.skipUnless (hasattr (time, 'tzset'), 'Time zone cannot be changed')
+    def test_database_time_migration (self):
+
+        timezone = os.environ.get ('TZ')
+
+        try:
+            os.environ['TZ'] = 'Europe/Berlin'
+            time.tzset ()
+
+            with tempfile.TemporaryDirectory () as directory:
+
+                file = os.path.join (directory, 'legacy.db')
+
+                #
+                # Local midnight and 01:00 of 2017-06-01 as stored by former versions
+                #
+                database = Database (file)
+
+                for n, epoch in enumerate ([1496268000, 1496271600]):
+                    database.cursor.execute ('INSERT INTO "Test::ETH" VALUES (?, ?)', (epoch, float (n)))
+
+                database.cursor.execute ('INSERT INTO "Test::Twitter::BTC" VALUES (?, ?)', (1496268000, '["old"]'))
+                database.cursor.execute ('UPDATE "internal::schema" SET value=? WHERE key=?', ('4', 'version'))
+                database.connection.commit ()
+                database.close ()
+
+                for run in range (2):
+
+                    database = Database (file)
+
+                    self.assertEqual ([entry.timestamp for entry in database.get ('Test::ETH')],
+                                      [Timestamp ('2017-06-01 00:00'), Timestamp ('2017-06-01 01:00')])
+                    self.assertEqual (database.get_statistics ('Test::ETH').start, Timestamp ('2017-06-01 00:00'))
+                    self.assertEqual (list (database.get_rollup ('Test::ETH', Interval.day)['timestamp']), [Timestamp ('2017-06-01').epoch ()])
+                    self.assertEqual (database.get_gaps (['Test::ETH'], Timestamp ('2017-06-01 00:00'), Timestamp ('2017-06-01 01:00')), [])
+                    self.assertEqual (list (database.search ('Test::Twitter::BTC', 'old')[0]), [Timestamp ('2017-06-01 00:00').epoch ()])
+
+                    database.close ()
+
+        finally:
+            if timezone is not None:
+                os.environ['TZ'] = timezone
+            else:
+                del os.environ['TZ']
+
+            time.tzset ()
+
+    #
+    # Test incrementally maintained channel statistics
+    #
+    def test_database_statistics (self):
+
+        database = Database (':memory:')
+
+        statistics = database.get_statistics ('Test::ETH')
+        self.assertEqual (statistics.count, 0)
+        self.assertEqual (statistics.start, None)
+
+        database.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour))
+                                    for hour in range (10, 15)])
+
+        statistics = database.get_statistics ('Test::ETH')
+        self.assertEqual (statistics.count, 5)
+        self.assertEqual (statistics.start, Timestamp ('2017-06-18 10:00'))
+        self.assertEqual (statistics.end, Timestamp ('2017-06-18 14:00'))
+        self.assertEqual (statistics.last, 14.0)
+        self.assertEqual (statistics.minimum, 10.0)
+        self.assertEqual (statistics.maximum, 14.0)
+        self.assertAlmostEqual (statistics.mean, 12.0)
+
+        #
+        # Overwrite the minimum and append a new latest value
+        #
+        database.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 10:00'), value=13.0),
+                                    Entry (timestamp=Timestamp ('2017-06-18 16:00'), value=16.0)])
+
+        statistics = database.get_statistics ('Test::ETH')
+        self.assertEqual (statistics.count, 6)
+        self.assertEqual (statistics.end, Timestamp ('2017-06-18 16:00'))
+        self.assertEqual (statistics.last, 16.0)
+        self.assertEqual (statistics.minimum, 11.0)
+        self.assertEqual (statistics.maximum, 16.0)
+        self.assertAlmostEqual (statistics.mean, (13.0 + 11.0 + 12.0 + 13.0 + 14.0 + 16.0) / 6)
+        self.assertEqual (database.count ('Test::ETH'), 6)
+
+        database.add ('Test::Twitter::ETH', Entry (timestamp=Timestamp ('2017-06-18 10:00'), value='["a"]'))
+
+        statistics = database.get_statistics ('Test::Twitter::ETH')
+        self.assertEqual (statistics.count, 1)
+        self.assertEqual (statistics.mean, None)
+
+    #
+    # Test consistent snapshot reads while another connection is writing
+    #
+    def test_database_snapshot (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'snapshot.db')
+
+            writer = Database (file, wal=True)
+            reader = Database (file)
+
+            self.assertEqual (writer.cursor.execute ('PRAGMA journal_mode').fetchone ()[0], 'wal')
+
+            writer.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=1.0))
+
+            with reader.snapshot ():
+                self.assertEqual (len (reader.get ('Test::ETH')), 1)
+
+                writer.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 13:00'), value=2.0))
+
+                self.assertEqual (len (reader.get ('Test::ETH')), 1)
+                self.assertEqual (reader.get_statistics ('Test::ETH').count, 1)
+
+                with self.assertRaises (RuntimeError):
+                    reader.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 14:00'), value=3.0))
+
+            self.assertEqual (len (reader.get ('Test::ETH')), 2)
+
+            reader.close ()
+            writer.close ()
+
+    #
+    # Test online backup while another connection is writing
+    #
+    def test_database_backup (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'backup.db')
+
+            writer = Database (file, wal=True)
+            writer.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=float (hour))
+                                      for hour in range (10, 20)])
+            writer.add ('Test::Twitter::ETH', Entry (timestamp=Timestamp ('2017-06-18 12:00'), value='x' * 100000))
+
+            #
+            # Writes in between the backup steps are neither blocked nor part of the backup
+            #
+            steps = []
+
+            def progress (remaining, total):
+                steps.append (remaining)
+                writer.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-19 {0}:00'.format (len (steps))), value=1.0))
+
+            writer.backup (os.path.join (directory, 'copy.db'), pages=4, delay=0.0, progress=progress)
+
+            self.assertGreater (len (steps), 1)
+            self.assertEqual (steps[-1], 0)
+            self.assertEqual (writer.count ('Test::ETH'), 10 + len (steps))
+
+            backup = Database (os.path.join (directory, 'copy.db'))
+            self.assertEqual ([entry.value for entry in backup.get ('Test::ETH')], [float (hour) for hour in range (10, 20)])
+            self.assertEqual (backup.get_statistics ('Test::ETH').count, 10)
+            self.assertEqual (len (backup.get ('Test::Twitter::ETH')[0].value), 100000)
+            backup.close ()
+
+            #
+            # Compressed backup
+            #
+            writer.backup (os.path.join (directory, 'copy.db.gz'), compress=True)
+
+            with gzip.open (os.path.join (directory, 'copy.db.gz'), 'rb') as input, \
+                 open (os.path.join (directory, 'restored.db'), 'wb') as output:
+                shutil.copyfileobj (input, output)
+
+            backup = Database (os.path.join (directory, 'restored.db'))
+            self.assertEqual (backup.count ('Test::ETH'), 10 + len (steps))
+            backup.close ()
+
+            writer.close ()
+
+    #
+    # Test the coverage bitmaps of the sampling slots
+    #
+    def test_database_coverage (self):
+
+        with tempfile.TemporaryDirectory () as directory:
+
+            file = os.path.join (directory, 'coverage.db')
+            database = Database (file)
+
+            database.add ('Test::ETH', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=1.0)
+                                        for hour in [10, 11, 12, 15, 16]])
+            database.add ('Test::BTC', [Entry (timestamp=Timestamp ('2017-06-18 {0}:00'.format (hour)), value=1.0)
+                                        for hour in [11, 12, 13, 14, 15]])
+            database.add ('Test::BTC', Entry (timestamp=Timestamp ('2017-06-18 12:00'), value=2.0))
+
+            timestamps, mask = database.get_coverage (['Test::ETH', 'Test::BTC'])
+
+            self.assertEqual (timestamps[0], Timestamp ('2017-06-18 10:00').epoch ())
+            self.assertEqual (timestamps[-1], Timestamp ('2017-06-18 16:00').epoch ())
+            self.assertEqual (list (mask[:, 0]), [True, True, True, False, False, True, True])
+            self.assertEqual (list (mask[:, 1]), [False, True, True, True, True, True, False])
+
+            self.assertEqual (database.get_gaps (['Test::ETH', 'Test::BTC'], Timestamp ('2017-06-18 08:00'), Timestamp ('2017-06-18 18:00')),
+                              [(Timestamp ('2017-06-18 08:00'), Timestamp ('2017-06-18 10:00')),
+                               (Timestamp ('2017-06-18 13:00'), Timestamp ('2017-06-18 14:00')),
+                               (Timestamp ('2017-06-18 16:00'), Timestamp ('2017-06-18 18:00'))])
+
+            self.assertEqual (database.get_gaps (['Test::BTC'], Timestamp ('2017-06-18 11:00'), Timestamp ('2017-06-18 15:00')), [])
+
+            #
+            # Slots far apart are kept in separate bitmap blocks
+            #
+            step = Configuration.DATABASE_SAMPLING_STEP * Database.COVERAGE_BLOCK
+            database.add ('Test::ETH', Entry (timestamp=Timestamp ('2017-06-18 10:00') + step, value=1.0))
+
+            timestamps, mask = database.get_coverage (['Test::ETH'], Timestamp ('2017-06-18 16:00'))
+            self.assertEqual (len (timestamps), Database.COVERAGE_BLOCK - 5)
+            self.assertEqual (np.flatnonzero (mask[:, 0]).tolist (), [0, Database.COVERAGE_BLOCK - 6])
+
+            database.close ()
+
+            #
+            # The coverage is recomputed if the sampling step has been changed
+            #
+            database = sqlite3.connect (file)
+            database.execute ('DELETE FROM "{table}"'.format (table=Database.COVERAGE_ID))
+            database.execute ('UPDATE "{table}" SET value=\'0\' WHERE key=\'coverage\''.format (table=Database.SCHEMA_ID))
+            database.commit ()
+            database.close ()
+
+            database = Database (file)
+
+            timestamps, mask = database.get_coverage (['Test::BTC'])
+            self.assertEqual (list (mask[:, 0]), [True, True, True, True, True])
+
+            database.close ()
@@ -71,3 +71,20 @@ class TestEncryption (unittest.TestCase):
 
             self.assertNotEqual (text, decrypted)
             self.assertNotEqual (text, encrypted)
+
+    #
+    # Test if the key is derived only once per password
+    #
+    def test_encryption_key_cache (self):
+
+        encrypt = Encryption ()
+
+        fernet = encrypt.get_fernet ('secret')
+        self.assertIs (encrypt.get_fernet ('secret'), fernet)
+        self.assertIsNot (encrypt.get_fernet ('other'), fernet)
+
+        encrypted = encrypt.encrypt ('text', 'secret')
+
+        encrypt.clear ()
+        self.assertIsNot (encrypt.get_fernet ('secret'), fernet)
+        self.assertEqual (encrypt.decrypt (encrypted, 'secret'), 'text')
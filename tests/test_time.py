@@ -5,13 +5,18 @@
 # Frank Blankenburg, Jun. 2017
 #
 
+import numpy as np
 import unittest
 
 from core.common import Interval
 from core.config import Configuration
 from core.time import Timestamp
+from core.time import TimestampArray
+from core.time import parse
+from core.time import parse_many
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 
 
 #--------------------------------------------------------------------------
@@ -28,7 +33,7 @@ class TestTimestamp (unittest.TestCase):
         #
         s1 = Timestamp ()
         s2 = Timestamp (datetime.utcnow ())
-        s3 = Timestamp (datetime.utcnow ().timestamp ())
+        s3 = Timestamp (datetime.now (timezone.utc).timestamp ())
 
         self.assertEqual (s1, s2)
         self.assertEqual (s1, s3)
@@ -90,3 +95,91 @@ class TestTimestamp (unittest.TestCase):
         self.assertEqual (s, Timestamp ('2017-02-20 00:00'))
         s.advance (step=timedelta (hours=-1))
         self.assertEqual (s, Timestamp ('2017-02-19 23:00'))
+
+    def test_timestamp_epoch (self):
+
+        #
+        # Timestamps are floored to the sampling interval
+        #
+        s = Timestamp (1492783200 + 59 * 60)
+        self.assertEqual (s.epoch (), 1492783200)
+        self.assertEqual (s, Timestamp ('2017-04-21 14:00'))
+        self.assertEqual (s.timestamp, datetime (2017, 4, 21, 14, 0))
+        self.assertEqual (Timestamp ('2017-04-21 16:30+02:00'), s)
+
+        c = s.copy ()
+        c.advance (hours=+1)
+        self.assertEqual (s.epoch (), 1492783200)
+        self.assertEqual (c - s, timedelta (hours=1))
+        self.assertEqual (s + timedelta (minutes=90), c)
+
+        self.assertEqual (len (set ([s, Timestamp (s), c, c.copy ()])), 2)
+        self.assertNotEqual (s, None)
+
+    def test_timestamp_array (self):
+
+        step = timedelta (hours=1)
+
+        grid = TimestampArray.range (Timestamp ('2017-04-21 10:00'), Timestamp ('2017-04-21 15:00'), step)
+        self.assertEqual (len (grid), 6)
+        self.assertEqual (grid[0], Timestamp ('2017-04-21 10:00'))
+        self.assertEqual (grid[-1], Timestamp ('2017-04-21 15:00'))
+
+        present = TimestampArray ([Timestamp ('2017-04-21 12:00'), Timestamp ('2017-04-21 10:00'), Timestamp ('2017-04-21 11:00'),
+                                   Timestamp ('2017-04-21 14:00'), Timestamp ('2017-04-21 10:00')])
+        self.assertEqual (len (present), 4)
+        self.assertEqual (list (present)[:2], [Timestamp ('2017-04-21 10:00'), Timestamp ('2017-04-21 11:00')])
+
+        self.assertTrue (Timestamp ('2017-04-21 14:00') in present)
+        self.assertFalse (Timestamp ('2017-04-21 13:00') in present)
+        self.assertEqual (list (present.contains (grid)), [True, True, True, False, True, False])
+
+        missing = grid.difference (present)
+        self.assertEqual (list (missing), [Timestamp ('2017-04-21 13:00'), Timestamp ('2017-04-21 15:00')])
+        self.assertEqual (grid.intersection (present), present)
+        self.assertEqual (missing.union (present), grid)
+
+        self.assertEqual (present.runs (step), [(Timestamp ('2017-04-21 10:00'), Timestamp ('2017-04-21 12:00')),
+                                                (Timestamp ('2017-04-21 14:00'), Timestamp ('2017-04-21 14:00'))])
+        self.assertEqual (TimestampArray ().runs (step), [])
+
+        #
+        # Flooring and datetime64 conversion
+        #
+        samples = TimestampArray (np.array (['2017-04-21T10:15', '2017-04-21T10:45', '2017-04-22T09:00'], dtype='datetime64[m]'))
+        self.assertEqual (samples.floor (Interval.day), TimestampArray ([Timestamp ('2017-04-21 00:00'), Timestamp ('2017-04-22 00:00')]))
+        self.assertEqual (samples.floor (Interval.hour).to_datetime64 ()[0], np.datetime64 ('2017-04-21T10:00'))
+
+    def test_timestamp_parse (self):
+
+        epoch = Timestamp ('2017-04-21 14:00').epoch () + 5
+
+        #
+        # Fast path formats
+        #
+        self.assertEqual (parse ('2017-04-21 14:00:05'), epoch)
+        self.assertEqual (parse ('2017-04-21T14:00:05Z'), epoch)
+        self.assertEqual (parse ('2017-04-21T16:00:05+02:00'), epoch)
+        self.assertEqual (parse ('Fri Apr 21 14:00:05 +0000 2017'), epoch)
+        self.assertEqual (parse ('Fri, 21 Apr 2017 14:00:05 GMT'), epoch)
+        self.assertEqual (parse ('21 Apr 2017 13:00:05 -0100'), epoch)
+        self.assertEqual (parse ('2012-1-1'), Timestamp ('2012-01-01').epoch ())
+
+        #
+        # Other formats are handled by the fallback parser
+        #
+        self.assertEqual (parse ('2017-04-21 14h'), epoch - 5)
+        self.assertEqual (parse ('April 21, 2017 14:00:05'), epoch)
+
+        with self.assertRaises (ValueError):
+            parse ('2017-02-30')
+
+        self.assertEqual (list (parse_many (['2017-04-21 14:00:05', '2017-04-21T14:00:05'])), [epoch, epoch])
+        self.assertEqual (list (parse_many (['2017-04-21T14:00:05Z', 'Fri Apr 21 14:00:05 +0000 2017'])), [epoch, epoch])
+        self.assertEqual (len (parse_many ([])), 0)
+
+        #
+        # Partial dates are completed like by 'parse'
+        #
+        texts = ['2017', '2017-06', '2017-06-18', '2017-06-18 14:00']
+        self.assertEqual (list (parse_many (texts)), [parse (text) for text in texts])